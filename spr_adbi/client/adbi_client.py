@@ -1,22 +1,46 @@
 import json
 import os
+import weakref
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future, wait as wait_futures, \
+    TimeoutError as FutureTimeoutError, FIRST_COMPLETED
 from datetime import datetime
+from fnmatch import fnmatch
+from itertools import islice
+from io import BufferedIOBase
 from logging import getLogger
+from threading import Lock
 from time import time, sleep
-from typing import List, Optional, Union, Iterable, Tuple, Callable
+from typing import List, Optional, Union, Iterable, Tuple, Callable, Iterator, Dict
 from uuid import uuid4
 
+from spr_adbi.client.memo_cache import MemoCache, compute_memo_key, DEFAULT_MEMO_TTL
+from spr_adbi.client.polling import PollingStrategy, FixedPolling, DEFAULT_POLLING_STRATEGY
 from spr_adbi.client.job_event import ADBIJobEventChangeStatus, ADBIJobEventChangeProgress, ADBIJobEvent
-from spr_adbi.common.adbi_io import ADBIIO, ADBIS3IO
+from spr_adbi.common.adbi_io import ADBIIO, ADBIS3IO, DEFAULT_CHUNK_SIZE
+from spr_adbi.common.blob_store import BlobStore
+from spr_adbi.common.caching_io import with_cache
+from spr_adbi.common.inline_input import InlineInput
+from spr_adbi.common.job_state import JobState, is_state_manifest_enabled
+from spr_adbi.common.notification import get_notification_receiver, NotificationReceiver
 from spr_adbi.common_types import ProgressLog
 from spr_adbi.const import ENV_KEY_ADBI_BASE_DIR, PATH_ARGS, PATH_STDIN, PATH_INPUT_FILES, ENV_KEY_SQS_NAME, \
-    PATH_STATUS, PATH_PROGRESS, STATUS_SUCCESS, STATUS_ERROR, PATH_PROGRESS_LOG
+    PATH_STATUS, PATH_PROGRESS, STATUS_SUCCESS, STATUS_ERROR, PATH_PROGRESS_LOG, ENV_KEY_REPLY_TO, \
+    MESSAGE_OPTION_REPLY_TO, ENV_KEY_STATE_MANIFEST, MESSAGE_OPTION_STATE_MANIFEST, ENV_KEY_INLINE_MAX_BYTES, \
+    MESSAGE_OPTION_INLINE, ENV_KEY_BLOB_MIN_BYTES, PATH_BLOBS, PATH_INPUT_REFS, MESSAGE_OPTION_INPUT_REFS, \
+    PATH_MEMO, ENV_KEY_MEMO_TTL, ENV_KEY_MEMO_EXCLUDE_FUNC_IDS, ENV_KEY_CACHE_DIR, ENV_KEY_CACHE_MAX_BYTES, \
+    ENV_KEY_UPLOAD_CONCURRENCY
 from spr_adbi.util.datetime_util import JST
-from spr_adbi.util.s3_util import create_boto3_session_of_assume_role_delayed
+from spr_adbi.util.aws_client_pool import get_client_pool
 
 logger = getLogger(__name__)
 
+SQS_MAX_BATCH_SIZE = 10
+SQS_MAX_BATCH_BYTES = 256 * 1024
+NOTIFICATION_FALLBACK_INTERVAL = 60
+DEFAULT_UPLOAD_CONCURRENCY = 8
+DEFAULT_SUBMIT_CONCURRENCY = 4
+
 
 def create_client(env: dict = None):
     """
@@ -46,7 +70,11 @@ class ADBIClient:
         self.env_base_dir = env_base_dir
         self.options = kwargs
         self.io_client: ADBIIO = None
-        self._aws_session = None
+        self._blob_store: Optional[BlobStore] = None
+        self._memo_cache: Optional[MemoCache] = None
+        self._upload_executor: Optional[ThreadPoolExecutor] = None
+        self._submit_executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = Lock()
 
         if self.env_base_dir.endswith("/"):
             self.env_base_dir = self.env_base_dir[:-1]
@@ -54,7 +82,7 @@ class ADBIClient:
         self._setup()
 
     def request(self, func_id, args: Optional[Union[List, Tuple]] = None, stdin: Optional[Union[bytes, str]] = None,
-                input_info: dict = None, input_file_info: dict = None, max_retry=None):
+                input_info: dict = None, input_file_info: dict = None, max_retry=None, memoize=False):
         """
 
         :param func_id:
@@ -62,64 +90,371 @@ class ADBIClient:
         :param stdin:
         :param input_info: 'input/files' 以下に書き込む key が相対PATH, value がデータ
         :param input_file_info: 'input/files' 以下に書き込む key が相対PATH, value が Local File Path
+            `s3://...` の場合は S3 上でコピーする
         :param max_retry:
+        :param memoize: if True, return the SUCCESS job of the same request without enqueueing.
+            ignored for func_id in ADBI_MEMO_EXCLUDE_FUNC_IDS.
+        :rtype: ADBIJob
+        """
+        self._validate_request(func_id, args, stdin, input_info, input_file_info)
+
+        memo_key = None
+        if memoize and func_id not in self.memo_exclude_func_ids:
+            memo_key = compute_memo_key(func_id, args, stdin, input_info, input_file_info)
+            job = self._lookup_memo(func_id, memo_key)
+            if job is not None:
+                return job
+
+        # use the local io_client, because request() may be called from multiple threads (ex. AsyncADBIClient)
+        process_id, io_client, message = self._prepare_job(func_id, args, stdin, input_info, input_file_info)
+        response = self._send_message(MessageBody=message, MessageGroupId=process_id,
+                                      MessageDeduplicationId=process_id)
+        if memo_key:
+            self.memo_cache.put(func_id, memo_key, io_client.base_dir)
+        self.io_client = io_client
+        return self._create_job(io_client, response.get('MessageId'))
+
+    def request_async(self, func_id, args: Optional[Union[List, Tuple]] = None,
+                      stdin: Optional[Union[bytes, str]] = None, input_info: dict = None, input_file_info: dict = None,
+                      max_retry=None):
+        """same as request(), but return the job immediately and upload input data in background.
+
+        The queue message is sent after all input data are written.
+        Files in input_file_info are read in background, so do not modify them until `job.wait_submitted()`.
+
         :rtype: ADBIJob
         """
+        self._validate_request(func_id, args, stdin, input_info, input_file_info)
+        process_id = self._create_process_id(func_id)
+        io_client = self._create_writer(process_id)
+        job = self._create_job(io_client, None)
+
+        def submit():
+            input_options = self._write_input_data(io_client, args, stdin, input_info, input_file_info)
+            message = self._create_message(func_id, io_client, input_options)
+            response = self._send_message(MessageBody=message, MessageGroupId=process_id,
+                                          MessageDeduplicationId=process_id)
+            job.queue_message_id = response.get('MessageId')
+            return job
+
+        job.submission = self.submit_executor.submit(submit)
+        return job
+
+    def map(self, func_id, iterable: Iterable, max_in_flight=16, ordered=True, max_retry=0, timeout=None,
+            **kwargs):
+        """request a job for each item lazily, keeping at most max_in_flight jobs running.
+
+        :param func_id:
+        :param iterable: each item is kwargs of request() if dict, args if list or tuple, otherwise one argument
+        :param max_in_flight: max number of requested but not yielded items
+        :param ordered: if True, yield results in the order of iterable. otherwise in the order they finish
+        :param max_retry: number of re-requests of an item whose job is not SUCCESS or can not be requested
+        :param timeout: max seconds to wait for the next finished job
+        :param kwargs: kwargs of JobWatcher
+        :rtype: Iterator[spr_adbi.client.job_mapper.MapResult]
+        :raise ADBITimeout:
+        """
+        from spr_adbi.client.job_mapper import map_jobs
+        return map_jobs(self, func_id, iterable, max_in_flight=max_in_flight, ordered=ordered, max_retry=max_retry,
+                        timeout=timeout, **kwargs)
+
+    def pipeline(self):
+        """
+        Usage:
+            pipeline = client.pipeline()
+            prep = pipeline.step('test.prep', input_file_info={'raw.csv': '/path/to/raw.csv'})
+            train = pipeline.step('test.train', input_from={'data.csv': prep.output('data.csv')})
+            jobs = pipeline.submit()
+            jobs[train.name].wait()
+
+        :rtype: spr_adbi.client.pipeline.ADBIPipeline
+        """
+        from spr_adbi.client.pipeline import ADBIPipeline
+        return ADBIPipeline(self)
+
+    def _lookup_memo(self, func_id, memo_key) -> Optional['ADBIJob']:
+        base_dir = self.memo_cache.lookup(func_id, memo_key)
+        if base_dir is None:
+            return None
+        io_client = self._with_cache(ADBIS3IO(base_dir, region_name=self.options.get('AWS_REGION')))
+        job = ADBIJob(base_dir, io_client, state_manifest=self.state_manifest)
+        if job.get_status() != STATUS_SUCCESS:
+            logger.info(f"memoized job is not success: {base_dir}")
+            return None
+        logger.info(f"memo hit: {func_id} {base_dir}")
+        return job
+
+    def request_many(self, requests: Iterable[dict], max_workers=8):
+        """
+
+        :param requests: kwargs of `request()` for each job.
+            ex) [dict(func_id='test.echo', args=['hello']), dict(func_id='test.echo', stdin='world')]
+        :param max_workers: number of threads which upload input data
+        :rtype: List[ADBIJob]
+        :raise ADBIRequestError: when some of jobs are not requested.
+            `jobs` and `errors` of the exception are indexed same as `requests`.
+        """
+        requests = list(requests)
+        for req in requests:
+            self._validate_request(**req)
+
+        jobs: List[Optional[ADBIJob]] = [None] * len(requests)
+        errors = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._prepare_job, **req) for req in requests]
+            prepared = []
+            for idx, future in enumerate(futures):
+                try:
+                    prepared.append((idx, future.result()))
+                except Exception as e:
+                    logger.warning(f"fail to write input data of request[{idx}]: {e}")
+                    errors[idx] = f"fail to write input data: {e}"
+
+        for chunk in self._split_batches(prepared):
+            entries = [dict(Id=str(idx), MessageBody=message, MessageGroupId=process_id,
+                            MessageDeduplicationId=process_id)
+                       for idx, (process_id, io_client, message) in chunk.items()]
+            try:
+                response = self._send_message_batch(entries)
+            except Exception as e:
+                logger.warning(f"fail to send messages: {e}")
+                for idx in chunk:
+                    errors[idx] = f"fail to send message: {e}"
+                continue
+
+            for result in response.get('Successful') or []:
+                idx = int(result['Id'])
+                jobs[idx] = self._create_job(chunk[idx][1], result.get('MessageId'))
+            for result in response.get('Failed') or []:
+                idx = int(result['Id'])
+                errors[idx] = f"fail to send message: {result.get('Code')} {result.get('Message')}"
+
+        if errors:
+            raise ADBIRequestError(jobs, errors)
+        return jobs
+
+    @staticmethod
+    def _split_batches(prepared: list) -> Iterable[dict]:
+        """split into chunks which send_message_batch can send at once"""
+        chunk, chunk_bytes = {}, 0
+        for idx, (process_id, io_client, message) in prepared:
+            message_bytes = len(message.encode())
+            if chunk and (len(chunk) >= SQS_MAX_BATCH_SIZE or chunk_bytes + message_bytes > SQS_MAX_BATCH_BYTES):
+                yield chunk
+                chunk, chunk_bytes = {}, 0
+            chunk[idx] = (process_id, io_client, message)
+            chunk_bytes += message_bytes
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _validate_request(func_id, args=None, stdin=None, input_info=None, input_file_info=None, max_retry=None):
         assert isinstance(func_id, str)
         assert args is None or isinstance(args, (list, tuple))
         assert stdin is None or isinstance(stdin, (bytes, str))
         assert input_info is None or isinstance(input_info, dict)
         assert input_file_info is None or isinstance(input_file_info, dict)
 
-        process_id = self._create_process_id(func_id)
-        self._prepare_writer(process_id)
-        self._write_input_data(args, stdin, input_info, input_file_info)
-        message = json.dumps([func_id, self.io_client.base_dir])
+    def _prepare_job(self, func_id, args=None, stdin=None, input_info=None, input_file_info=None, max_retry=None,
+                     process_id=None, extra_options: dict = None):
+        """upload input data of a job.
 
-        queue = self._prepare_queue_client()
-        response = queue.send_message(MessageBody=message, MessageGroupId=process_id,
-                                      MessageDeduplicationId=process_id)
-        return ADBIJob(base_dir=self.io_client.base_dir,
-                       io_client=self.io_client,
+        :param process_id: default is a new process_id
+        :param extra_options: options of the queue message added to the ones about input data
+        :return: (process_id, io_client, message)
+        """
+        process_id = process_id or self._create_process_id(func_id)
+        io_client = self._create_writer(process_id)
+        input_options = self._write_input_data(io_client, args, stdin, input_info, input_file_info)
+        input_options.update(extra_options or {})
+        return process_id, io_client, self._create_message(func_id, io_client, input_options)
+
+    def _create_message(self, func_id, io_client: ADBIIO, input_options: dict = None) -> str:
+        options = dict(input_options or {})
+        if self.reply_to:
+            options[MESSAGE_OPTION_REPLY_TO] = self.reply_to
+        if self.state_manifest:
+            options[MESSAGE_OPTION_STATE_MANIFEST] = True
+
+        if options:
+            return json.dumps([func_id, io_client.base_dir, options])
+        return json.dumps([func_id, io_client.base_dir])
+
+    def _create_job(self, io_client: ADBIIO, queue_message_id):
+        notification_receiver = None
+        if self.reply_to:
+            notification_receiver = get_notification_receiver(self.reply_to, self.options.get('AWS_REGION'))
+        return ADBIJob(base_dir=io_client.base_dir,
+                       io_client=self._with_cache(io_client),
                        queue_name=self.queue_name,
-                       queue_message_id=response.get('MessageId'))
+                       queue_message_id=queue_message_id,
+                       notification_receiver=notification_receiver,
+                       state_manifest=self.state_manifest)
+
+    def _with_cache(self, io_client: ADBIIO) -> ADBIIO:
+        """cache outputs on the local disk if ADBI_CACHE_DIR is set"""
+        return with_cache(io_client, self.options.get(ENV_KEY_CACHE_DIR), self.options.get(ENV_KEY_CACHE_MAX_BYTES))
 
     def _setup(self):
         pass
 
+    @property
+    def upload_executor(self) -> ThreadPoolExecutor:
+        """threads shared by all requests to upload input data. size is ADBI_UPLOAD_CONCURRENCY (default 8)"""
+        with self._executor_lock:
+            if self._upload_executor is None:
+                max_workers = int(self.options.get(ENV_KEY_UPLOAD_CONCURRENCY) or DEFAULT_UPLOAD_CONCURRENCY)
+                self._upload_executor = ThreadPoolExecutor(max_workers=max_workers,
+                                                           thread_name_prefix="adbi-upload")
+            return self._upload_executor
+
+    @property
+    def submit_executor(self) -> ThreadPoolExecutor:
+        """threads which run request_async()"""
+        with self._executor_lock:
+            if self._submit_executor is None:
+                self._submit_executor = ThreadPoolExecutor(max_workers=DEFAULT_SUBMIT_CONCURRENCY,
+                                                           thread_name_prefix="adbi-submit")
+            return self._submit_executor
+
+    def close(self, wait=True):
+        """shutdown threads. with wait=True, wait for jobs requested by request_async() to be submitted."""
+        with self._executor_lock:
+            executors = [self._submit_executor, self._upload_executor]
+            self._submit_executor = self._upload_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def client_pool(self):
+        return get_client_pool(region_name=self.options.get('AWS_REGION'))
+
     @property
     def aws_session(self):
-        if self._aws_session is None:
-            region_name = self.options.get('AWS_REGION')
-            self._aws_session = create_boto3_session_of_assume_role_delayed(region_name=region_name)
-        return self._aws_session
+        return self.client_pool.session
 
-    def _prepare_queue_client(self):
-        return self.aws_session.resource('sqs').get_queue_by_name(QueueName=self.queue_name)
+    def _send_message(self, **kwargs) -> dict:
+        queue_url = self.client_pool.get_queue_url(self.queue_name)
+        return self.client_pool.sqs().send_message(QueueUrl=queue_url, **kwargs)
+
+    def _send_message_batch(self, entries: List[dict]) -> dict:
+        queue_url = self.client_pool.get_queue_url(self.queue_name)
+        return self.client_pool.sqs().send_message_batch(QueueUrl=queue_url, Entries=entries)
 
     @property
     def queue_name(self):
         return self.options[ENV_KEY_SQS_NAME]
 
+    @property
+    def reply_to(self) -> Optional[str]:
+        """queue to receive status notifications of jobs. each client process should have its own queue."""
+        return self.options.get(ENV_KEY_REPLY_TO)
+
+    @property
+    def state_manifest(self) -> bool:
+        """if True, workers write status and progress into one `state.json`"""
+        return is_state_manifest_enabled(self.options.get(ENV_KEY_STATE_MANIFEST))
+
+    @property
+    def inline_max_bytes(self) -> int:
+        """input data smaller than this is carried in the queue message. 0 means disabled."""
+        return int(self.options.get(ENV_KEY_INLINE_MAX_BYTES) or 0)
+
+    @property
+    def blob_min_bytes(self) -> int:
+        """input files larger than this are stored in the content-addressed BlobStore. 0 means disabled."""
+        return int(self.options.get(ENV_KEY_BLOB_MIN_BYTES) or 0)
+
+    @property
+    def memo_cache(self) -> MemoCache:
+        if self._memo_cache is None:
+            io_client = ADBIS3IO(f"{self.env_base_dir}/{PATH_MEMO}", region_name=self.options.get('AWS_REGION'))
+            self._memo_cache = MemoCache(io_client, ttl=float(self.options.get(ENV_KEY_MEMO_TTL) or DEFAULT_MEMO_TTL))
+        return self._memo_cache
+
+    @property
+    def memo_exclude_func_ids(self) -> List[str]:
+        """func_ids of non-deterministic functions which are never memoized"""
+        return [x.strip() for x in (self.options.get(ENV_KEY_MEMO_EXCLUDE_FUNC_IDS) or "").split(",") if x.strip()]
+
+    @property
+    def blob_store(self) -> BlobStore:
+        if self._blob_store is None:
+            io_client = ADBIS3IO(f"{self.env_base_dir}/{PATH_BLOBS}", region_name=self.options.get('AWS_REGION'))
+            self._blob_store = BlobStore(io_client, job_base_dir=self.env_base_dir)
+        return self._blob_store
+
     def _prepare_writer(self, process_id):
+        self.io_client = self._create_writer(process_id)
+
+    def _create_writer(self, process_id) -> ADBIIO:
         target_dir = f"{self.env_base_dir}/{process_id}"
-        self.io_client = ADBIS3IO(target_dir)
+        return ADBIS3IO(target_dir, region_name=self.options.get('AWS_REGION'))
+
+    def _write_input_data(self, io_client: ADBIIO, args: Iterable[str], stdin, input_file: dict,
+                          input_file_info: dict) -> dict:
+        """upload input data concurrently by upload_executor, and wait for all of them.
 
-    def _write_input_data(self, args: Iterable[str], stdin, input_file: dict, input_file_info: dict):
+        :return: options of the queue message about input data which is not written to io_client
+        """
+        inline = InlineInput(self.inline_max_bytes)
+        futures: List[Future] = []
+        blob_futures: Dict[str, Future] = {}
         if args:
-            self.io_client.write(PATH_ARGS, json.dumps(args, ensure_ascii=False))
+            futures.append(self._write_or_inline(io_client, inline, PATH_ARGS, json.dumps(args, ensure_ascii=False)))
         if stdin:
-            self.io_client.write(PATH_STDIN, stdin)
+            futures.append(self._write_or_inline(io_client, inline, PATH_STDIN, stdin))
 
         if input_file:
             for key, data in input_file.items():
                 if data is not None:
                     assert isinstance(data, (bytes, str))
-                    self.io_client.write(f"{PATH_INPUT_FILES}/{key}", data)
+                    futures.append(self._write_or_inline(io_client, inline, f"{PATH_INPUT_FILES}/{key}", data))
 
         if input_file_info:
             for key, path in input_file_info.items():
-                self.io_client.write_file(f"{PATH_INPUT_FILES}/{key}", path)
+                remote_path = f"{PATH_INPUT_FILES}/{key}"
+                if path.startswith("s3://"):  # copied on server side
+                    futures.append(self.upload_executor.submit(io_client.write_file, remote_path, path))
+                    continue
+                size = os.path.getsize(path)
+                if inline.can_add(remote_path, size):
+                    with open(path, "rb") as f:
+                        inline.add(remote_path, f.read())
+                elif 0 < self.blob_min_bytes <= size:
+                    referrer = io_client.base_dir.rsplit("/", 1)[-1]
+                    blob_futures[remote_path] = self.upload_executor.submit(self.blob_store.put_file, path, referrer)
+                else:
+                    futures.append(self.upload_executor.submit(io_client.write_file, remote_path, path))
+
+        futures = [x for x in futures if x is not None] + list(blob_futures.values())
+        wait_futures(futures)
+        for future in futures:
+            future.result()  # raise the first error
+        input_refs = {remote_path: future.result() for remote_path, future in blob_futures.items()}
+
+        options = {}
+        if inline.data:
+            options[MESSAGE_OPTION_INLINE] = inline.data
+        if input_refs:
+            io_client.write(PATH_INPUT_REFS, json.dumps(input_refs))
+            options[MESSAGE_OPTION_INPUT_REFS] = input_refs
+        return options
+
+    def _write_or_inline(self, io_client: ADBIIO, inline: InlineInput, path,
+                         data: Union[str, bytes]) -> Optional[Future]:
+        if isinstance(data, str):
+            data = data.encode()
+        if not inline.add(path, data):
+            return self.upload_executor.submit(io_client.write, path, data)
 
     @staticmethod
     def _create_process_id(func_id) -> str:
@@ -129,28 +464,63 @@ class ADBIClient:
 
 
 class ADBIJob:
-    def __init__(self, base_dir, io_client, queue_name=None, queue_message_id=None):
+    def __init__(self, base_dir, io_client, queue_name=None, queue_message_id=None,
+                 notification_receiver: NotificationReceiver = None, state_manifest=False,
+                 submission: Future = None):
+        """
+
+        :param submission: future of uploading input data and sending the queue message. see request_async()
+        """
         self.base_dir: str = base_dir
         self.io_client: ADBIIO = io_client
         self.queue_name: Optional[str] = queue_name
         self.queue_message_id: Optional[str] = queue_message_id
+        self.notification_receiver = notification_receiver
+        self.state: Optional[JobState] = JobState(io_client) if state_manifest else None
+        self.submission: Optional[Future] = submission
         self._finished = False
         self._final_status = None
         self._last_status = None
+        self._last_progress = None
+        self._last_checked_time = 0
+        self._emitted_status = None
+        self._emitted_progress = None
+        self._last_eta = None
         self._event_listeners = defaultdict(lambda: [])
+        self.n_polls = 0
+        self.n_storage_reads = 0
+        self.n_notifications = 0
+        self._unregister_notification = None
+        if notification_receiver is not None:
+            notification_receiver.register(base_dir)
+            # also unregistered when this job is garbage collected without finishing
+            self._unregister_notification = weakref.finalize(self, notification_receiver.unregister, base_dir)
 
     def get_status(self) -> Optional[str]:
+        self.n_storage_reads += 1
+        if self._load_state():
+            self._last_status = self.state.status
+            self._last_eta = self.state.data.get('eta')
+            return self._last_status
+
         status = self.io_client.read(PATH_STATUS)
         if status is not None:
             self._last_status = status.decode().strip()
         return self._last_status
 
     def get_progress(self) -> Optional[str]:
+        self.n_storage_reads += 1
+        if self._load_state():
+            return self.state.progress
+
         progress = self.io_client.read(PATH_PROGRESS)
         if progress is not None:
             return progress.decode().strip()
 
     def get_progress_log(self) -> List[ProgressLog]:
+        if self._load_state():
+            return [ProgressLog(log.get('time'), log.get('message')) for log in self.state.progress_log]
+
         ret = []
         progress_log = self.io_client.read(PATH_PROGRESS_LOG)
 
@@ -164,6 +534,38 @@ class ADBIJob:
 
         return ret
 
+    def _load_state(self) -> bool:
+        """load `state.json` by conditional GET.
+
+        :return: False if the job does not use `state.json`, then per-file layout should be read.
+        """
+        if self.state is None:
+            return False
+        self.state.load()
+        return self.state.exists
+
+    @property
+    def last_status(self) -> Optional[str]:
+        return self._last_status
+
+    @property
+    def last_progress(self) -> Optional[str]:
+        return self._last_progress
+
+    @property
+    def eta(self) -> Optional[float]:
+        """unix time when the worker expects to finish. reported by `ADBIWorker.set_progress(eta_seconds=...)`"""
+        return self._last_eta
+
+    @property
+    def poll_metrics(self) -> dict:
+        """
+        - polls: number of poll()
+        - storage_reads: number of reading status or progress from storage
+        - notifications: number of received notifications
+        """
+        return dict(polls=self.n_polls, storage_reads=self.n_storage_reads, notifications=self.n_notifications)
+
     @property
     def s3_uri(self):
         return self.io_client.base_dir
@@ -172,7 +574,7 @@ class ADBIJob:
     def finished(self) -> bool:
         if not self._finished:
             status = self.get_status()
-            logger.info(f"check finished: status={status}")
+            logger.debug(f"check finished: status={status}")
 
             self._finished = status in (STATUS_SUCCESS, STATUS_ERROR)
             if self._finished:
@@ -185,24 +587,121 @@ class ADBIJob:
     def is_error(self) -> bool:
         return self.finished and self._final_status == STATUS_ERROR
 
-    def wait(self, timeout=3600, raise_if_timeout=True, polling_interval=3) -> Optional[bool]:
-        start_time = time()
-        last_status = None
-        last_progress = None
-        while time() - start_time < timeout:
-            if self.finished:
-                return self.is_success()
+    def poll(self) -> bool:
+        """check status and progress once, and emit events if they are changed.
 
-            if self._last_status != last_status:
-                last_status = self._last_status
-                self._emit(ADBIJobEventChangeStatus(self, last_status))
+        When notification_receiver is set, status and progress come from notifications,
+        and S3 is read only every NOTIFICATION_FALLBACK_INTERVAL seconds in case notifications are lost.
 
-            progress = self.get_progress()
-            if progress != last_progress:
-                last_progress = progress
-                self._emit(ADBIJobEventChangeProgress(self, progress))
+        :return: True if the job is finished
+        :raise Exception: error in submitting the job by request_async()
+        """
+        if not self.is_submitted():
+            return False
+
+        self.n_polls += 1
+        if self.notification_receiver is not None:
+            self._receive_notifications(0)
+            if time() - self._last_checked_time < NOTIFICATION_FALLBACK_INTERVAL:
+                return self._emit_changes(self._finished)
+
+        finished = self.finished
+        if not finished:
+            if self.state is not None and self.state.exists:
+                self._last_progress = self.state.progress
+            else:
+                self._last_progress = self.get_progress()
+        self._last_checked_time = time()
+        return self._emit_changes(finished)
+
+    def _emit_changes(self, finished: bool) -> bool:
+        if finished and self._unregister_notification is not None:
+            self._unregister_notification()
+        if self._last_status != self._emitted_status:
+            self._emitted_status = self._last_status
+            self._emit(ADBIJobEventChangeStatus(self, self._emitted_status))
+
+        if not finished and self._last_progress != self._emitted_progress:
+            self._emitted_progress = self._last_progress
+            self._emit(ADBIJobEventChangeProgress(self, self._emitted_progress))
+        return finished
+
+    def _receive_notifications(self, timeout):
+        for message in self.notification_receiver.wait(self.base_dir, timeout):
+            self.n_notifications += 1
+            if message.get('eta') is not None:
+                self._last_eta = message['eta']
+            if message.get('status') is not None:
+                self._last_status = message['status']
+                if self._last_status in (STATUS_SUCCESS, STATUS_ERROR):
+                    self._finished = True
+                    self._final_status = self._last_status
+            if message.get('progress') is not None:
+                self._last_progress = message['progress']
+
+    def is_submitted(self) -> bool:
+        """
+        :raise Exception: error in submitting the job by request_async()
+        """
+        if self.submission is None:
+            return True
+        if not self.submission.done():
+            return False
+        self.submission.result()
+        return True
+
+    def submission_error(self) -> Optional[BaseException]:
+        """error in submitting the job by request_async(). None if not failed (yet)"""
+        if self.submission is None or not self.submission.done():
+            return None
+        return self.submission.exception()
 
-            sleep(polling_interval)
+    def wait_submitted(self, timeout=None):
+        """wait until input data are written and the queue message is sent.
+
+        :raise ADBITimeout:
+        :raise Exception: error in submitting the job by request_async()
+        """
+        if self.submission is not None:
+            try:
+                self.submission.result(timeout)
+            except FutureTimeoutError:
+                raise ADBITimeout()
+
+    def wait(self, timeout=3600, raise_if_timeout=True, polling_interval=None,
+             polling_strategy: PollingStrategy = None) -> Optional[bool]:
+        """
+        :param timeout:
+        :param raise_if_timeout:
+        :param polling_interval: poll at this fixed interval. same as `polling_strategy=FixedPolling(interval)`
+        :param polling_strategy: default is BackoffPolling
+        :return: True if success, False if error, None if timeout and not raise_if_timeout
+        :raise ADBITimeout:
+        """
+        if polling_strategy is None:
+            polling_strategy = FixedPolling(polling_interval) if polling_interval else DEFAULT_POLLING_STRATEGY
+        start_time = time()
+        try:
+            self.wait_submitted(timeout)
+        except ADBITimeout:
+            if raise_if_timeout:
+                raise
+            return None
+
+        n_unchanged = 0
+        while time() - start_time < timeout:
+            last = (self._emitted_status, self._emitted_progress)
+            if self.poll():
+                logger.debug(f"finished {self.s3_uri}: {self.poll_metrics}")
+                return self.is_success()
+            n_unchanged = 0 if last != (self._emitted_status, self._emitted_progress) else n_unchanged + 1
+            remaining = self._last_eta - time() if self._last_eta is not None else None
+            interval = polling_strategy.next_interval(n_unchanged, remaining)
+            interval = max(0.0, min(interval, timeout - (time() - start_time)))
+            if self.notification_receiver is not None:
+                self._receive_notifications(interval)
+            else:
+                sleep(interval)
 
         if raise_if_timeout:
             raise ADBITimeout()
@@ -212,8 +711,16 @@ class ADBIJob:
     def on(self, event_name: str, function: Callable):
         self._event_listeners[event_name].append(function)
 
+    def off(self, event_name: str, function: Callable):
+        """remove the listener added by on(). do nothing if not added"""
+        try:
+            self._event_listeners[event_name].remove(function)
+        except ValueError:
+            pass
+
     def _emit(self, event: ADBIJobEvent):
-        for function in self._event_listeners[event.event_name]:
+        # copy, because listeners may be removed while emitting
+        for function in list(self._event_listeners[event.event_name]):
             try:
                 function(event)
             except Exception as e:
@@ -231,6 +738,19 @@ class ADBITimeout(Exception):
     pass
 
 
+class ADBIRequestError(Exception):
+    def __init__(self, jobs: List[Optional[ADBIJob]], errors: dict):
+        """
+
+        :param jobs: requested jobs. None if the job is not requested.
+        :param errors: key is index of the failed job, value is the error message
+        """
+        self.jobs = jobs
+        self.errors = errors
+        details = "\n\t".join(f"[{idx}] {msg}" for idx, msg in sorted(errors.items()))
+        super().__init__(f"{len(errors)}/{len(jobs)} jobs are not requested:\n\t{details}")
+
+
 class ADBIOutput:
     def __init__(self, io_client: ADBIIO):
         self.io_client = io_client
@@ -238,5 +758,55 @@ class ADBIOutput:
     def get_filenames(self) -> List[str]:
         return self.io_client.get_output_filenames()
 
+    def download_all(self, local_dir, concurrency=8, pattern=None, verify=False) -> List[str]:
+        """download output files to local_dir in parallel.
+
+        :param local_dir: `output/a/b.txt` is downloaded to `{local_dir}/a/b.txt`
+        :param concurrency: number of files downloaded at the same time
+        :param pattern: glob pattern of filenames to download. ex) 'output/*.csv'
+        :param verify: if True, verify checksum of each downloaded file
+        :return: downloaded local paths
+        """
+        return [local_path for _, local_path in self.iter_download(local_dir, concurrency, pattern, verify)]
+
+    def iter_download(self, local_dir, concurrency=8, pattern=None, verify=False) -> Iterator[Tuple[str, str]]:
+        """same as download_all(), but yield (filename, local_path) in the order they are downloaded."""
+        filenames = self.get_filenames()
+        if pattern:
+            filenames = [x for x in filenames if fnmatch(x, pattern)]
+
+        # submit lazily, so that breaking the loop stops downloading the rest
+        pending = iter(filenames)
+        futures = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            def submit_next():
+                for filename in islice(pending, 1):
+                    local_path = os.path.join(local_dir, filename[len("output/"):])
+                    future = executor.submit(self.io_client.download_file, filename, local_path, verify)
+                    futures[future] = (filename, local_path)
+
+            try:
+                for _ in range(concurrency):
+                    submit_next()
+                while futures:
+                    done, _ = wait_futures(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                        submit_next()
+                        yield futures.pop(future)
+            finally:
+                for future in futures:
+                    future.cancel()
+
     def get_file_content(self, filename) -> Optional[bytes]:
         return self.io_client.read(filename)
+
+    def open(self, filename) -> BufferedIOBase:
+        """open output file as seekable file-like object to read large data in constant memory.
+
+        :raise FileNotFoundError:
+        """
+        return self.io_client.open(filename)
+
+    def iter_chunks(self, filename, chunk_size=DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        return self.io_client.iter_chunks(filename, chunk_size)
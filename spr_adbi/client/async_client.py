@@ -0,0 +1,203 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from logging import getLogger
+from time import time
+from typing import List, Optional, Union, Tuple, Iterable, AsyncIterator
+
+from spr_adbi.client.adbi_client import ADBIClient, ADBIJob, ADBIOutput, ADBITimeout, create_client
+from spr_adbi.client.polling import PollingStrategy, FixedPolling, DEFAULT_POLLING_STRATEGY
+from spr_adbi.client.job_event import ADBIJobEvent, ADBIJobEventChangeStatus, ADBIJobEventChangeProgress
+from spr_adbi.common.adbi_io import DEFAULT_CHUNK_SIZE
+
+logger = getLogger(__name__)
+
+DEFAULT_ASYNC_MAX_WORKERS = 32
+
+
+def create_async_client(env: dict = None, max_workers=DEFAULT_ASYNC_MAX_WORKERS):
+    """
+
+    :type env: dict
+    :rtype: AsyncADBIClient
+    """
+    return AsyncADBIClient(create_client(env), max_workers=max_workers)
+
+
+class AsyncADBIClient:
+    """asyncio interface of ADBIClient.
+
+    Blocking S3/SQS calls run on a dedicated executor, and waiting is done by `asyncio.sleep()`,
+    so the event loop is never blocked and threads are not occupied while jobs are running.
+
+    Usage:
+        async with create_async_client() as client:
+            job = await client.request('test.echo', args=['hello'])
+            async for event in job.events():
+                print(event.event_name)
+            content = await job.get_output().get_file_content('output/stdout')
+    """
+
+    def __init__(self, client: ADBIClient, max_workers=DEFAULT_ASYNC_MAX_WORKERS):
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="adbi-async")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        self.client.close()
+        self.executor.shutdown(wait=True)
+
+    async def request(self, func_id, args: Optional[Union[List, Tuple]] = None,
+                      stdin: Optional[Union[bytes, str]] = None, input_info: dict = None, input_file_info: dict = None,
+                      max_retry=None, memoize=False):
+        """same as ADBIClient.request()
+
+        :rtype: AsyncADBIJob
+        """
+        job = await _run(self.executor, self.client.request, func_id, args=args, stdin=stdin, input_info=input_info,
+                         input_file_info=input_file_info, max_retry=max_retry, memoize=memoize)
+        return AsyncADBIJob(job, self.executor)
+
+    async def request_many(self, requests: Iterable[dict], max_workers=8):
+        """same as ADBIClient.request_many()
+
+        :rtype: List[AsyncADBIJob]
+        """
+        jobs = await _run(self.executor, self.client.request_many, requests, max_workers=max_workers)
+        return [AsyncADBIJob(job, self.executor) for job in jobs]
+
+
+class AsyncADBIJob:
+    def __init__(self, job: ADBIJob, executor: ThreadPoolExecutor):
+        self.job = job
+        self.executor = executor
+
+    @property
+    def s3_uri(self):
+        return self.job.s3_uri
+
+    @property
+    def base_dir(self):
+        return self.job.base_dir
+
+    async def get_status(self) -> Optional[str]:
+        return await _run(self.executor, self.job.get_status)
+
+    async def get_progress(self) -> Optional[str]:
+        return await _run(self.executor, self.job.get_progress)
+
+    async def get_progress_log(self):
+        return await _run(self.executor, self.job.get_progress_log)
+
+    async def poll(self) -> bool:
+        """see ADBIJob.poll()"""
+        return await _run(self.executor, self.job.poll)
+
+    def is_success(self) -> bool:
+        """valid after wait() returns"""
+        return self.job.is_success()
+
+    def is_error(self) -> bool:
+        """valid after wait() returns"""
+        return self.job.is_error()
+
+    async def wait(self, timeout=3600, raise_if_timeout=True, polling_interval=None,
+                   polling_strategy: PollingStrategy = None) -> Optional[bool]:
+        """see ADBIJob.wait()
+
+        :return: True if success, False if error, None if timeout and not raise_if_timeout
+        :raise ADBITimeout:
+        """
+        if polling_strategy is None:
+            polling_strategy = FixedPolling(polling_interval) if polling_interval else DEFAULT_POLLING_STRATEGY
+        start_time = time()
+        n_unchanged = 0
+        while time() - start_time < timeout:
+            last = (self.job.last_status, self.job.last_progress)
+            if await self.poll():
+                return self.job.is_success()
+            n_unchanged = 0 if last != (self.job.last_status, self.job.last_progress) else n_unchanged + 1
+            remaining = self.job.eta - time() if self.job.eta is not None else None
+            interval = polling_strategy.next_interval(n_unchanged, remaining)
+            await asyncio.sleep(max(0.0, min(interval, timeout - (time() - start_time))))
+
+        if raise_if_timeout:
+            raise ADBITimeout()
+        return None
+
+    async def events(self, timeout=None, polling_interval=3) -> AsyncIterator[ADBIJobEvent]:
+        """yield change_status and change_progress events until the job is finished.
+
+        :raise ADBITimeout:
+        """
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def listener(event):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        event_names = [ADBIJobEventChangeStatus.event_name, ADBIJobEventChangeProgress.event_name]
+        for event_name in event_names:
+            self.job.on(event_name, listener)
+        try:
+            start_time = time()
+            finished = False
+            while not finished:
+                if timeout is not None and time() - start_time >= timeout:
+                    raise ADBITimeout()
+                finished = await self.poll()
+                await asyncio.sleep(0)  # run call_soon_threadsafe callbacks
+                while not queue.empty():
+                    yield queue.get_nowait()
+                if not finished:
+                    await asyncio.sleep(polling_interval)
+        finally:
+            for event_name in event_names:
+                self.job.off(event_name, listener)
+
+    def get_output(self):
+        """
+        :rtype: AsyncADBIOutput
+        """
+        return AsyncADBIOutput(self.job.get_output(), self.executor)
+
+
+class AsyncADBIOutput:
+    def __init__(self, output: ADBIOutput, executor: ThreadPoolExecutor):
+        self.output = output
+        self.executor = executor
+
+    async def get_filenames(self) -> List[str]:
+        return await _run(self.executor, self.output.get_filenames)
+
+    async def get_file_content(self, filename) -> Optional[bytes]:
+        return await _run(self.executor, self.output.get_file_content, filename)
+
+    async def download_all(self, local_dir, concurrency=8, pattern=None, verify=False) -> List[str]:
+        return await _run(self.executor, self.output.download_all, local_dir, concurrency, pattern, verify)
+
+    async def iter_chunks(self, filename, chunk_size=DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """
+        :raise FileNotFoundError:
+        """
+        f = await _run(self.executor, self.output.open, filename)
+        try:
+            while True:
+                chunk = await _run(self.executor, f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await _run(self.executor, f.close)
+
+
+async def _run(executor, function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
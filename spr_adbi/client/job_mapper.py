@@ -0,0 +1,90 @@
+from collections import namedtuple
+from logging import getLogger
+from typing import Iterable, Iterator, Optional
+
+from spr_adbi.client.adbi_client import ADBIClient
+from spr_adbi.client.job_watcher import JobWatcher
+from spr_adbi.const import STATUS_SUCCESS
+
+logger = getLogger(__name__)
+
+MapResult = namedtuple("MapResult", "index item job status output error")
+MapResult.__doc__ = """result of an item of ADBIClient.map()
+
+- index: index of the item in the iterable
+- item: the item
+- job: ADBIJob of the last attempt. None if it could not be requested
+- status: final status of the job. None if it could not be requested
+- output: ADBIOutput of the job
+- error: exception in requesting or submitting the job
+"""
+
+
+def map_jobs(client: ADBIClient, func_id: str, iterable: Iterable, max_in_flight=16, ordered=True, max_retry=0,
+             timeout=None, **kwargs) -> Iterator[MapResult]:
+    """see ADBIClient.map()"""
+    assert max_in_flight > 0
+    items = enumerate(iterable)
+    in_flight = {}  # id(job) -> (index, item, retry_idx, job)
+    buffered = {}  # index -> MapResult finished but not yielded yet in ordered mode
+    next_index = 0
+    exhausted = False
+
+    def submit(index, item, retry_idx) -> Optional[MapResult]:
+        """request the item. return MapResult only when it can not be requested"""
+        try:
+            job = client.request(func_id, **_request_kwargs(item))
+        except Exception as e:
+            if retry_idx < max_retry:
+                logger.warning(f"retry to request item[{index}]: {e}")
+                return submit(index, item, retry_idx + 1)
+            logger.warning(f"fail to request item[{index}]: {e}")
+            return MapResult(index, item, None, None, None, e)
+        in_flight[id(job)] = (index, item, retry_idx, job)
+        watcher.add(job)
+
+    with JobWatcher(**kwargs) as watcher:
+        while True:
+            # buffered results also count, so that a slow head item in ordered mode applies backpressure
+            while not exhausted and len(in_flight) + len(buffered) < max_in_flight:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                result = submit(index, item, 0)
+                if result is not None:
+                    buffered[index] = result
+
+            if ordered:
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+            else:
+                for index in list(buffered):
+                    yield buffered.pop(index)
+
+            if not in_flight:
+                if exhausted and not buffered:
+                    return
+                continue
+
+            job = watcher.next_completed(timeout)
+            index, item, retry_idx, job = in_flight.pop(id(job))
+            status = job.get_status()
+            if status != STATUS_SUCCESS and retry_idx < max_retry:
+                logger.info(f"retry item[{index}]: {job.s3_uri} is {status}")
+                result = submit(index, item, retry_idx + 1)
+            else:
+                result = MapResult(index, item, job, status, job.get_output(), job.submission_error())
+            if result is not None:
+                buffered[index] = result
+
+
+def _request_kwargs(item) -> dict:
+    """dict is kwargs of ADBIClient.request(), list or tuple is args, and others are one argument."""
+    if isinstance(item, dict):
+        return dict(item)
+    if isinstance(item, (list, tuple)):
+        return dict(args=list(item))
+    return dict(args=[str(item)])
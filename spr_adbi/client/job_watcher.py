@@ -0,0 +1,217 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+from time import time
+from typing import Iterable, Callable, Iterator, List, Optional
+
+from spr_adbi.client.adbi_client import ADBIJob, ADBITimeout
+from spr_adbi.client.job_event import ADBIJobEvent, ADBIJobEventChangeStatus, ADBIJobEventChangeProgress
+
+logger = getLogger(__name__)
+
+_EVENT_NAMES = (ADBIJobEventChangeStatus.event_name, ADBIJobEventChangeProgress.event_name)
+
+
+def wait_all(jobs: Iterable[ADBIJob], timeout=3600, raise_if_timeout=True, **kwargs) -> List[Optional[bool]]:
+    """wait for all jobs with one polling loop.
+
+    :param jobs:
+    :param timeout:
+    :param raise_if_timeout:
+    :param kwargs: kwargs of JobWatcher
+    :return: result of each job. True: success, False: error or failed to submit, None: timeout
+    """
+    jobs = list(jobs)
+    finished_ids = set()
+    try:
+        for job in as_completed(jobs, timeout=timeout, **kwargs):
+            finished_ids.add(id(job))
+    except ADBITimeout:
+        if raise_if_timeout:
+            raise
+    return [job.is_success() if id(job) in finished_ids else None for job in jobs]
+
+
+def as_completed(jobs: Iterable[ADBIJob], timeout=None, **kwargs) -> Iterator[ADBIJob]:
+    """yield jobs in the order they finish. a job failed to submit by request_async() is yielded as finished.
+
+    :param jobs:
+    :param timeout:
+    :param kwargs: kwargs of JobWatcher
+    :raise ADBITimeout: when some jobs are not finished in timeout seconds
+    """
+    with JobWatcher(jobs, **kwargs) as watcher:
+        yield from watcher.as_completed(timeout=timeout)
+
+
+class JobWatcher:
+    """watch many ADBIJob by one background thread.
+
+    Each job is polled concurrently by `concurrency` threads.
+    The polling interval of a job starts from `min_interval`, grows by `backoff` while nothing changes,
+    and is reset when the status or the progress is changed.
+
+    Usage:
+        with JobWatcher(jobs) as watcher:
+            watcher.on('change_status', lambda e: print(e.job.s3_uri, e.status))
+            for job in watcher.as_completed():
+                ...
+    """
+
+    def __init__(self, jobs: Iterable[ADBIJob] = None, min_interval=1, max_interval=30, backoff=1.5,
+                 concurrency=16):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self._entries: List[_WatchEntry] = []
+        self._finished_queue = Queue()
+        self._n_pending = 0
+        self._listeners = defaultdict(lambda: [])
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+        for job in jobs or []:
+            self.add(job)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add(self, job: ADBIJob):
+        for event_name in _EVENT_NAMES:
+            job.on(event_name, self._emit)
+        with self._lock:
+            self._entries.append(_WatchEntry(job, self.min_interval))
+            self._n_pending += 1
+        self._wakeup.set()
+
+    def on(self, event_name: str, function: Callable):
+        self._listeners[event_name].append(function)
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """stop polling, and remove listeners from jobs not finished"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            entries = list(self._entries)
+        for entry in entries:
+            self._remove_listeners(entry.job)
+
+    def as_completed(self, timeout=None) -> Iterator[ADBIJob]:
+        """yield jobs in the order they finish, until all added jobs are finished.
+
+        :raise ADBITimeout:
+        """
+        deadline = time() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                if self._n_pending == 0 and self._finished_queue.empty():
+                    return
+            wait_time = deadline - time() if deadline is not None else None
+            yield self.next_completed(wait_time)
+
+    def next_completed(self, timeout=None) -> ADBIJob:
+        """wait for the next finished job.
+
+        :raise ADBITimeout:
+        """
+        self.start()
+        if timeout is not None and timeout <= 0:
+            try:
+                return self._finished_queue.get_nowait()
+            except Empty:
+                raise ADBITimeout()
+        try:
+            return self._finished_queue.get(timeout=timeout)
+        except Empty:
+            raise ADBITimeout()
+
+    def wait_all(self, timeout=None):
+        """
+        :raise ADBITimeout:
+        """
+        for _ in self.as_completed(timeout=timeout):
+            pass
+
+    def _emit(self, event: ADBIJobEvent):
+        for function in self._listeners[event.event_name]:
+            try:
+                function(event)
+            except Exception as e:
+                logger.warning(f"exception in JobWatcher handler {e}")
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self._stopped.is_set():
+                now = time()
+                with self._lock:
+                    due = [x for x in self._entries if x.next_time <= now]
+                if due:
+                    for entry, finished in zip(due, executor.map(self._poll, due)):
+                        self._update(entry, finished)
+
+                with self._lock:
+                    next_time = min((x.next_time for x in self._entries), default=None)
+                wait_time = self.max_interval if next_time is None else max(0, next_time - time())
+                self._wakeup.wait(wait_time)
+                self._wakeup.clear()
+
+    @staticmethod
+    def _poll(entry) -> bool:
+        job = entry.job
+        status, progress = job.last_status, job.last_progress
+        try:
+            finished = job.poll()
+        except Exception as e:
+            if job.submission_error() is not None:
+                # the job never finishes, so it is finished as not success
+                logger.warning(f"fail to submit {job.s3_uri}: {e}")
+                return True
+            logger.warning(f"fail to poll {job.s3_uri}: {e}")
+            finished = False
+        entry.changed = (status, progress) != (job.last_status, job.last_progress)
+        return finished
+
+    def _remove_listeners(self, job: ADBIJob):
+        for event_name in _EVENT_NAMES:
+            job.off(event_name, self._emit)
+
+    def _update(self, entry, finished: bool):
+        if finished:
+            self._remove_listeners(entry.job)
+            with self._lock:
+                self._entries.remove(entry)
+                self._n_pending -= 1
+                self._finished_queue.put(entry.job)
+            return
+
+        if entry.changed:
+            entry.interval = self.min_interval
+        else:
+            entry.interval = min(self.max_interval, entry.interval * self.backoff)
+        entry.next_time = time() + entry.interval
+
+
+class _WatchEntry:
+    def __init__(self, job: ADBIJob, interval):
+        self.job = job
+        self.interval = interval
+        self.next_time = 0
+        self.changed = False
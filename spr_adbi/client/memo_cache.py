@@ -0,0 +1,96 @@
+import json
+from hashlib import sha256
+from logging import getLogger
+from time import time
+from typing import Optional
+
+from spr_adbi.common.adbi_io import ADBIIO, create_io_client
+from spr_adbi.common.blob_store import hash_file
+
+logger = getLogger(__name__)
+
+DEFAULT_MEMO_TTL = 7 * 24 * 3600
+
+
+def compute_memo_key(func_id, args=None, stdin=None, input_info: dict = None, input_file_info: dict = None) -> str:
+    """deterministic key of a request. input files are hashed by their content."""
+
+    def hash_data(data):
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode()
+        return sha256(data).hexdigest()
+
+    material = [
+        func_id,
+        list(args) if args else None,
+        hash_data(stdin or None),  # empty stdin is same as no stdin
+        sorted((key, hash_data(data)) for key, data in (input_info or {}).items() if data is not None),
+        sorted((key, hash_input_file(path)) for key, path in (input_file_info or {}).items()),
+    ]
+    return sha256(json.dumps(material, ensure_ascii=False).encode()).hexdigest()
+
+
+def hash_input_file(path: str) -> str:
+    """content hash of a local file, or uri and ETag of `s3://...` not to download it."""
+    if path.startswith("s3://"):
+        base_dir, name = path.rsplit("/", 1)
+        etag = create_io_client(base_dir).get_etag(name)
+        if etag is None:
+            raise FileNotFoundError(path)
+        return f"{path}@{etag}"
+    return hash_file(path)
+
+
+class MemoCache:
+    """index from request key to the job which processed the same request.
+
+    - `{base_dir}/{func_id}/{key}`: `{"base_dir": "s3://.../<process_id>", "time": 1546268400.0}`
+    """
+
+    def __init__(self, io_client: ADBIIO, ttl=DEFAULT_MEMO_TTL):
+        """
+
+        :param io_client: io_client of `{ADBI_BASE_DIR}/memo`
+        :param ttl: entries older than this seconds are ignored and evicted
+        """
+        self.io_client = io_client
+        self.ttl = ttl
+
+    def lookup(self, func_id: str, key: str) -> Optional[str]:
+        """
+        :return: base_dir of the memoized job
+        """
+        data = self.io_client.read(f"{func_id}/{key}")
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data.decode())
+        except ValueError:
+            return None
+        if time() - entry.get('time', 0) > self.ttl:
+            return None
+        return entry.get('base_dir')
+
+    def put(self, func_id: str, key: str, base_dir: str):
+        self.io_client.write(f"{func_id}/{key}", json.dumps(dict(base_dir=base_dir, time=time())))
+
+    def delete(self, func_id: str, key: str):
+        self.io_client.delete(f"{func_id}/{key}")
+
+    def evict(self) -> int:
+        """remove expired entries.
+
+        :return: number of removed entries
+        """
+        removed = 0
+        for filename in self.io_client.get_filenames():
+            if filename.count("/") != 1:  # not `{func_id}/{key}`
+                continue
+            last_modified = self.io_client.get_last_modified(filename)
+            if last_modified is not None and time() - last_modified > self.ttl:
+                logger.info(f"evict memo {filename}")
+                self.io_client.delete(filename)
+                removed += 1
+        return removed
@@ -0,0 +1,131 @@
+import json
+from logging import getLogger
+from typing import List, Dict, Optional, Union, Tuple
+
+from spr_adbi.client.adbi_client import ADBIClient, ADBIJob
+from spr_adbi.const import PATH_PIPELINE, PATH_STATUS, STATUS_WAITING_UPSTREAM, MESSAGE_OPTION_DOWNSTREAM, \
+    PATH_INPUT_FILES
+
+logger = getLogger(__name__)
+
+
+class StepOutput:
+    """reference to an output file of a step"""
+
+    def __init__(self, step, path: str):
+        self.step: PipelineStep = step
+        self.path = path
+
+
+class PipelineStep:
+    def __init__(self, name: str, func_id: str, args=None, stdin=None, input_info: dict = None,
+                 input_file_info: dict = None, input_from: Dict[str, StepOutput] = None, after: list = None):
+        self.name = name
+        self.func_id = func_id
+        self.args = args
+        self.stdin = stdin
+        self.input_info = input_info
+        self.input_file_info = input_file_info
+        self.input_from = input_from or {}
+        self.after: List[PipelineStep] = list(after or [])
+        self.process_id: Optional[str] = None
+
+    def output(self, path: str) -> StepOutput:
+        """
+        :param path: path under `output/` of this step
+        """
+        return StepOutput(self, path)
+
+    @property
+    def upstream(self) -> List['PipelineStep']:
+        ret = []
+        for step in self.after + [x.step for x in self.input_from.values()]:
+            if step not in ret:
+                ret.append(step)
+        return ret
+
+
+class ADBIPipeline:
+    """DAG of jobs. A job is enqueued by the dispatcher when all of its upstream jobs are SUCCESS.
+
+    Steps which have upstream jobs are written with `pipeline.json` and status `WAITING UPSTREAM`,
+    and are not enqueued by the client. `pipeline.json` is like below.
+
+        {
+            "upstream": ["s3://.../<process_id of upstream>", ...],
+            "wiring": {"input/files/data.csv": "s3://.../<process_id of upstream>/output/data.csv"},
+            "process_id": "<process_id>",
+            "message": "<queue message>"
+        }
+
+    When an upstream job is finished, the dispatcher copies the wired outputs on server side and enqueues the message.
+    When an upstream job fails, its downstream jobs are marked as ERROR.
+    The queue message of each job has `downstream` option which lists base_dir of its downstream jobs.
+    """
+
+    def __init__(self, client: ADBIClient):
+        self.client = client
+        self.steps: List[PipelineStep] = []
+
+    def step(self, func_id: str, args: Optional[Union[List, Tuple]] = None, stdin: Optional[Union[bytes, str]] = None,
+             input_info: dict = None, input_file_info: dict = None, input_from: Dict[str, StepOutput] = None,
+             after: List[PipelineStep] = None, name: str = None) -> PipelineStep:
+        """add a step. arguments are same as ADBIClient.request().
+
+        :param input_from: key is path under 'input/files', value is output of an upstream step
+        :param after: upstream steps whose outputs are not used
+        :param name: default is `{func_id}-{index}`
+        """
+        self.client._validate_request(func_id, args, stdin, input_info, input_file_info)
+        for upstream in list(after or []) + [x.step for x in (input_from or {}).values()]:
+            assert upstream in self.steps, f"unknown upstream step: {upstream.name}"
+        name = name or f"{func_id}-{len(self.steps)}"
+        assert name not in [x.name for x in self.steps], f"duplicated step name: {name}"
+        step = PipelineStep(name, func_id, args, stdin, input_info, input_file_info, input_from, after)
+        self.steps.append(step)
+        return step
+
+    def submit(self) -> Dict[str, ADBIJob]:
+        """write input data of all steps, then enqueue the steps which have no upstream.
+
+        :return: jobs by step name
+        """
+        client = self.client
+        for step in self.steps:
+            step.process_id = client._create_process_id(step.func_id)
+        downstream = {step.name: [] for step in self.steps}
+        for step in self.steps:
+            for upstream in step.upstream:
+                downstream[upstream.name].append(self._base_dir(step))
+
+        jobs = {}
+        roots = []
+        # write downstream steps first, so that they are ready when upstream jobs are finished
+        for step in self.steps:
+            extra_options = {MESSAGE_OPTION_DOWNSTREAM: downstream[step.name]} if downstream[step.name] else None
+            process_id, io_client, message = client._prepare_job(
+                step.func_id, step.args, step.stdin, step.input_info, step.input_file_info,
+                process_id=step.process_id, extra_options=extra_options)
+            if not step.upstream:
+                roots.append((step, io_client, message))
+                continue
+
+            pipeline = dict(
+                upstream=[self._base_dir(x) for x in step.upstream],
+                wiring={f"{PATH_INPUT_FILES}/{key}": f"{self._base_dir(x.step)}/output/{x.path}"
+                        for key, x in step.input_from.items()},
+                process_id=process_id,
+                message=message,
+            )
+            io_client.write(PATH_PIPELINE, json.dumps(pipeline, ensure_ascii=False))
+            io_client.write(PATH_STATUS, STATUS_WAITING_UPSTREAM)
+            jobs[step.name] = client._create_job(io_client, None)
+
+        for step, io_client, message in roots:
+            response = client._send_message(MessageBody=message, MessageGroupId=step.process_id,
+                                            MessageDeduplicationId=step.process_id)
+            jobs[step.name] = client._create_job(io_client, response.get('MessageId'))
+        return {step.name: jobs[step.name] for step in self.steps}
+
+    def _base_dir(self, step: PipelineStep) -> str:
+        return f"{self.client.env_base_dir}/{step.process_id}"
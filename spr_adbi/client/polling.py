@@ -0,0 +1,48 @@
+import random
+from typing import Optional
+
+
+class PollingStrategy:
+    """decide how long ADBIJob.wait() sleeps before the next poll."""
+
+    def next_interval(self, n_unchanged: int, remaining: Optional[float] = None) -> float:
+        """
+        :param n_unchanged: number of polls since status or progress changed last. 0 just after a change
+        :param remaining: seconds to the ETA reported by the worker, if any
+        :return: seconds
+        """
+        raise NotImplemented()
+
+
+class FixedPolling(PollingStrategy):
+    def __init__(self, interval=3):
+        self.interval = interval
+
+    def next_interval(self, n_unchanged, remaining=None):
+        return self.interval
+
+
+class BackoffPolling(PollingStrategy):
+    """poll fast at first, then back off exponentially while nothing changes.
+
+    - interval = min(max_interval, initial_interval * factor ** n_unchanged) * (1 ± jitter)
+    - the interval is reset to initial_interval when status or progress is changed
+    - when the worker reports ETA, sleep up to half of the remaining time (but at most max_eta_interval)
+    """
+
+    def __init__(self, initial_interval=0.5, max_interval=30, factor=1.5, jitter=0.2, max_eta_interval=300):
+        assert initial_interval > 0 and factor >= 1 and 0 <= jitter < 1
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.max_eta_interval = max_eta_interval
+
+    def next_interval(self, n_unchanged, remaining=None):
+        interval = min(self.max_interval, self.initial_interval * self.factor ** n_unchanged)
+        if remaining is not None and remaining > 0:
+            interval = max(interval, min(self.max_eta_interval, remaining / 2))
+        return interval * (1 + self.jitter * (2 * random.random() - 1))
+
+
+DEFAULT_POLLING_STRATEGY = BackoffPolling()
@@ -1,18 +1,44 @@
+import fcntl
 import os
 import shutil
-from io import BytesIO
+from io import BytesIO, BufferedIOBase
 from logging import getLogger
+from threading import Lock
 from pathlib import Path
-from typing import Union, Optional, List
+from glob import escape as glob_escape
+from typing import Union, Optional, List, Tuple, Iterator, Iterable
 
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
 from spr_adbi.util import s3_util
 from spr_adbi.util.s3_util import get_s3_client, upload_fileobj_to_s3, upload_file_to_s3, download_as_data_from_s3, \
-    split_bucket_and_key, delete_file_on_s3
+    split_bucket_and_key, delete_file_on_s3, download_as_data_from_s3_if_modified, get_last_modified_on_s3, \
+    open_s3_object, is_not_found_error, S3MultipartWriter, DEFAULT_PART_SIZE, DEFAULT_MAX_CONCURRENCY, \
+    download_from_s3, compute_etag, copy_on_s3, UPLOAD_EXTRA_ARGS, call_with_retry, is_md5_etag, get_s3_transfer_client
+from spr_adbi.const import ENV_KEY_S3_PART_SIZE, ENV_KEY_S3_MAX_CONCURRENCY
 
 logger = getLogger(__name__)
 
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+_local_cas_lock = Lock()
+
+
+class ChecksumMismatchError(IOError):
+    pass
+
+
+def create_io_client(base_dir: str, region_name=None):
+    """
+    :param base_dir: `s3://...` or local directory
+    :rtype: ADBIIO
+    """
+    if base_dir.startswith("s3://"):
+        return ADBIS3IO(base_dir, region_name=region_name)
+    else:
+        return ADBILocalIO(base_dir)
+
 
 class ADBIIO:
     def __init__(self, base_dir):
@@ -31,22 +57,106 @@ class ADBIIO:
         self._write(path, data)
 
     def write_file(self, path, local_path):
-        self._write_file(path, local_path)
+        """
+        :param local_path: local file path, or `s3://...` to copy without passing through this host if possible
+        """
+        if local_path.startswith("s3://"):
+            self._copy_from_s3(path, local_path)
+        else:
+            self._write_file(path, local_path)
+
+    def write_if_match(self, path, data: Union[str, bytes], etag: Optional[str]) -> Optional[str]:
+        """write only when the current etag is `etag` (compare-and-swap).
+
+        :param etag: etag from read_if_modified() or get_etag(). None means that path must not exist
+        :return: new etag, or None if path was modified by others
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        return self._write_if_match(path, data, etag)
 
     def read(self, path) -> Optional[bytes]:
         return self._read(path)
 
+    def open(self, path, mode='rb') -> BufferedIOBase:
+        """open as file-like object to read or write large data in constant memory.
+
+        :param mode: 'rb' or 'wb'
+        :raise FileNotFoundError: when mode is 'rb' and path does not exist
+        """
+        if mode == 'rb':
+            return self._open_reader(path)
+        elif mode == 'wb':
+            return self._open_writer(path)
+        raise ValueError(f"unsupported mode: {mode}")
+
+    def download_file(self, path, local_path, verify=False):
+        """
+        :param verify: if True, verify the checksum of the downloaded file
+        :raise FileNotFoundError:
+        :raise ChecksumMismatchError:
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        self._download_file(path, local_path, verify)
+
+    def iter_chunks(self, path, chunk_size=DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        :raise FileNotFoundError:
+        """
+        with self.open(path) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+    def read_if_modified(self, path, etag: str = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """read data only when its etag is changed from `etag`.
+
+        :return: (data, etag)
+            - (data, new_etag) if modified
+            - (None, etag) if not modified
+            - (None, None) if not found
+        """
+        return self._read_if_modified(path, etag)
+
+    def get_etag(self, path) -> Optional[str]:
+        """
+        :return: identifier of the current content, or None if not found
+        """
+        return self._get_etag(path)
+
     def delete(self, path):
         return self._delete(path)
 
+    def delete_many(self, paths: Iterable[str]):
+        """delete paths with as few requests as possible. not found paths are ignored.
+
+        :raise IOError: when some paths are not deleted
+        """
+        self._delete_many(paths)
+
+    def exists(self, path) -> bool:
+        return self.get_last_modified(path) is not None
+
+    def get_last_modified(self, path) -> Optional[float]:
+        """
+        :return: unix time, or None if not found
+        """
+        return self._get_last_modified(path)
+
     def get_filenames(self) -> List[str]:
-        return self._get_filenames()
+        return list(self.iter_filenames())
+
+    def iter_filenames(self, prefix="") -> Iterator[str]:
+        """yield filenames under the prefix without listing the whole base_dir.
+
+        :param prefix: ex) 'output/'
+        """
+        return self._iter_filenames(prefix)
 
     def get_input_filenames(self) -> List[str]:
-        return [x for x in self.get_filenames() if x.startswith('input/')]
+        return list(self.iter_filenames('input/'))
 
     def get_output_filenames(self) -> List[str]:
-        return [x for x in self.get_filenames() if x.startswith('output/')]
+        return list(self.iter_filenames('output/'))
 
     def _write(self, path, data: bytes):
         raise NotImplemented()
@@ -54,13 +164,41 @@ class ADBIIO:
     def _write_file(self, path, local_path):
         raise NotImplemented()
 
+    def _copy_from_s3(self, path, s3_path):
+        raise NotImplemented()
+
     def _read(self, path) -> bytes:
         raise NotImplemented()
 
+    def _read_if_modified(self, path, etag) -> Tuple[Optional[bytes], Optional[str]]:
+        raise NotImplemented()
+
+    def _write_if_match(self, path, data: bytes, etag: Optional[str]) -> Optional[str]:
+        raise NotImplemented()
+
+    def _open_reader(self, path) -> BufferedIOBase:
+        raise NotImplemented()
+
+    def _open_writer(self, path) -> BufferedIOBase:
+        raise NotImplemented()
+
+    def _download_file(self, path, local_path, verify: bool):
+        raise NotImplemented()
+
+    def _get_etag(self, path) -> Optional[str]:
+        raise NotImplemented()
+
     def _delete(self, path):
         raise NotImplemented()
 
-    def _get_filenames(self) -> List[str]:
+    def _delete_many(self, paths: Iterable[str]):
+        for path in paths:
+            self._delete(path)
+
+    def _get_last_modified(self, path) -> Optional[float]:
+        raise NotImplemented()
+
+    def _iter_filenames(self, prefix: str) -> Iterator[str]:
         raise NotImplemented()
 
 
@@ -71,80 +209,241 @@ class ADBILocalIO(ADBIIO):
     def _write(self, path: str, data: bytes):
         path = f'{self.base_dir}/{path}'
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "wb") as f:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
             f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_if_match(self, path, data, etag):
+        dir_path = os.path.dirname(f'{self.base_dir}/{path}')
+        os.makedirs(dir_path, exist_ok=True)
+        # flock of the directory serializes writers in other processes, and the Lock writers in this process
+        with _local_cas_lock:
+            fd = os.open(dir_path, os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if self._get_etag(path) != etag:
+                    return None
+                self._write(path, data)
+                return self._get_etag(path)
+            finally:
+                os.close(fd)
 
     def _write_file(self, path, local_path):
         path = f'{self.base_dir}/{path}'
         os.makedirs(os.path.dirname(path), exist_ok=True)
         shutil.copy(local_path, path)
 
+    def _copy_from_s3(self, path, s3_path):
+        download_from_s3(get_s3_transfer_client(), s3_path, f'{self.base_dir}/{path}')
+
     def _read(self, path: str) -> Optional[bytes]:
         path = f'{self.base_dir}/{path}'
         if os.path.exists(path):
             with open(path, "rb") as f:
                 return f.read()
 
+    def _open_reader(self, path):
+        return open(f'{self.base_dir}/{path}', "rb")
+
+    def _open_writer(self, path):
+        path = f'{self.base_dir}/{path}'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, "wb")
+
+    def _download_file(self, path, local_path, verify):
+        path = f'{self.base_dir}/{path}'
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        shutil.copy(path, local_path)
+        if verify and os.path.getsize(path) != os.path.getsize(local_path):
+            raise ChecksumMismatchError(f"size mismatch: {path} {local_path}")
+
+    def _read_if_modified(self, path, etag):
+        new_etag = self._get_etag(path)
+        if new_etag is None:
+            return None, None
+        if new_etag == etag:
+            return None, etag
+        return self._read(path), new_etag
+
+    def _get_etag(self, path):
+        try:
+            stat = os.stat(f'{self.base_dir}/{path}')
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
     def _delete(self, path):
         path = f'{self.base_dir}/{path}'
         if os.path.exists(path):
             os.unlink(path)
 
-    def _get_filenames(self):
-        base_dir = Path(f"{self.base_dir}")
-        return [str(x.relative_to(self.base_dir)) for x in base_dir.glob("**/*")]
+    def _get_last_modified(self, path):
+        path = f'{self.base_dir}/{path}'
+        if os.path.exists(path):
+            return os.path.getmtime(path)
+
+    def _iter_filenames(self, prefix):
+        base_dir = Path(self.base_dir)
+        directory, name_prefix = os.path.split(prefix)
+        if not (base_dir / directory).is_dir():
+            return
+        for x in (base_dir / directory).glob(f"{glob_escape(name_prefix)}*"):
+            if x.is_file():
+                yield str(x.relative_to(base_dir))
+            elif x.is_dir():
+                for y in x.glob("**/*"):
+                    if y.is_file():
+                        yield str(y.relative_to(base_dir))
 
 
 class ADBIS3IO(ADBIIO):
+    """
+    Managed transfers (upload_file, download_file, copy) use `transfer_client` whose requests are retried by botocore,
+    so that a failed part does not restart the whole transfer. Other requests are retried by `_with_retry()`.
+    """
     client = None
-
-    def __init__(self, base_uri, region_name=None):
+    transfer_client = None
+    max_retry = 3
+    retry_base_wait = 0.5
+
+    def __init__(self, base_uri, region_name=None, part_size=None, max_concurrency=None):
+        """
+
+        :param base_uri:
+        :param region_name:
+        :param part_size: part size of multipart upload. default is ADBI_S3_PART_SIZE env var or 8MB
+        :param max_concurrency: number of parts uploaded at the same time.
+            default is ADBI_S3_MAX_CONCURRENCY env var or 4
+        """
         self.region_name = region_name or os.environ.get('AWS_REGION')
+        self.part_size = int(part_size or os.environ.get(ENV_KEY_S3_PART_SIZE) or DEFAULT_PART_SIZE)
+        self.max_concurrency = int(max_concurrency or os.environ.get(ENV_KEY_S3_MAX_CONCURRENCY) or
+                                   DEFAULT_MAX_CONCURRENCY)
+        self.transfer_config = TransferConfig(multipart_threshold=self.part_size, multipart_chunksize=self.part_size,
+                                              max_concurrency=self.max_concurrency)
         super().__init__(base_uri)
 
     def _setup(self):
         self.client = get_s3_client(region_name=self.region_name)
+        self.transfer_client = get_s3_transfer_client(region_name=self.region_name)
+
+    def _with_retry(self, function, *args, **kwargs):
+        """call function with exponential backoff, and raise the last exception when all retries fail."""
+        return call_with_retry(function, *args, max_retry=self.max_retry, base_wait=self.retry_base_wait, **kwargs)
 
     def _write(self, path: str, data: bytes):
         path = f'{self.base_dir}/{path}'
-        for _ in range(3):
-            try:
-                with BytesIO(data) as f:
-                    upload_fileobj_to_s3(self.client, f, path)
-                return
-            except Exception as e:
-                logger.warning(e, exc_info=True)
+
+        with BytesIO(data) as f:
+            upload_fileobj_to_s3(self.transfer_client, f, path, self.transfer_config)
+
+    def _write_if_match(self, path, data, etag):
+        bucket_name, key = split_bucket_and_key(f'{self.base_dir}/{path}')
+        # S3 conditional writes: https://docs.aws.amazon.com/AmazonS3/latest/userguide/conditional-writes.html
+        condition = dict(IfMatch=etag) if etag is not None else dict(IfNoneMatch='*')
+        try:
+            response = self._with_retry(self.client.put_object, Bucket=bucket_name, Key=key, Body=data, **condition,
+                                        **UPLOAD_EXTRA_ARGS)
+            return response['ETag']
+        except ClientError as e:
+            code = str(e.response.get('Error', {}).get('Code'))
+            if code in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                return None
+            raise e
 
     def _write_file(self, path, local_path):
         path = f'{self.base_dir}/{path}'
-        for _ in range(3):
-            try:
-                upload_file_to_s3(self.client, local_path, path)
+        upload_file_to_s3(self.transfer_client, local_path, path, self.transfer_config)
+
+    def _copy_from_s3(self, path, s3_path):
+        copy_on_s3(self.transfer_client, s3_path, f'{self.base_dir}/{path}', self.transfer_config)
+
+    def _download_file(self, path, local_path, verify):
+        """download by TransferManager, which uses parallel ranged GET for large objects."""
+        s3_path = f'{self.base_dir}/{path}'
+        try:
+            download_from_s3(self.transfer_client, s3_path, local_path, self.transfer_config)
+        except ClientError as e:
+            if is_not_found_error(e):
+                raise FileNotFoundError(s3_path)
+            raise e
+        if verify:
+            self._verify_etag(s3_path, local_path)
+
+    def _verify_etag(self, s3_path, local_path):
+        bucket_name, key = split_bucket_and_key(s3_path)
+        etag = self._with_retry(self.client.head_object, Bucket=bucket_name, Key=key)['ETag']
+        if not is_md5_etag(etag):
+            logger.warning(f"can not verify {s3_path}: ETag is not MD5 (SSE-KMS or SSE-C)")
+            return
+        if "-" not in etag:
+            local_etag = compute_etag(local_path)
+        else:
+            n_parts = int(etag.strip('"').split("-")[1])
+            if -(-os.path.getsize(local_path) // self.part_size) != n_parts:
+                logger.warning(f"can not verify {s3_path}: uploaded with another part size")
                 return
-            except Exception as e:
-                logger.warning(e, exc_info=True)
+            local_etag = compute_etag(local_path, self.part_size)
+        if local_etag != etag:
+            raise ChecksumMismatchError(f"ETag mismatch: {s3_path}={etag} {local_path}={local_etag}")
+
+    def _open_writer(self, path):
+        return S3MultipartWriter(self.client, f'{self.base_dir}/{path}', part_size=self.part_size,
+                                 max_concurrency=self.max_concurrency, max_retry=self.max_retry,
+                                 retry_base_wait=self.retry_base_wait)
 
     def _read(self, path: str) -> Optional[bytes]:
         path = f'{self.base_dir}/{path}'
         try:
-            return download_as_data_from_s3(self.client, path)
+            return self._with_retry(download_as_data_from_s3, self.client, path)
         except ClientError as e:
-            if str(e.response.get('Error', {}).get('Code')) == '404':
+            if is_not_found_error(e):
+                return None
+            raise e
+
+    def _open_reader(self, path):
+        return open_s3_object(self.client, f'{self.base_dir}/{path}')
+
+    def _read_if_modified(self, path, etag):
+        path = f'{self.base_dir}/{path}'
+        try:
+            return self._with_retry(download_as_data_from_s3_if_modified, self.client, path, etag)
+        except ClientError as e:
+            code = str(e.response.get('Error', {}).get('Code'))
+            if code in ('304', 'NotModified'):
+                return None, etag
+            if is_not_found_error(e):
+                return None, None
+            raise e
+
+    def _get_etag(self, path):
+        bucket_name, key = split_bucket_and_key(f'{self.base_dir}/{path}')
+        try:
+            return self._with_retry(self.client.head_object, Bucket=bucket_name, Key=key)['ETag']
+        except ClientError as e:
+            if is_not_found_error(e):
                 return None
             raise e
 
     def _delete(self, path: str):
         path = f'{self.base_dir}/{path}'
-        delete_file_on_s3(self.client, path)
+        self._with_retry(delete_file_on_s3, self.client, path)
+
+    def _get_last_modified(self, path):
+        return self._with_retry(get_last_modified_on_s3, self.client, f'{self.base_dir}/{path}')
+
+    def _delete_many(self, paths):
+        bucket_name, base_key = split_bucket_and_key(self.base_dir)
+        failed = s3_util.delete_files_on_s3(self.client, bucket_name, (f"{base_key}/{x}" for x in paths))
+        if failed:
+            raise IOError(f"fail to delete {len(failed)} objects: {failed[:10]}")
 
-    def _get_filenames(self):
-        key_list = s3_util.list_paths(self.client, f"{self.base_dir}")
-        ret = []
+    def _iter_filenames(self, prefix):
         _, base_key = split_bucket_and_key(self.base_dir)
         base_key = "/" + base_key
-        for key in key_list:
+        for key in s3_util.iter_paths(self.client, f"{self.base_dir}/{prefix}"):
             if not key.startswith("/"):
                 key = "/" + key
-            relative_key = Path(key).relative_to(base_key)
-            ret.append(str(relative_key))
-        return ret
+            yield str(Path(key).relative_to(base_key))
@@ -0,0 +1,114 @@
+from hashlib import sha256
+from io import BufferedIOBase
+from logging import getLogger
+from time import time
+from typing import Callable, Optional
+
+from spr_adbi.common.adbi_io import ADBIIO, create_io_client
+from spr_adbi.const import PATH_INPUT_REFS
+
+logger = getLogger(__name__)
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def read_blob(blob_uri: str, region_name=None) -> Optional[bytes]:
+    base_dir, name = blob_uri.rsplit("/", 1)
+    return create_io_client(base_dir, region_name=region_name).read(name)
+
+
+def open_blob(blob_uri: str, region_name=None) -> BufferedIOBase:
+    base_dir, name = blob_uri.rsplit("/", 1)
+    return create_io_client(base_dir, region_name=region_name).open(name)
+
+
+def hash_file(local_path) -> str:
+    h = sha256()
+    with open(local_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BlobStore:
+    """content-addressed store of input files shared by jobs.
+
+    - `{base_dir}/sha256/{digest}`: content
+    - `{base_dir}/refs/{digest}/{referrer}`: reference from a job. referrer is process_id of the job.
+
+    A blob is removed by `gc()` when it has no reference.
+    A reference is alive while its job exists, or while the reference itself is younger than `ref_grace_seconds`,
+    because the job writes `input_refs.json` only after all uploads are finished.
+    """
+
+    def __init__(self, io_client: ADBIIO, job_base_dir: str = None):
+        """
+
+        :param io_client: io_client of `{ADBI_BASE_DIR}/blobs`
+        :param job_base_dir: ADBI_BASE_DIR. used to check if referrer jobs still exist.
+        """
+        self.io_client = io_client
+        self.job_base_dir = job_base_dir
+
+    def blob_uri(self, digest: str) -> str:
+        return f"{self.io_client.base_dir}/sha256/{digest}"
+
+    def put_file(self, local_path, referrer: str) -> str:
+        """upload the file if the same content is not stored yet.
+
+        :return: uri of the blob
+        """
+        digest = hash_file(local_path)
+        # reference first, so that gc() does not remove the blob between the existence check and the reference
+        self.io_client.write(f"refs/{digest}/{referrer}", b"")
+        if self.io_client.exists(f"sha256/{digest}"):
+            logger.info(f"skip uploading {local_path}: blob {digest} already exists")
+        else:
+            self.io_client.write_file(f"sha256/{digest}", local_path)
+        return self.blob_uri(digest)
+
+    def release(self, referrer: str, digest: str):
+        self.io_client.delete(f"refs/{digest}/{referrer}")
+
+    def gc(self, is_referrer_alive: Callable[[str], bool] = None, min_age_seconds=3600, ref_grace_seconds=3600) -> int:
+        """remove references from dead jobs, then remove blobs which have no reference.
+
+        :param is_referrer_alive: default is whether `{job_base_dir}/{referrer}/input_refs.json` exists
+        :param min_age_seconds: blobs newer than this are not removed
+        :param ref_grace_seconds: references newer than this are alive. they may be from jobs being submitted
+        :return: number of removed blobs
+        """
+        is_referrer_alive = is_referrer_alive or self._job_exists
+        referenced = set()
+        digests = set()
+        for filename in self.io_client.get_filenames():
+            parts = filename.split("/")
+            if parts[0] == "sha256" and len(parts) == 2:
+                digests.add(parts[1])
+            elif parts[0] == "refs" and len(parts) == 3:
+                _, digest, referrer = parts
+                if self._is_recent(filename, ref_grace_seconds) or is_referrer_alive(referrer):
+                    referenced.add(digest)
+                else:
+                    logger.info(f"release blob {digest} from {referrer}")
+                    self.release(referrer, digest)
+
+        removed = 0
+        for digest in digests - referenced:
+            last_modified = self.io_client.get_last_modified(f"sha256/{digest}")
+            if last_modified is None or time() - last_modified < min_age_seconds:
+                continue
+            if any(True for _ in self.io_client.iter_filenames(f"refs/{digest}/")):
+                continue  # referenced after listing
+            logger.info(f"remove blob {digest}")
+            self.io_client.delete(f"sha256/{digest}")
+            removed += 1
+        return removed
+
+    def _is_recent(self, path: str, seconds) -> bool:
+        last_modified = self.io_client.get_last_modified(path)
+        return last_modified is not None and time() - last_modified < seconds
+
+    def _job_exists(self, referrer: str) -> bool:
+        assert self.job_base_dir, "job_base_dir is required to check referrers"
+        return create_io_client(f"{self.job_base_dir}/{referrer}").exists(PATH_INPUT_REFS)
@@ -0,0 +1,317 @@
+import fcntl
+import os
+import shutil
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import defaultdict
+from hashlib import sha256
+from logging import getLogger
+from threading import Lock
+from time import time
+from typing import Optional, Tuple, List
+from uuid import uuid4
+
+from spr_adbi.common.adbi_io import ADBIIO
+from spr_adbi.const import ENV_KEY_CACHE_DIR, ENV_KEY_CACHE_MAX_BYTES
+
+logger = getLogger(__name__)
+
+DEFAULT_CACHE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+DEFAULT_CACHE_PREFIXES = ("input/", "output/")
+TMP_FILE_MAX_AGE = 3600
+EVICT_INTERVAL = 60
+EVICT_PENDING_RATIO = 0.1
+
+# bytes stored since the last eviction in this process, per cache_dir
+_pending_bytes = defaultdict(int)
+_pending_lock = Lock()
+
+
+def with_cache(io_client: ADBIIO, cache_dir: str = None, max_bytes=None) -> ADBIIO:
+    """wrap io_client by CachingADBIIO when the cache directory is configured.
+
+    :param cache_dir: default is ADBI_CACHE_DIR env var. cache is disabled if empty
+    :param max_bytes: default is ADBI_CACHE_MAX_BYTES env var or 10GB
+    """
+    cache_dir = cache_dir or os.environ.get(ENV_KEY_CACHE_DIR)
+    if not cache_dir:
+        return io_client
+    max_bytes = int(max_bytes or os.environ.get(ENV_KEY_CACHE_MAX_BYTES) or DEFAULT_CACHE_MAX_BYTES)
+    return CachingADBIIO(io_client, cache_dir, max_bytes=max_bytes)
+
+
+class CachingADBIIO(ADBIIO):
+    """read-through cache of another ADBIIO on the local disk.
+
+    - `{cache_dir}/entries/{hash of uri}/{etag}`: content of the uri whose etag is `{etag}`
+    - `{cache_dir}/tmp/`: files being downloaded
+
+    An entry is validated by the etag of the backend on every read, so it is never stale.
+    Entries are immutable and created by `os.replace()`, so processes can share one cache_dir.
+    When the total size exceeds `max_bytes`, least recently used entries are removed.
+    Eviction scans the whole cache, so it runs at most once per `EVICT_INTERVAL` seconds (shared by processes),
+    unless more than `EVICT_PENDING_RATIO` of max_bytes is stored in the meantime.
+    """
+
+    def __init__(self, io_client: ADBIIO, cache_dir: str, max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                 prefixes: Tuple[str, ...] = DEFAULT_CACHE_PREFIXES):
+        """
+
+        :param io_client: backend
+        :param cache_dir:
+        :param max_bytes:
+        :param prefixes: only paths starting with these are cached. status and progress are always read from backend
+        """
+        self.io_client = io_client
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.prefixes = prefixes
+        super().__init__(io_client.base_dir)
+
+    def _setup(self):
+        os.makedirs(f"{self.cache_dir}/entries", exist_ok=True)
+        os.makedirs(f"{self.cache_dir}/tmp", exist_ok=True)
+
+    def _is_cacheable(self, path) -> bool:
+        return path.startswith(self.prefixes)
+
+    def _entry_dir(self, path) -> str:
+        digest = sha256(f"{self.base_dir}/{path}".encode()).hexdigest()
+        return f"{self.cache_dir}/entries/{digest[:2]}/{digest}"
+
+    def _tmp_path(self) -> str:
+        return f"{self.cache_dir}/tmp/{uuid4().hex}"
+
+    @staticmethod
+    def _cached_etag(entry_dir) -> Optional[str]:
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            return None
+        if not names:
+            return None
+        return urlsafe_b64decode(names[0].encode()).decode()
+
+    @staticmethod
+    def _entry_path(entry_dir, etag: str) -> str:
+        return f"{entry_dir}/{urlsafe_b64encode(etag.encode()).decode()}"
+
+    def _read(self, path) -> Optional[bytes]:
+        if not self._is_cacheable(path):
+            return self.io_client.read(path)
+
+        entry_dir = self._entry_dir(path)
+        etag = self._cached_etag(entry_dir)
+        data, new_etag = self.io_client.read_if_modified(path, etag)
+        if new_etag is None:
+            self._invalidate(path)
+            return None
+        if data is None:
+            try:
+                data = self._read_entry(self._entry_path(entry_dir, new_etag))
+                logger.debug(f"cache hit: {self.base_dir}/{path}")
+                return data
+            except FileNotFoundError:  # evicted by other process
+                data, new_etag = self.io_client.read_if_modified(path, None)
+                if new_etag is None:
+                    return None
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        self._store(entry_dir, new_etag, tmp_path)
+        return data
+
+    @staticmethod
+    def _read_entry(entry_path) -> bytes:
+        with open(entry_path, "rb") as f:
+            data = f.read()
+        _touch(entry_path)
+        return data
+
+    def _open_reader(self, path):
+        if not self._is_cacheable(path):
+            return self.io_client.open(path)
+        for _ in range(2):
+            local_path, cached = self._fetch(path)
+            try:
+                f = open(local_path, "rb")
+            except FileNotFoundError:  # evicted by other process
+                continue
+            if not cached:
+                os.unlink(local_path)
+            return f
+        return self.io_client.open(path)
+
+    def _download_file(self, path, local_path, verify):
+        if not self._is_cacheable(path):
+            return self.io_client.download_file(path, local_path, verify)
+        local_cache_path, cached = self._fetch(path, verify)
+        if not cached:
+            shutil.move(local_cache_path, local_path)
+            return
+        try:
+            shutil.copy(local_cache_path, local_path)
+        except FileNotFoundError:  # evicted by other process
+            self.io_client.download_file(path, local_path, verify)
+
+    def _fetch(self, path, verify=False) -> Tuple[str, bool]:
+        """download the content into the cache if not cached.
+
+        :return: (local path, cached). if not cached, the local path is a tmp file which the caller must remove
+        :raise FileNotFoundError:
+        """
+        etag = self.io_client.get_etag(path)
+        if etag is None:
+            self._invalidate(path)
+            raise FileNotFoundError(f"{self.base_dir}/{path}")
+
+        entry_dir = self._entry_dir(path)
+        entry_path = self._entry_path(entry_dir, etag)
+        if os.path.exists(entry_path):
+            logger.debug(f"cache hit: {self.base_dir}/{path}")
+            _touch(entry_path)
+            return entry_path, True
+
+        tmp_path = self._tmp_path()
+        self.io_client.download_file(path, tmp_path, verify)
+        if self.io_client.get_etag(path) != etag:
+            logger.info(f"not cached because modified while downloading: {self.base_dir}/{path}")
+            return tmp_path, False
+        self._store(entry_dir, etag, tmp_path)
+        return entry_path, True
+
+    def _store(self, entry_dir, etag: str, tmp_path):
+        os.makedirs(entry_dir, exist_ok=True)
+        entry_path = self._entry_path(entry_dir, etag)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, entry_path)
+        for name in os.listdir(entry_dir):
+            if f"{entry_dir}/{name}" != entry_path:
+                _unlink(f"{entry_dir}/{name}")
+        self._evict_if_needed(size)
+
+    def _evict_if_needed(self, stored_bytes: int):
+        marker = f"{self.cache_dir}/.evicted"
+        with _pending_lock:
+            _pending_bytes[self.cache_dir] += stored_bytes
+            try:
+                last_evicted = os.path.getmtime(marker)
+            except FileNotFoundError:
+                last_evicted = 0
+            if time() - last_evicted < EVICT_INTERVAL and \
+                    _pending_bytes[self.cache_dir] < self.max_bytes * EVICT_PENDING_RATIO:
+                return
+            _pending_bytes[self.cache_dir] = 0
+        with open(marker, "wb"):
+            pass
+        self.evict()
+
+    def _invalidate(self, path):
+        entry_dir = self._entry_dir(path)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def evict(self) -> int:
+        """remove least recently used entries until the total size is under max_bytes.
+        skipped while another process is evicting.
+
+        :return: number of removed entries
+        """
+        with open(f"{self.cache_dir}/.lock", "wb") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                return self._evict()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict(self) -> int:
+        now = time()
+        for name in os.listdir(f"{self.cache_dir}/tmp"):
+            path = f"{self.cache_dir}/tmp/{name}"
+            try:
+                if now - os.path.getmtime(path) > TMP_FILE_MAX_AGE:
+                    _unlink(path)
+            except FileNotFoundError:
+                pass
+
+        entries: List[Tuple[float, int, str]] = []
+        for dir_path, _, names in os.walk(f"{self.cache_dir}/entries"):
+            for name in names:
+                path = f"{dir_path}/{name}"
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(x[1] for x in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.debug(f"evict cache {path}")
+            _unlink(path)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def _write(self, path, data: bytes):
+        self._invalidate(path)
+        self.io_client.write(path, data)
+
+    def _write_if_match(self, path, data, etag):
+        self._invalidate(path)
+        return self.io_client.write_if_match(path, data, etag)
+
+    def _write_file(self, path, local_path):
+        self._invalidate(path)
+        self.io_client.write_file(path, local_path)
+
+    def _copy_from_s3(self, path, s3_path):
+        self._invalidate(path)
+        self.io_client.write_file(path, s3_path)
+
+    def _open_writer(self, path):
+        self._invalidate(path)
+        return self.io_client.open(path, 'wb')
+
+    def _delete(self, path):
+        self._invalidate(path)
+        return self.io_client.delete(path)
+
+    def _read_if_modified(self, path, etag):
+        return self.io_client.read_if_modified(path, etag)
+
+    def _get_etag(self, path):
+        return self.io_client.get_etag(path)
+
+    def _get_last_modified(self, path):
+        return self.io_client.get_last_modified(path)
+
+    def _delete_many(self, paths):
+        paths = list(paths)
+        for path in paths:
+            self._invalidate(path)
+        self.io_client.delete_many(paths)
+
+    def _iter_filenames(self, prefix):
+        return self.io_client.iter_filenames(prefix)
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,45 @@
+import json
+from base64 import b64encode, b64decode
+from typing import Dict
+
+# SQS message must be less than 256KB and an environment variable of a container must be less than 128KB.
+INLINE_MAX_BYTES_LIMIT = 64 * 1024
+
+
+class InlineInput:
+    """small input data carried in the queue message instead of the storage.
+
+    key is a path relative to storage_dir(ex: `input/args`), value is base64 encoded data.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = min(max_bytes, INLINE_MAX_BYTES_LIMIT)
+        self.data: Dict[str, str] = {}
+        self.size = 0
+
+    def can_add(self, path, data_size: int) -> bool:
+        return self.size + self._encoded_size(path, data_size) <= self.max_bytes
+
+    def add(self, path, data: bytes) -> bool:
+        """
+        :return: False if the data does not fit in max_bytes
+        """
+        if not self.can_add(path, len(data)):
+            return False
+        self.data[path] = b64encode(data).decode()
+        self.size += self._encoded_size(path, len(data))
+        return True
+
+    @staticmethod
+    def _encoded_size(path, data_size: int) -> int:
+        return len(path) + (data_size + 2) // 3 * 4 + 6  # 6 is for `"": "",`
+
+
+def encode_inline_input(data: Dict[str, str]) -> str:
+    return json.dumps(data)
+
+
+def decode_inline_input(value: str) -> Dict[str, bytes]:
+    if not value:
+        return {}
+    return {path: b64decode(encoded) for path, encoded in json.loads(value).items()}
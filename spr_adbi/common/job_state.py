@@ -0,0 +1,124 @@
+import copy
+import json
+from datetime import datetime
+from logging import getLogger
+from time import time
+from typing import Optional, List, Callable
+
+from spr_adbi.common.adbi_io import ADBIIO
+from spr_adbi.const import PATH_STATE, PATH_STATUS
+from spr_adbi.util.datetime_util import JST
+
+logger = getLogger(__name__)
+
+MAX_UPDATE_RETRY = 10
+
+
+def is_state_manifest_enabled(value) -> bool:
+    return str(value or '').lower() in ('1', 'true', 'yes')
+
+
+def read_status(io_client: ADBIIO) -> Optional[str]:
+    """status from `state.json`, or `status` of the legacy layout"""
+    state = JobState(io_client)
+    if state.load() and state.status:
+        return state.status
+    status = io_client.read(PATH_STATUS)
+    if status is not None:
+        return status.decode().strip()
+
+
+class JobState:
+    """status, progress, timestamps and retry info of a job in one `state.json` object.
+
+    The whole document is written by one conditional PUT (If-Match) per transition, and read by conditional GET
+    with ETag. Both the dispatcher and the worker write it, so every update re-reads the latest document first,
+    and is retried when the other side wrote in between.
+
+        {
+            "status": "RUNNING",
+            "progress": "50%",
+            "progress_log": [{"time": 1546268400.0, "message": "50%"}],
+            "runs": [{"retry": 1, "start_time": "2019-01-01T00:00:00+09:00", "end_time": null, "status": null}],
+            "updated_at": 1546268400.0
+        }
+    """
+
+    def __init__(self, io_client: ADBIIO):
+        self.io_client = io_client
+        self.data: dict = {}
+        self.etag: Optional[str] = None
+        self.exists = False
+
+    def load(self) -> bool:
+        """
+        :return: True if state is changed from the last load
+        """
+        data, etag = self.io_client.read_if_modified(PATH_STATE, self.etag)
+        if etag is None:
+            self.data, self.exists = {}, False
+            return False
+        if data is None:
+            return False
+        try:
+            self.data = json.loads(data.decode())
+        except ValueError as e:
+            logger.warning(f"broken {PATH_STATE}: {e}")
+            return False
+        self.etag, self.exists = etag, True
+        return True
+
+    def update(self, **kwargs):
+        self.modify(lambda data: data.update(kwargs))
+
+    def modify(self, function: Callable[[dict], None]):
+        """read-modify-write the latest document.
+
+        :param function: modify the dict in place
+        :raise IOError: when conflicts continue
+        """
+        for _ in range(MAX_UPDATE_RETRY):
+            self.load()
+            data = copy.deepcopy(self.data) if self.exists else {}
+            function(data)
+            data['updated_at'] = time()
+            etag = self.io_client.write_if_match(PATH_STATE, json.dumps(data, ensure_ascii=False),
+                                                 self.etag if self.exists else None)
+            if etag is not None:
+                self.data, self.etag, self.exists = data, etag, True
+                return
+            logger.info(f"{PATH_STATE} is updated by others. retry")
+        raise IOError(f"fail to update {PATH_STATE}: too many conflicts")
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.data.get('status')
+
+    @property
+    def progress(self) -> Optional[str]:
+        return self.data.get('progress')
+
+    @property
+    def progress_log(self) -> List[dict]:
+        return self.data.get('progress_log') or []
+
+    @property
+    def runs(self) -> List[dict]:
+        return self.data.get('runs') or []
+
+    def start_run(self, retry_idx: int, status: str):
+        """reset progress and append the run info with `status`."""
+        run = dict(retry=retry_idx, start_time=datetime.now(tz=JST).isoformat(), end_time=None, status=None)
+
+        def start(data):
+            data.update(status=status, progress=None, progress_log=[], runs=(data.get('runs') or []) + [run])
+
+        self.modify(start)
+
+    def end_run(self):
+        def end(data):
+            runs = data.get('runs') or []
+            if runs:
+                runs[-1].update(end_time=datetime.now(tz=JST).isoformat(), status=data.get('status'))
+
+        self.modify(end)
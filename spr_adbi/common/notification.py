@@ -0,0 +1,225 @@
+import json
+import os
+from collections import defaultdict, deque
+from hashlib import md5
+from logging import getLogger
+from math import ceil
+from queue import Queue, Empty
+from threading import Condition, Lock, Thread
+from time import time, sleep
+from typing import List
+from uuid import uuid4
+
+from spr_adbi.util.aws_client_pool import get_client_pool
+
+logger = getLogger(__name__)
+
+SCHEME_MEMORY = "memory://"
+SCHEME_FILE = "file://"
+SQS_MAX_WAIT_TIME_SECONDS = 20
+MAX_BUFFERED_MESSAGES = 100
+
+
+def create_notification_channel(reply_to: str, region_name=None):
+    """
+    :param reply_to:
+        - `memory://<name>`: in-process queue (for tests)
+        - `file://<directory>`: directory shared by local processes (for tests)
+        - otherwise: SQS queue name
+    :rtype: NotificationChannel
+    """
+    if reply_to.startswith(SCHEME_MEMORY):
+        return MemoryNotificationChannel(reply_to[len(SCHEME_MEMORY):])
+    elif reply_to.startswith(SCHEME_FILE):
+        return FileNotificationChannel(reply_to[len(SCHEME_FILE):])
+    else:
+        return SQSNotificationChannel(reply_to, region_name=region_name)
+
+
+class NotificationChannel:
+    """channel to notify status transitions of jobs.
+
+    message is a dict like `{"base_dir": "s3://...", "status": "RUNNING", "time": 1234567890.0}`
+    or `{"base_dir": "s3://...", "progress": "50%", "time": 1234567890.0}`.
+    """
+
+    def publish(self, message: dict):
+        raise NotImplemented()
+
+    def receive(self, wait_time_seconds: float) -> List[dict]:
+        raise NotImplemented()
+
+    def notify(self, base_dir: str, **kwargs):
+        message = dict(base_dir=base_dir, time=time(), **kwargs)
+        try:
+            self.publish(message)
+        except Exception as e:
+            logger.warning(f"fail to publish notification {message}: {e}")
+
+
+class SQSNotificationChannel(NotificationChannel):
+    def __init__(self, queue_name, region_name=None):
+        self.queue_name = queue_name
+        self.client_pool = get_client_pool(region_name=region_name)
+
+    @property
+    def queue_url(self):
+        return self.client_pool.get_queue_url(self.queue_name)
+
+    def publish(self, message: dict):
+        kwargs = {}
+        if self.queue_name.endswith(".fifo"):
+            kwargs['MessageGroupId'] = md5(message['base_dir'].encode()).hexdigest()
+            kwargs['MessageDeduplicationId'] = uuid4().hex
+        self.client_pool.sqs().send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message), **kwargs)
+
+    def receive(self, wait_time_seconds: float) -> List[dict]:
+        wait_time_seconds = min(SQS_MAX_WAIT_TIME_SECONDS, max(0, ceil(wait_time_seconds)))
+        sqs = self.client_pool.sqs()
+        response = sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10,
+                                       WaitTimeSeconds=wait_time_seconds)
+        messages = response.get('Messages') or []
+        if messages:
+            sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                dict(Id=str(i), ReceiptHandle=m['ReceiptHandle']) for i, m in enumerate(messages)])
+        return [json.loads(m['Body']) for m in messages]
+
+
+class FileNotificationChannel(NotificationChannel):
+    """one message is one json file in the directory."""
+
+    def __init__(self, directory, polling_interval=0.1):
+        self.directory = directory
+        self.polling_interval = polling_interval
+        os.makedirs(self.directory, exist_ok=True)
+
+    def publish(self, message: dict):
+        filename = f"{int(time() * 1e6):020d}-{uuid4().hex}.json"
+        tmp_path = f"{self.directory}/.{filename}"
+        with open(tmp_path, "wt") as f:
+            json.dump(message, f)
+        os.rename(tmp_path, f"{self.directory}/{filename}")
+
+    def receive(self, wait_time_seconds: float) -> List[dict]:
+        deadline = time() + wait_time_seconds
+        while True:
+            ret = []
+            for filename in sorted(x for x in os.listdir(self.directory) if not x.startswith(".")):
+                path = f"{self.directory}/{filename}"
+                try:
+                    with open(path, "rt") as f:
+                        ret.append(json.load(f))
+                    os.unlink(path)
+                except FileNotFoundError:  # received by other process
+                    pass
+            if ret or time() >= deadline:
+                return ret
+            sleep(min(self.polling_interval, max(0.0, deadline - time())))
+
+
+class MemoryNotificationChannel(NotificationChannel):
+    _queues = defaultdict(Queue)
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def queue(self) -> Queue:
+        return self._queues[self.name]
+
+    def publish(self, message: dict):
+        self.queue.put(message)
+
+    def receive(self, wait_time_seconds: float) -> List[dict]:
+        try:
+            if wait_time_seconds > 0:
+                ret = [self.queue.get(timeout=wait_time_seconds)]
+            else:
+                ret = [self.queue.get_nowait()]
+        except Empty:
+            return []
+        while not self.queue.empty():
+            ret.append(self.queue.get_nowait())
+        return ret
+
+
+_receivers = {}
+_receivers_lock = Lock()
+
+
+def get_notification_receiver(reply_to: str, region_name=None):
+    """return NotificationReceiver shared in the process.
+
+    :rtype: NotificationReceiver
+    """
+    with _receivers_lock:
+        if reply_to not in _receivers:
+            _receivers[reply_to] = NotificationReceiver(create_notification_channel(reply_to, region_name))
+        return _receivers[reply_to]
+
+
+class NotificationReceiver:
+    """receive messages from one channel by a background thread and route them to jobs by `base_dir`.
+
+    Only messages of registered jobs are kept, and at most `MAX_BUFFERED_MESSAGES` latest ones per job,
+    so that a long-lived client does not accumulate messages of jobs nobody waits for.
+    Dropped messages are not fatal because ADBIJob also reads the storage periodically.
+    """
+
+    def __init__(self, channel: NotificationChannel, wait_time_seconds=SQS_MAX_WAIT_TIME_SECONDS):
+        self.channel = channel
+        self.wait_time_seconds = wait_time_seconds
+        self._buffers = {}
+        self._registered = defaultdict(int)  # base_dir -> number of registrations
+        self._cond = Condition()
+        self._thread = None
+
+    def register(self, base_dir: str):
+        """start keeping messages of the job"""
+        with self._cond:
+            self._registered[base_dir] += 1
+
+    def unregister(self, base_dir: str):
+        with self._cond:
+            self._registered[base_dir] -= 1
+            if self._registered[base_dir] <= 0:
+                del self._registered[base_dir]
+                self._buffers.pop(base_dir, None)
+
+    def wait(self, base_dir: str, timeout: float) -> List[dict]:
+        """wait for messages of the job.
+
+        :param base_dir: base_dir of the job
+        :param timeout: 0 means returning only already received messages
+        :return: messages in received order. empty if timeout
+        """
+        self._start()
+        with self._cond:
+            self._cond.wait_for(lambda: base_dir in self._buffers, timeout)
+            return list(self._buffers.pop(base_dir, []))
+
+    def _start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                messages = self.channel.receive(self.wait_time_seconds)
+            except Exception as e:
+                logger.warning(f"fail to receive notifications: {e}")
+                sleep(1)
+                continue
+
+            if messages:
+                with self._cond:
+                    for message in messages:
+                        base_dir = message.get('base_dir')
+                        if base_dir not in self._registered:
+                            continue
+                        if base_dir not in self._buffers:
+                            self._buffers[base_dir] = deque(maxlen=MAX_BUFFERED_MESSAGES)
+                        self._buffers[base_dir].append(message)
+                    self._cond.notify_all()
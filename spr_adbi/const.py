@@ -1,3 +1,4 @@
+STATUS_WAITING_UPSTREAM = 'WAITING UPSTREAM'
 STATUS_WILL_DEQUEUE = 'WILL DEQUEUE'
 STATUS_DEQUEUED = 'DEQUEUED'
 STATUS_RUNNING = 'RUNNING'
@@ -10,8 +11,37 @@ PATH_INPUT_FILES = "input/files"
 PATH_STATUS = "status"
 PATH_PROGRESS = "progress"
 PATH_PROGRESS_LOG = "progress_log"
+PATH_STATE = "state.json"
+PATH_INPUT_REFS = "input_refs.json"
+PATH_BLOBS = "blobs"
+PATH_MEMO = "memo"
+PATH_PIPELINE = "pipeline.json"
 
 ENV_KEY_ADBI_BASE_DIR = 'ADBI_BASE_DIR'
 ENV_KEY_SQS_NAME = 'ADBI_SQS_NAME'
 ENV_KEY_MAX_WORKER = 'ADBI_MAX_WORKER'
 ENV_KEY_ECR_ACCOUNT_IDS = 'ADBI_ECR_ACCOUNT_IDS'
+ENV_KEY_REPLY_TO = 'ADBI_REPLY_TO'
+ENV_KEY_STATE_MANIFEST = 'ADBI_STATE_MANIFEST'
+ENV_KEY_INLINE_MAX_BYTES = 'ADBI_INLINE_MAX_BYTES'
+ENV_KEY_INLINE_INPUT = 'ADBI_INLINE_INPUT'
+ENV_KEY_BLOB_MIN_BYTES = 'ADBI_BLOB_MIN_BYTES'
+ENV_KEY_INPUT_REFS = 'ADBI_INPUT_REFS'
+ENV_KEY_S3_PART_SIZE = 'ADBI_S3_PART_SIZE'
+ENV_KEY_S3_MAX_CONCURRENCY = 'ADBI_S3_MAX_CONCURRENCY'
+ENV_KEY_MEMO_TTL = 'ADBI_MEMO_TTL'
+ENV_KEY_MEMO_EXCLUDE_FUNC_IDS = 'ADBI_MEMO_EXCLUDE_FUNC_IDS'
+ENV_KEY_CACHE_DIR = 'ADBI_CACHE_DIR'
+ENV_KEY_CACHE_MAX_BYTES = 'ADBI_CACHE_MAX_BYTES'
+ENV_KEY_UPLOAD_CONCURRENCY = 'ADBI_UPLOAD_CONCURRENCY'
+ENV_KEY_SERVE_MAX_JOBS = 'ADBI_SERVE_MAX_JOBS'
+ENV_KEY_SERVE_MAX_RSS = 'ADBI_SERVE_MAX_RSS'
+
+# the worker in serving mode writes this + json result at the end of each job
+SERVE_RESULT_MARKER = '__ADBI_RESULT__ '
+
+MESSAGE_OPTION_REPLY_TO = 'reply_to'
+MESSAGE_OPTION_STATE_MANIFEST = 'state_manifest'
+MESSAGE_OPTION_INLINE = 'inline'
+MESSAGE_OPTION_INPUT_REFS = 'input_refs'
+MESSAGE_OPTION_DOWNSTREAM = 'downstream'
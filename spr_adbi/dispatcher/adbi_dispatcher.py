@@ -1,18 +1,29 @@
 import json
 import os
-from collections import namedtuple
+from collections import namedtuple, deque
 from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
-from time import sleep
-from typing import Callable
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Callable, Optional
 
 from spr_adbi.dispatcher.resolver import WorkerResolver, WorkerInfo
-from spr_adbi.const import ENV_KEY_SQS_NAME, STATUS_WILL_DEQUEUE, STATUS_DEQUEUED, ENV_KEY_MAX_WORKER
+from spr_adbi.const import ENV_KEY_SQS_NAME, STATUS_WILL_DEQUEUE, STATUS_DEQUEUED, ENV_KEY_MAX_WORKER, \
+    MESSAGE_OPTION_DOWNSTREAM
+from spr_adbi.dispatcher.pipeline_coordinator import PipelineCoordinator
+from spr_adbi.dispatcher.scheduler import JobScheduler
 from spr_adbi.dispatcher.worker_manager import WorkerManager
-from spr_adbi.util.s3_util import create_boto3_session_of_assume_role_delayed
+from spr_adbi.util.aws_client_pool import get_client_pool
 
 logger = getLogger(__name__)
-QueueMessage = namedtuple('QueueMessage', 'message func_id s3_uri')
+QueueMessage = namedtuple('QueueMessage', 'message func_id s3_uri options received_time', defaults=(None,))
+
+SQS_MAX_RECEIVE_MESSAGES = 10
+SQS_WAIT_TIME_SECONDS = 20
+SQS_MAX_BATCH_SIZE = 10
+CONTROL_POOL_SIZE = 2
+PREFETCH_VISIBILITY_TIMEOUT = 120
+VISIBILITY_EXTEND_INTERVAL = 30
 
 
 def create_dispatcher(resolver: WorkerResolver, manager_factory, env: dict = None):
@@ -34,21 +45,35 @@ class ADBIDispatcher:
         self.env = env
         self.manager_factory = manager_factory
         self.resolver = resolver
-        self._aws_session = None
         self._queue = None
-        self.thread_pool = ThreadPoolExecutor(max_workers=int(env.get(ENV_KEY_MAX_WORKER, 4)))
+        self._pipeline_coordinator: Optional[PipelineCoordinator] = None
+        self.max_worker = int(env.get(ENV_KEY_MAX_WORKER, 4))
+        self.scheduler = JobScheduler(self.max_worker)
+        # status updates of downstream jobs etc. must not wait for running jobs
+        self.control_pool = ThreadPoolExecutor(max_workers=CONTROL_POOL_SIZE, thread_name_prefix="adbi-control")
+        self._prefetched = deque()  # QueueMessage received but not handled yet
+        self._lock = Lock()
+        self._visibility_thread: Optional[Thread] = None
+
+    @property
+    def pipeline_coordinator(self) -> PipelineCoordinator:
+        if self._pipeline_coordinator is None:
+            self._pipeline_coordinator = PipelineCoordinator(self.queue_name, region_name=self.region_name)
+        return self._pipeline_coordinator
+
+    @property
+    def client_pool(self):
+        return get_client_pool(region_name=self.region_name)
 
     @property
     def aws_session(self):
-        if self._aws_session is None:
-            self._aws_session = create_boto3_session_of_assume_role_delayed()
-        return self._aws_session
+        return self.client_pool.session
 
     @property
     def queue(self):
         if self._queue is None:
-            resource = self.aws_session.resource('sqs', region_name=self.region_name)
-            self._queue = resource.get_queue_by_name(QueueName=self.queue_name)
+            queue_url = self.client_pool.get_queue_url(self.queue_name)
+            self._queue = self.client_pool.resource('sqs').Queue(queue_url)
         return self._queue
 
     @property
@@ -62,9 +87,9 @@ class ADBIDispatcher:
     def watch(self):
         while True:
             try:
-                # thread にする必要はないが、thread poolの空きを保証するためにこうしておく
-                future = self.thread_pool.submit(self.fetch_message)
-                message = future.result()
+                # 空きが出るまで受信しない。待っている job は他の dispatcher が取れるように SQS に残しておく
+                self.scheduler.wait_for_slot()
+                message = self.fetch_message()
                 worker_info = self.resolver.resolve(message.func_id)
 
                 if worker_info:
@@ -77,23 +102,93 @@ class ADBIDispatcher:
                 logger.warning(f"error happen in watch: {e}", stack_info=True)
                 sleep(5)
 
-    def fetch_message(self):
+    @property
+    def free_slots(self) -> int:
+        return self.scheduler.free_slots
+
+    def metrics(self) -> dict:
+        """see JobScheduler.metrics()"""
+        return self.scheduler.metrics()
+
+    def fetch_message(self) -> QueueMessage:
+        """return a prefetched message, or receive up to (free slots) messages by long polling."""
         while True:
-            messages = self.queue.receive_messages()
-            if not messages:
+            with self._lock:
+                if self._prefetched:
+                    return self._prefetched.popleft()
+            self._receive_messages()
+
+    def _receive_messages(self):
+        max_messages = min(SQS_MAX_RECEIVE_MESSAGES, max(1, self.free_slots))
+        messages = self.queue.receive_messages(MaxNumberOfMessages=max_messages, WaitTimeSeconds=SQS_WAIT_TIME_SECONDS,
+                                               VisibilityTimeout=PREFETCH_VISIBILITY_TIMEOUT)
+        for msg in messages:
+            try:
+                message_body = json.loads(msg.body)
+            except ValueError:
+                # delete it, otherwise it comes back and blocks other messages of the batch every time
+                logger.warning(f'illegal message: {msg.body}')
+                msg.delete()
                 continue
-            msg = messages[0]
-            message_body = json.loads(msg.body)
-            if not isinstance(message_body, list) or len(message_body) != 2:
+            if not self._is_valid_message_body(message_body):
                 logger.warning(f'illegal message: {message_body}')
                 msg.delete()
                 continue
-            return QueueMessage(msg, message_body[0], message_body[1])
+            options = message_body[2] if len(message_body) > 2 else {}
+            with self._lock:
+                self._prefetched.append(QueueMessage(msg, message_body[0], message_body[1], options, time()))
+        if messages:
+            self._start_visibility_thread()
+
+    def _start_visibility_thread(self):
+        with self._lock:
+            if self._visibility_thread is None:
+                self._visibility_thread = Thread(target=self._extend_visibility_loop, daemon=True)
+                self._visibility_thread.start()
+
+    def _extend_visibility_loop(self):
+        while True:
+            sleep(VISIBILITY_EXTEND_INTERVAL)
+            try:
+                self.extend_visibility()
+            except Exception as e:
+                logger.warning(f"fail to extend visibility of prefetched messages: {e}")
+
+    def extend_visibility(self):
+        """keep prefetched messages invisible to other dispatchers until they are handled"""
+        with self._lock:
+            receipt_handles = [x.message.receipt_handle for x in self._prefetched]
+        sqs = self.client_pool.sqs()
+        queue_url = self.client_pool.get_queue_url(self.queue_name)
+        for i in range(0, len(receipt_handles), SQS_MAX_BATCH_SIZE):
+            entries = [dict(Id=str(j), ReceiptHandle=handle, VisibilityTimeout=PREFETCH_VISIBILITY_TIMEOUT)
+                       for j, handle in enumerate(receipt_handles[i:i + SQS_MAX_BATCH_SIZE])]
+            response = sqs.change_message_visibility_batch(QueueUrl=queue_url, Entries=entries)
+            for failed in response.get('Failed') or []:
+                logger.warning(f"fail to extend visibility: {failed}")
+
+    @staticmethod
+    def _is_valid_message_body(message_body) -> bool:
+        """message body is `[func_id, s3_uri]` or `[func_id, s3_uri, options]`"""
+        if not isinstance(message_body, list) or len(message_body) not in (2, 3):
+            return False
+        return len(message_body) == 2 or isinstance(message_body[2], dict)
 
     def handle_message(self, message: QueueMessage, worker_info: WorkerInfo):
         logger.info(f"start handling message {message.func_id} {message.s3_uri}")
         manager: WorkerManager = self.manager_factory(worker_info, message.s3_uri)
+        manager.set_job_options(message.options)
         manager.set_status(STATUS_WILL_DEQUEUE)
         message.message.delete()
         manager.set_status(STATUS_DEQUEUED)
-        self.thread_pool.submit(manager.run)
+        return self.scheduler.submit(self.run_worker, manager, message, received_time=message.received_time)
+
+    def run_worker(self, manager: WorkerManager, message: QueueMessage):
+        success = False
+        try:
+            success = bool(manager.run())
+        finally:
+            downstream = message.options.get(MESSAGE_OPTION_DOWNSTREAM)
+            if downstream:
+                self.control_pool.submit(self.pipeline_coordinator.on_finished, message.s3_uri, success, downstream)
+        return success
@@ -1,13 +1,15 @@
 import os
-from encodings.base64_codec import base64_decode
+import re
+import subprocess
 from logging import getLogger
 
-import docker
 from docker import DockerClient
 
+from spr_adbi.dispatcher.container_pool import get_container_pool, split_environment
+from spr_adbi.dispatcher.registry_cache import RegistryCache, get_registry_cache
 from spr_adbi.dispatcher.resolver import WorkerInfo
 from spr_adbi.const import ENV_KEY_ECR_ACCOUNT_IDS
-from spr_adbi.util.s3_util import create_boto3_session_of_assume_role_delayed
+from spr_adbi.util.aws_client_pool import get_client_pool
 
 logger = getLogger(__name__)
 
@@ -46,6 +48,7 @@ class AWSContainerManager(ContainerManager):
     session = None
     ecr_client = None
     docker_client: DockerClient = None
+    registry_cache: RegistryCache = None
 
     def __init__(self, worker_info: WorkerInfo, base_uri: str, region_name=None):
         self.region_name = region_name or os.environ.get("AWS_REGION")
@@ -53,29 +56,19 @@ class AWSContainerManager(ContainerManager):
 
     def setup(self):
         super().setup()
-        self.session = create_boto3_session_of_assume_role_delayed(region_name=self.region_name)
-        self.ecr_client = self.session.client("ecr", region_name=self.region_name)
+        client_pool = get_client_pool(region_name=self.region_name)
+        self.session = client_pool.session
+        self.ecr_client = client_pool.ecr()
+        self.registry_cache = get_registry_cache()
 
     def login_container_registry(self):
-        logger.info("logging in docker registry")
-        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecr.html#ECR.Client.get_authorization_token
         # registry_ids = os.environ.get(ENV_KEY_ECR_ACCOUNT_IDS, "").split(",")
         image_account_id = self.worker_info.image_id.split(".")[0]
-        logger.info(f"account_id: {image_account_id}")
-        response = self.ecr_client.get_authorization_token(registryIds=[image_account_id])
-        token = response.get('authorizationData')[0].get('authorizationToken')
-        id_pass, _ = base64_decode(token.encode())
-        user_name, password = id_pass.decode().split(":")
-
-        # docker.login : https://docker-py.readthedocs.io/en/stable/client.html
-        self.docker_client = docker.from_env()
-        registry_url = 'https://{account}.dkr.ecr.{region_name}.amazonaws.com/'.format(account=image_account_id,
-                                                                                       region_name=self.region_name)
-        self.docker_client.login(username=user_name, password=password, registry=registry_url)
+        self.docker_client = self.registry_cache.docker_client
+        self.registry_cache.login_ecr(self.ecr_client, image_account_id, self.region_name)
 
     def pull_container(self):
-        logger.info(f"pulling docker container {self.worker_info.image_id}")
-        self.docker_client.images.pull(self.worker_info.image_id)
+        self.registry_cache.ensure_image(self.worker_info.image_id)
 
     def run_container(self, runtime_config=None):
         """
@@ -86,6 +79,9 @@ class AWSContainerManager(ContainerManager):
         """
         runtime_config = runtime_config or {}
         commands = self.worker_info.entry_point + [self.base_uri]
+        if self.worker_info.pool_size > 0:
+            return self.run_in_pool(commands, runtime_config)
+
         logger.info(f"run container: {self.worker_info.image_id} {commands} {runtime_config}")
         try:
             ret = self.docker_client.containers.run(self.worker_info.image_id, commands, stdout=True, stderr=True,
@@ -93,3 +89,96 @@ class AWSContainerManager(ContainerManager):
             return True, ret, None
         except Exception as e:
             return False, None, str(e)
+
+    def run_in_pool(self, commands, runtime_config: dict):
+        """run commands in an idle container of the pool. environment is passed to each exec"""
+        container_config, environment = split_environment(runtime_config)
+        pool = get_container_pool(self.worker_info, self.docker_client, container_config)
+        logger.info(f"run in pooled container: {self.worker_info.image_id} {commands}")
+        try:
+            return pool.run(commands, environment=environment)
+        except Exception as e:
+            return False, None, str(e)
+
+
+class LocalProcessContainerManager(ContainerManager):
+    """run entry_point as a subprocess of the dispatcher instead of a docker container.
+
+    Only for trusted functions: the process shares the filesystem, network and credentials of the dispatcher.
+    Memory (`mem_limit`) and CPU time (`cpu_time_limit` seconds) are limited by prlimit on Linux.
+    """
+
+    def run_container(self, runtime_config=None):
+        runtime_config = runtime_config or {}
+        commands = list(self.worker_info.entry_point) + [self.base_uri]
+        logger.info(f"run process: {commands}")
+        try:
+            proc = self.start_process(commands, runtime_config)
+        except Exception as e:
+            return False, None, str(e)
+        timeout = runtime_config.get('timeout')
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            stdout, stderr = proc.communicate()
+            return False, stdout, f"timeout after {timeout} seconds\n{stderr.decode(errors='replace')}"
+        stderr = stderr.decode(errors='replace') or None
+        if proc.returncode != 0:
+            return False, stdout, stderr or f"exit code {proc.returncode}"
+        return True, stdout, stderr
+
+    @classmethod
+    def start_process(cls, commands, runtime_config: dict, stdin=None) -> subprocess.Popen:
+        """start the process and limit its resources.
+
+        limits are set by prlimit(2) after the start, because `preexec_fn` can deadlock
+        when the dispatcher has threads.
+        """
+        proc = subprocess.Popen(commands, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                env=cls._environment(runtime_config.get('environment')),
+                                cwd=runtime_config.get('working_dir'))
+        try:
+            cls._limit_resources(proc.pid, runtime_config)
+        except Exception:
+            proc.kill()
+            proc.wait()
+            raise
+        return proc
+
+    @staticmethod
+    def _environment(environment) -> dict:
+        env = dict(os.environ)
+        if isinstance(environment, dict):
+            env.update({k: str(v) for k, v in environment.items()})
+        elif environment:
+            env.update(x.split("=", 1) for x in environment)
+        return env
+
+    @staticmethod
+    def _limit_resources(pid: int, runtime_config: dict):
+        mem_limit = parse_bytes(runtime_config.get('mem_limit'))
+        cpu_time_limit = runtime_config.get('cpu_time_limit')
+        if not mem_limit and not cpu_time_limit:
+            return
+        try:
+            import resource
+            prlimit = resource.prlimit
+        except (ImportError, AttributeError):
+            logger.warning("resource limits are not supported on this platform")
+            return
+
+        if mem_limit:
+            prlimit(pid, resource.RLIMIT_AS, (mem_limit, mem_limit))
+        if cpu_time_limit:
+            prlimit(pid, resource.RLIMIT_CPU, (int(cpu_time_limit), int(cpu_time_limit)))
+
+
+def parse_bytes(value):
+    """parse docker style size. ex) 1024, "512m", "2g" """
+    if value is None or isinstance(value, int):
+        return value
+    matcher = re.match(r'^(\d+)([bkmg]?)b?$', str(value).strip().lower())
+    if not matcher:
+        raise ValueError(f"invalid size: {value}")
+    return int(matcher.group(1)) * 1024 ** "bkmg".index(matcher.group(2) or "b")
@@ -0,0 +1,188 @@
+import atexit
+import json
+from collections import deque
+from logging import getLogger
+from threading import Lock, Thread
+from typing import Optional
+
+from docker import DockerClient
+
+from spr_adbi.dispatcher.resolver import WorkerInfo
+
+logger = getLogger(__name__)
+
+IDLE_ENTRYPOINT = ["sleep", "infinity"]
+POOL_LABEL = "spr_adbi.pool"
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def get_container_pool(worker_info: WorkerInfo, docker_client: DockerClient, container_config: dict):
+    """return ContainerPool shared by jobs with the same image, entry_point and container config
+
+    :param container_config: kwargs of `docker run` except `environment`
+    :rtype: ContainerPool
+    """
+    key = (worker_info.image_id, tuple(worker_info.entry_point), json.dumps(container_config, sort_keys=True,
+                                                                             default=str))
+    with _pools_lock:
+        if not _pools:
+            atexit.register(close_container_pools)
+        if key not in _pools:
+            _pools[key] = ContainerPool(worker_info, docker_client, container_config)
+        return _pools[key]
+
+
+def close_container_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class WarmContainer:
+    def __init__(self, container):
+        self.container = container
+        self.n_jobs = 0
+
+    def exec(self, commands, environment: dict = None, workdir=None):
+        """
+        :return: (success:bool, stdout, stderr)
+        """
+        self.n_jobs += 1
+        exit_code, (stdout, stderr) = self.container.exec_run(commands, environment=environment, workdir=workdir,
+                                                              demux=True)
+        stderr = stderr.decode(errors='replace') if stderr else None
+        if exit_code != 0:
+            return False, stdout, stderr or f"exit code {exit_code}"
+        return True, stdout, stderr
+
+    def remove(self):
+        try:
+            self.container.remove(force=True)
+        except Exception as e:
+            logger.warning(f"fail to remove container {self.container.id}: {e}")
+
+
+class ContainerPool:
+    """idle containers of a WorkerInfo. jobs run in them by `docker exec` instead of `docker run`.
+
+    - containers are started with `IDLE_ENTRYPOINT` and kept up to `worker_info.pool_size` (idle + busy)
+    - when all containers are busy, a new one is started and removed after the job if the pool is full
+    - a container is removed after `worker_info.max_jobs_per_container` jobs or a failed job
+    """
+
+    def __init__(self, worker_info: WorkerInfo, docker_client: DockerClient, container_config: dict):
+        self.worker_info = worker_info
+        self.docker_client = docker_client
+        self.container_config = container_config
+        self._idle = deque()
+        self._n_starting = 0
+        self._n_busy = 0
+        self._closed = False
+        self._lock = Lock()
+
+    @property
+    def pool_size(self) -> int:
+        return self.worker_info.pool_size
+
+    def run(self, commands, environment: dict = None):
+        """
+        :return: (success:bool, stdout, stderr)
+        """
+        container = self.acquire()
+        success = False
+        try:
+            success, stdout, stderr = container.exec(commands, environment=environment,
+                                                     workdir=self.container_config.get('working_dir'))
+            return success, stdout, stderr
+        finally:
+            self.release(container, success)
+
+    def acquire(self) -> WarmContainer:
+        with self._lock:
+            container = self._idle.popleft() if self._idle else None
+            self._n_busy += 1
+        if container is None:
+            try:
+                container = self._start_container()
+            except Exception:
+                with self._lock:
+                    self._n_busy -= 1
+                raise
+        self.fill()
+        return container
+
+    def release(self, container: WarmContainer, healthy=True):
+        max_jobs = self.worker_info.max_jobs_per_container
+        with self._lock:
+            self._n_busy -= 1
+            keep = healthy and not self._closed and (not max_jobs or container.n_jobs < max_jobs) and \
+                self._n_total() < self.pool_size
+            if keep:
+                self._idle.append(container)
+        if not keep:
+            logger.info(f"recycle container {container.container.id} after {container.n_jobs} jobs")
+            container.remove()
+            self.fill()
+
+    def fill(self):
+        """start containers in background until the pool is full"""
+        with self._lock:
+            n = self.pool_size - self._n_total()
+            if self._closed or n <= 0:
+                return
+            self._n_starting += n
+        for _ in range(n):
+            Thread(target=self._add_container, daemon=True).start()
+
+    def _n_total(self) -> int:
+        """number of containers owned by the pool. call with the lock"""
+        return len(self._idle) + self._n_starting + self._n_busy
+
+    def _add_container(self):
+        container = None
+        try:
+            container = self._start_container()
+        except Exception as e:
+            logger.warning(f"fail to start container of {self.worker_info.image_id}: {e}")
+        with self._lock:
+            self._n_starting -= 1
+            if container is not None and not self._closed:
+                self._idle.append(container)
+                container = None
+        if container is not None:
+            container.remove()
+
+    def _start_container(self) -> WarmContainer:
+        logger.info(f"start container: {self.worker_info.image_id} {self.container_config}")
+        labels = self.container_config.get('labels') or {}
+        if not isinstance(labels, dict):
+            labels = {x: "" for x in labels}
+        labels = dict(labels, **{POOL_LABEL: "1"})
+        container = self.docker_client.containers.run(self.worker_info.image_id, entrypoint=IDLE_ENTRYPOINT,
+                                                      detach=True, **dict(self.container_config, labels=labels))
+        return WarmContainer(container)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for container in idle:
+            container.remove()
+
+    def n_idle(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+
+def split_environment(runtime_config: Optional[dict]):
+    """split runtime_config into (container config, environment dict) for ContainerPool"""
+    container_config = dict(runtime_config or {})
+    environment = container_config.pop('environment', None) or {}
+    if not isinstance(environment, dict):
+        environment = dict(x.split("=", 1) for x in environment)
+    return container_config, environment
@@ -0,0 +1,105 @@
+import json
+from logging import getLogger
+from typing import List, Optional
+
+from spr_adbi.common.adbi_io import ADBIIO, create_io_client
+from spr_adbi.common.job_state import read_status
+from spr_adbi.common.notification import create_notification_channel
+from spr_adbi.const import PATH_PIPELINE, PATH_STATUS, STATUS_SUCCESS, STATUS_ERROR, STATUS_WAITING_UPSTREAM, \
+    MESSAGE_OPTION_DOWNSTREAM, MESSAGE_OPTION_REPLY_TO
+from spr_adbi.util.aws_client_pool import get_client_pool
+
+logger = getLogger(__name__)
+
+
+class PipelineCoordinator:
+    """enqueue downstream jobs of ADBIPipeline when their upstream jobs are finished.
+
+    A downstream job is enqueued only while its status is `WAITING UPSTREAM`.
+    When two upstream jobs finish at the same time, the message can be sent twice,
+    but it is deduplicated by MessageDeduplicationId (= process_id) of the FIFO queue.
+    """
+
+    def __init__(self, queue_name: str, region_name=None):
+        self.queue_name = queue_name
+        self.region_name = region_name
+
+    def create_io_client(self, base_dir) -> ADBIIO:
+        return create_io_client(base_dir, region_name=self.region_name)
+
+    def on_finished(self, base_dir: str, success: bool, downstream: List[str]):
+        """
+        :param base_dir: base_dir of the finished job
+        :param success:
+        :param downstream: base_dir of downstream jobs
+        """
+        for downstream_dir in downstream or []:
+            try:
+                if success:
+                    self.enqueue_if_ready(downstream_dir)
+                else:
+                    self.fail(downstream_dir, f"upstream job failed: {base_dir}")
+            except Exception as e:
+                logger.warning(f"fail to handle downstream job {downstream_dir}: {e}", exc_info=True)
+
+    def enqueue_if_ready(self, base_dir: str) -> bool:
+        """copy outputs of upstream jobs into inputs, and send the queue message.
+
+        :return: True if enqueued
+        """
+        io_client = self.create_io_client(base_dir)
+        pipeline = self._load_pipeline(io_client)
+        if pipeline is None or read_status(io_client) != STATUS_WAITING_UPSTREAM:
+            return False
+        for upstream_dir in pipeline['upstream']:
+            status = read_status(self.create_io_client(upstream_dir))
+            if status != STATUS_SUCCESS:
+                logger.info(f"{base_dir} is waiting for {upstream_dir}: {status}")
+                return False
+
+        # the job must not be left WAITING UPSTREAM, ex. when the wired output is not produced by the upstream job
+        try:
+            for target, source in pipeline['wiring'].items():
+                io_client.write_file(target, source)
+
+            logger.info(f"enqueue downstream job {base_dir}")
+            io_client.delete(PATH_STATUS)
+            self.send_message(pipeline['message'], pipeline['process_id'])
+        except Exception as e:
+            self.fail(base_dir, f"fail to enqueue: {e}")
+            raise e
+        return True
+
+    def fail(self, base_dir: str, message: str):
+        """mark the waiting job and its downstream jobs as ERROR"""
+        io_client = self.create_io_client(base_dir)
+        pipeline = self._load_pipeline(io_client)
+        if pipeline is None or read_status(io_client) not in (STATUS_WAITING_UPSTREAM, None):
+            return
+
+        logger.info(f"downstream job {base_dir} is failed: {message}")
+        io_client.write("output/__error__.txt", message)
+        io_client.write(PATH_STATUS, STATUS_ERROR)
+        options = self._message_options(pipeline)
+        if options.get(MESSAGE_OPTION_REPLY_TO):
+            create_notification_channel(options[MESSAGE_OPTION_REPLY_TO], self.region_name).notify(
+                base_dir, status=STATUS_ERROR)
+        self.on_finished(base_dir, False, options.get(MESSAGE_OPTION_DOWNSTREAM))
+
+    def send_message(self, message: str, process_id: str):
+        client_pool = get_client_pool(region_name=self.region_name)
+        client_pool.sqs().send_message(QueueUrl=client_pool.get_queue_url(self.queue_name), MessageBody=message,
+                                       MessageGroupId=process_id, MessageDeduplicationId=process_id)
+
+    @staticmethod
+    def _load_pipeline(io_client: ADBIIO) -> Optional[dict]:
+        data = io_client.read(PATH_PIPELINE)
+        if data is None:
+            logger.warning(f"{PATH_PIPELINE} not found in {io_client.base_dir}")
+            return None
+        return json.loads(data.decode())
+
+    @staticmethod
+    def _message_options(pipeline: dict) -> dict:
+        message = json.loads(pipeline['message'])
+        return message[2] if len(message) > 2 else {}
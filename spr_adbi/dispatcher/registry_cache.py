@@ -0,0 +1,139 @@
+from concurrent.futures import Future
+from datetime import datetime
+from encodings.base64_codec import base64_decode
+from logging import getLogger
+from threading import Lock
+from time import time
+from typing import Optional
+
+import docker
+from docker import DockerClient
+from docker.errors import ImageNotFound
+
+logger = getLogger(__name__)
+
+TOKEN_REFRESH_MARGIN = 600
+IMAGE_CHECK_INTERVAL = 60
+
+_registry_cache = None
+_registry_cache_lock = Lock()
+
+
+def get_registry_cache():
+    """return dispatcher-wide RegistryCache
+
+    :rtype: RegistryCache
+    """
+    global _registry_cache
+    with _registry_cache_lock:
+        if _registry_cache is None:
+            _registry_cache = RegistryCache()
+        return _registry_cache
+
+
+class RegistryCache:
+    """docker client, ECR login and pulled images shared by all jobs of the dispatcher.
+
+    - one DockerClient is shared. docker-py keeps the login credentials in the client, so pulls reuse them
+    - ECR login is skipped until the token is about to expire (`TOKEN_REFRESH_MARGIN` seconds before)
+    - pull is skipped when the local image has the same digest as the registry.
+      the digest is checked at most once per `IMAGE_CHECK_INTERVAL` seconds per image
+    - concurrent logins and pulls of the same registry/image are collapsed into one (single-flight)
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN, check_interval=IMAGE_CHECK_INTERVAL):
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self._docker_client: Optional[DockerClient] = None
+        self._token_expires = {}  # registry_url -> unix time
+        self._image_checked = {}  # image_id -> unix time
+        self._in_flight = {}  # key -> Future
+        self._lock = Lock()
+
+    @property
+    def docker_client(self) -> DockerClient:
+        with self._lock:
+            if self._docker_client is None:
+                self._docker_client = docker.from_env()
+            return self._docker_client
+
+    def login_ecr(self, ecr_client, account_id: str, region_name: str):
+        registry_url = f'https://{account_id}.dkr.ecr.{region_name}.amazonaws.com/'
+        with self._lock:
+            expires = self._token_expires.get(registry_url)
+        if expires is not None and time() < expires - self.refresh_margin:
+            return
+        self._single_flight(('login', registry_url), self._login_ecr, ecr_client, account_id, registry_url)
+
+    def _login_ecr(self, ecr_client, account_id, registry_url):
+        logger.info(f"logging in docker registry {registry_url}")
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecr.html#ECR.Client.get_authorization_token
+        response = ecr_client.get_authorization_token(registryIds=[account_id])
+        authorization_data = response.get('authorizationData')[0]
+        id_pass, _ = base64_decode(authorization_data.get('authorizationToken').encode())
+        user_name, password = id_pass.decode().split(":")
+
+        # docker.login : https://docker-py.readthedocs.io/en/stable/client.html
+        self.docker_client.login(username=user_name, password=password, registry=registry_url, reauth=True)
+        expires_at = authorization_data.get('expiresAt')
+        with self._lock:
+            # ECR token is valid for 12 hours
+            self._token_expires[registry_url] = expires_at.timestamp() if isinstance(expires_at, datetime) \
+                else time() + 12 * 3600
+
+    def ensure_image(self, image_id: str):
+        """pull the image unless the local image is up to date"""
+        with self._lock:
+            checked = self._image_checked.get(image_id)
+        if checked is not None and time() < checked + self.check_interval:
+            return
+        self._single_flight(('pull', image_id), self._ensure_image, image_id)
+
+    def _ensure_image(self, image_id):
+        if self._is_up_to_date(image_id):
+            logger.info(f"docker image {image_id} is up to date")
+        else:
+            logger.info(f"pulling docker container {image_id}")
+            self.docker_client.images.pull(image_id)
+        with self._lock:
+            self._image_checked[image_id] = time()
+
+    def _is_up_to_date(self, image_id) -> bool:
+        try:
+            local_image = self.docker_client.images.get(image_id)
+        except ImageNotFound:
+            return False
+        repo_digests = local_image.attrs.get('RepoDigests') or []
+        if '@sha256:' in image_id:
+            return True  # pinned by digest
+        try:
+            # only the manifest is fetched, not layers
+            remote_digest = self.docker_client.images.get_registry_data(image_id).id
+        except Exception as e:
+            logger.warning(f"fail to get digest of {image_id}: {e}")
+            return False
+        return any(x.endswith(f"@{remote_digest}") for x in repo_digests)
+
+    def clear(self):
+        with self._lock:
+            self._token_expires.clear()
+            self._image_checked.clear()
+
+    def _single_flight(self, key, function, *args):
+        """call function once for concurrent callers of the same key. all of them get the same result or exception"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
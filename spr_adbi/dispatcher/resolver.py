@@ -1,17 +1,43 @@
 from typing import Optional, List
 
+EXECUTOR_DOCKER = 'docker'
+EXECUTOR_LOCAL = 'local'
+EXECUTOR_SERVING = 'serving'
+
 
 class WorkerInfo:
     image_id: str
     entry_point: List[str]
     runtime_config: Optional[dict]
     tags: List[str]
+    executor: str
+    pool_size: int
+    max_jobs_per_container: int
+
+    def __init__(self, image_id, entry_point, runtime_config=None, tags=None, executor=EXECUTOR_DOCKER,
+                 pool_size=0, max_jobs_per_container=100):
+        """
 
-    def __init__(self, image_id, entry_point, runtime_config=None, tags=None):
+        :param image_id: docker image. not used by EXECUTOR_LOCAL
+        :param entry_point: command. the storage dir of the job is appended as the last argument
+        :param runtime_config: kwargs of `docker run`.
+            EXECUTOR_LOCAL uses only `environment`, `working_dir`, `mem_limit`, `cpu_time_limit` and `timeout`
+        :param tags:
+        :param executor: EXECUTOR_DOCKER, EXECUTOR_LOCAL (subprocess on the dispatcher host, for trusted functions)
+            or EXECUTOR_SERVING (long-lived local processes of `serve_worker()`. entry_point starts the server)
+        :param pool_size: number of idle containers kept for this worker. 0 runs a new container for each job.
+            with pool_size, jobs run by `docker exec` in the idle containers.
+            EXECUTOR_SERVING keeps max(1, pool_size) idle processes
+        :param max_jobs_per_container: a pooled container or serving process is replaced after this number of jobs.
+            0 is unlimited
+        """
         self.image_id = image_id
         self.entry_point = entry_point
         self.runtime_config = runtime_config
         self.tags = tags or []
+        self.executor = executor
+        self.pool_size = pool_size
+        self.max_jobs_per_container = max_jobs_per_container
 
 
 class WorkerResolver:
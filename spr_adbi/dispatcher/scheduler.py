@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from logging import getLogger
+from threading import Condition
+from time import time
+from typing import Callable
+
+logger = getLogger(__name__)
+
+
+class JobScheduler:
+    """run jobs on a fixed number of slots, and never accept more jobs than the slots.
+
+    The caller should `wait_for_slot()` before taking a new job from the queue, so that
+    waiting jobs stay in SQS (where other dispatchers can take them) instead of in a local queue.
+
+    metrics:
+        - queue_wait: seconds from receiving the message to starting the job
+        - run_time: seconds to run the job
+    """
+
+    def __init__(self, max_jobs: int):
+        assert max_jobs > 0
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="adbi-job")
+        self._cond = Condition()
+        self._n_running = 0
+        self._n_started = 0
+        self._n_finished = 0
+        self._total_queue_wait = 0.0
+        self._total_run_time = 0.0
+        self._max_queue_wait = 0.0
+
+    @property
+    def n_running(self) -> int:
+        with self._cond:
+            return self._n_running
+
+    @property
+    def free_slots(self) -> int:
+        with self._cond:
+            return self.max_jobs - self._n_running
+
+    def wait_for_slot(self, timeout=None) -> bool:
+        """
+        :return: False if timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._n_running < self.max_jobs, timeout)
+
+    def submit(self, function: Callable, *args, received_time: float = None) -> Future:
+        """run function in a slot.
+
+        :param received_time: time when the job was received. used for queue_wait metric
+        :raise RuntimeError: when no slot is free. call wait_for_slot() before
+        """
+        with self._cond:
+            if self._n_running >= self.max_jobs:
+                raise RuntimeError("no free slot")
+            self._n_running += 1
+        return self.executor.submit(self._run, function, args, received_time or time())
+
+    def _run(self, function, args, received_time):
+        start_time = time()
+        queue_wait = start_time - received_time
+        with self._cond:
+            self._n_started += 1
+            self._total_queue_wait += queue_wait
+            self._max_queue_wait = max(self._max_queue_wait, queue_wait)
+        try:
+            return function(*args)
+        finally:
+            run_time = time() - start_time
+            logger.info(f"job finished: queue_wait={queue_wait:.2f}s run_time={run_time:.2f}s")
+            with self._cond:
+                self._n_running -= 1
+                self._n_finished += 1
+                self._total_run_time += run_time
+                self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return dict(
+                running=self._n_running,
+                max_jobs=self.max_jobs,
+                started=self._n_started,
+                finished=self._n_finished,
+                avg_queue_wait=self._total_queue_wait / self._n_started if self._n_started else 0.0,
+                max_queue_wait=self._max_queue_wait,
+                avg_run_time=self._total_run_time / self._n_finished if self._n_finished else 0.0,
+            )
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,180 @@
+import atexit
+import json
+import subprocess
+from collections import deque
+from logging import getLogger
+from queue import Queue, Empty
+from threading import Lock, Thread
+from time import time
+
+from spr_adbi.const import SERVE_RESULT_MARKER
+from spr_adbi.dispatcher.container import LocalProcessContainerManager
+from spr_adbi.dispatcher.container_pool import split_environment
+from spr_adbi.dispatcher.resolver import WorkerInfo
+
+logger = getLogger(__name__)
+
+_MARKER = SERVE_RESULT_MARKER.encode()
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def get_serving_process_pool(worker_info: WorkerInfo, process_config: dict):
+    """
+    :param process_config: runtime_config except `environment`
+    :rtype: ServingProcessPool
+    """
+    key = (tuple(worker_info.entry_point), json.dumps(process_config, sort_keys=True, default=str))
+    with _pools_lock:
+        if not _pools:
+            atexit.register(close_serving_process_pools)
+        if key not in _pools:
+            _pools[key] = ServingProcessPool(worker_info, process_config)
+        return _pools[key]
+
+
+def close_serving_process_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class ServingProcessContainerManager(LocalProcessContainerManager):
+    """send jobs to long-lived worker processes started by `serve_worker()` (EXECUTOR_SERVING).
+
+    `entry_point` starts the server, and the storage dir is sent to its stdin per job.
+    Up to `worker_info.pool_size` (at least 1) idle processes are kept.
+    """
+
+    def run_container(self, runtime_config=None):
+        process_config, environment = split_environment(runtime_config)
+        pool = get_serving_process_pool(self.worker_info, process_config)
+        logger.info(f"run in serving process: {self.worker_info.entry_point} {self.base_uri}")
+        try:
+            return pool.run([self.base_uri], environment, timeout=process_config.get('timeout'))
+        except Exception as e:
+            return False, None, str(e)
+
+
+class ServingProcess:
+    def __init__(self, commands, process_config: dict):
+        self.proc = LocalProcessContainerManager.start_process(commands, process_config, stdin=subprocess.PIPE)
+        self.n_jobs = 0
+        self.exiting = False
+        self._stdout = Queue()
+        self._stderr = []
+        self._stderr_lock = Lock()
+        Thread(target=self._read_stdout, daemon=True).start()
+        Thread(target=self._read_stderr, daemon=True).start()
+
+    def _read_stdout(self):
+        for line in iter(self.proc.stdout.readline, b""):
+            self._stdout.put(line)
+        self._stdout.put(None)
+
+    def _read_stderr(self):
+        for line in iter(self.proc.stderr.readline, b""):
+            with self._stderr_lock:
+                self._stderr.append(line)
+
+    def _pop_stderr(self):
+        with self._stderr_lock:
+            stderr, self._stderr = self._stderr, []
+        return b"".join(stderr).decode(errors='replace') or None
+
+    def is_alive(self) -> bool:
+        return not self.exiting and self.proc.poll() is None
+
+    def run(self, args, environment: dict, timeout=None):
+        """
+        :return: (success:bool, stdout, stderr)
+        """
+        self.n_jobs += 1
+        self.proc.stdin.write((json.dumps(dict(args=args, env=environment)) + "\n").encode())
+        self.proc.stdin.flush()
+
+        stdout = []
+        deadline = time() + timeout if timeout else None
+        while True:
+            try:
+                line = self._stdout.get(timeout=max(0.0, deadline - time()) if deadline else None)
+            except Empty:
+                self.kill()
+                return False, b"".join(stdout), f"timeout after {timeout} seconds\n{self._pop_stderr() or ''}"
+            if line is None:
+                exit_code = self.proc.wait()
+                return False, b"".join(stdout), self._pop_stderr() or f"exit code {exit_code}"
+            index = line.find(_MARKER)
+            if index < 0:
+                stdout.append(line)
+                continue
+            stdout.append(line[:index])
+            result = json.loads(line[index + len(_MARKER):].decode())
+            self.exiting = bool(result.get('exit'))
+            return bool(result.get('success')), b"".join(stdout), self._pop_stderr()
+
+    def close(self, timeout=5):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+
+
+class ServingProcessPool:
+    def __init__(self, worker_info: WorkerInfo, process_config: dict):
+        self.worker_info = worker_info
+        self.process_config = process_config
+        self._idle = deque()
+        self._lock = Lock()
+
+    @property
+    def pool_size(self) -> int:
+        return max(1, self.worker_info.pool_size)
+
+    def run(self, args, environment: dict, timeout=None):
+        """
+        :return: (success:bool, stdout, stderr)
+        """
+        with self._lock:
+            process = self._idle.popleft() if self._idle else None
+        if process is None or not process.is_alive():
+            if process is not None:
+                process.close()
+            logger.info(f"start serving process: {self.worker_info.entry_point}")
+            # environment of worker_info is set to the process (ex. credentials), and also sent with each job
+            environment_of_process = (self.worker_info.runtime_config or {}).get('environment')
+            process = ServingProcess(self.worker_info.entry_point,
+                                     dict(self.process_config, environment=environment_of_process))
+
+        try:
+            return process.run(args, environment, timeout=timeout)
+        finally:
+            self.release(process)
+
+    def release(self, process: ServingProcess):
+        """keep the process unless it is dead, exiting or has run max_jobs_per_container jobs.
+        a failed job does not stop the process, because the worker handles its own errors."""
+        max_jobs = self.worker_info.max_jobs_per_container
+        with self._lock:
+            keep = process.is_alive() and (not max_jobs or process.n_jobs < max_jobs) and \
+                len(self._idle) < self.pool_size
+            if keep:
+                self._idle.append(process)
+        if not keep:
+            logger.info(f"stop serving process after {process.n_jobs} jobs")
+            process.close()
+
+    def close(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for process in idle:
+            process.close()
@@ -1,10 +1,20 @@
+import json
+import os
 from datetime import datetime
+from itertools import chain
 from logging import getLogger
+from typing import Optional
 
 from spr_adbi.common.adbi_io import ADBIS3IO
-from spr_adbi.dispatcher.container import ContainerManager, AWSContainerManager
-from spr_adbi.dispatcher.resolver import WorkerInfo
-from spr_adbi.const import PATH_STATUS, STATUS_ERROR, PATH_PROGRESS, STATUS_RUNNING
+from spr_adbi.common.inline_input import encode_inline_input
+from spr_adbi.common.job_state import JobState
+from spr_adbi.common.notification import NotificationChannel, create_notification_channel
+from spr_adbi.dispatcher.container import ContainerManager, AWSContainerManager, LocalProcessContainerManager
+from spr_adbi.dispatcher.resolver import WorkerInfo, EXECUTOR_LOCAL, EXECUTOR_SERVING
+from spr_adbi.dispatcher.serving_process import ServingProcessContainerManager
+from spr_adbi.const import PATH_STATUS, STATUS_ERROR, PATH_PROGRESS, STATUS_RUNNING, MESSAGE_OPTION_REPLY_TO, \
+    ENV_KEY_REPLY_TO, MESSAGE_OPTION_STATE_MANIFEST, ENV_KEY_STATE_MANIFEST, MESSAGE_OPTION_INLINE, \
+    ENV_KEY_INLINE_INPUT, MESSAGE_OPTION_INPUT_REFS, ENV_KEY_INPUT_REFS, ENV_KEY_CACHE_DIR, ENV_KEY_CACHE_MAX_BYTES
 from spr_adbi.util.datetime_util import JST
 
 
@@ -15,6 +25,10 @@ class WorkerManager:
     def __init__(self, worker_info: WorkerInfo, base_uri: str, region_name=None):
         self.worker_info = worker_info
         self.base_uri = base_uri
+        self.region_name = region_name
+        self.job_options = {}
+        self.notification_channel: Optional[NotificationChannel] = None
+        self.state: Optional[JobState] = None
         self.io_client = self.create_io_client(base_uri, region_name)
         self.container_manager = self.create_container_manager(worker_info, base_uri, region_name)
 
@@ -22,11 +36,75 @@ class WorkerManager:
         return ADBIS3IO(base_uri, region_name)
 
     def create_container_manager(self, worker_info, base_uri, region_name) -> ContainerManager:
+        if worker_info.executor == EXECUTOR_LOCAL:
+            return LocalProcessContainerManager(worker_info, base_uri)
+        if worker_info.executor == EXECUTOR_SERVING:
+            return ServingProcessContainerManager(worker_info, base_uri)
         return AWSContainerManager(worker_info, base_uri, region_name=region_name)
 
+    def set_job_options(self, options: dict):
+        """
+        :param options: options in the queue message
+        """
+        self.job_options = options or {}
+        reply_to = self.job_options.get(MESSAGE_OPTION_REPLY_TO)
+        if reply_to:
+            self.notification_channel = create_notification_channel(reply_to, self.region_name)
+        if self.job_options.get(MESSAGE_OPTION_STATE_MANIFEST):
+            self.state = JobState(self.io_client)
+
     def set_status(self, value):
         logger.info(f"set status to {value}")
-        self.io_client.write(PATH_STATUS, str(value))
+        if self.state is not None:
+            self.state.update(status=str(value))
+        else:
+            self.io_client.write(PATH_STATUS, str(value))
+        self.notify(status=str(value))
+
+    def notify(self, **kwargs):
+        if self.notification_channel is not None:
+            self.notification_channel.notify(self.base_uri, **kwargs)
+
+    def worker_environment(self) -> dict:
+        """environment variables passed to the worker"""
+        env = {}
+        if self.job_options.get(MESSAGE_OPTION_REPLY_TO):
+            env[ENV_KEY_REPLY_TO] = self.job_options[MESSAGE_OPTION_REPLY_TO]
+        if self.state is not None:
+            env[ENV_KEY_STATE_MANIFEST] = '1'
+        if self.job_options.get(MESSAGE_OPTION_INLINE):
+            env[ENV_KEY_INLINE_INPUT] = encode_inline_input(self.job_options[MESSAGE_OPTION_INLINE])
+        if self.job_options.get(MESSAGE_OPTION_INPUT_REFS):
+            env[ENV_KEY_INPUT_REFS] = json.dumps(self.job_options[MESSAGE_OPTION_INPUT_REFS])
+        if self.cache_dir:
+            env[ENV_KEY_CACHE_DIR] = self.cache_dir
+            if os.environ.get(ENV_KEY_CACHE_MAX_BYTES):
+                env[ENV_KEY_CACHE_MAX_BYTES] = os.environ[ENV_KEY_CACHE_MAX_BYTES]
+        return env
+
+    @property
+    def cache_dir(self) -> Optional[str]:
+        """directory on the host shared by workers as the input cache. mounted at the same path in containers."""
+        return os.environ.get(ENV_KEY_CACHE_DIR)
+
+    def runtime_config(self) -> dict:
+        runtime_config = dict(self.worker_info.runtime_config or {})
+        worker_env = self.worker_environment()
+        if worker_env:
+            environment = runtime_config.get('environment') or {}
+            if isinstance(environment, dict):
+                environment = dict(environment, **worker_env)
+            else:
+                environment = list(environment) + [f"{k}={v}" for k, v in worker_env.items()]
+            runtime_config['environment'] = environment
+        if self.cache_dir:
+            volumes = runtime_config.get('volumes') or {}
+            if isinstance(volumes, dict):
+                volumes = dict(volumes, **{self.cache_dir: dict(bind=self.cache_dir, mode='rw')})
+            else:
+                volumes = list(volumes) + [f"{self.cache_dir}:{self.cache_dir}:rw"]
+            runtime_config['volumes'] = volumes
+        return runtime_config
 
     def run(self, max_retry=1):
         success = False
@@ -57,22 +135,21 @@ class WorkerManager:
 
     def cleanup_workspace(self):
         logger.info("cleanup workspace")
-        filenames = self.io_client.get_filenames()
-        for filename in filenames:
-            if filename == PATH_PROGRESS:
-                self.io_client.delete(filename)
-            elif filename.startswith("output/"):
-                self.io_client.delete(filename)
+        self.io_client.delete_many(chain([PATH_PROGRESS], self.io_client.iter_filenames("output/")))
 
     def start_worker(self, retry_idx: int) -> bool:
         logger.info("start worker")
         log_dir = f"run-{retry_idx}"
-        self.io_client.write(f"{log_dir}/start_time", datetime.now(tz=JST).isoformat())
-        self.set_status(STATUS_RUNNING)
+        if self.state is not None:
+            self.state.start_run(retry_idx, STATUS_RUNNING)
+            self.notify(status=STATUS_RUNNING)
+        else:
+            self.io_client.write(f"{log_dir}/start_time", datetime.now(tz=JST).isoformat())
+            self.set_status(STATUS_RUNNING)
 
         success = stdout = stderr = None
         try:
-            success, stdout, stderr = self.container_manager.run_container(self.worker_info.runtime_config)
+            success, stdout, stderr = self.container_manager.run_container(self.runtime_config())
         except Exception as e:
             logger.warning(f"error in running container: {e}", stack_info=True)
 
@@ -81,7 +158,11 @@ class WorkerManager:
 
         self.io_client.write(f"{log_dir}/stdout", stdout)
         self.io_client.write(f"{log_dir}/stderr", stderr)
-        self.io_client.write(f"{log_dir}/end_time", datetime.now(tz=JST).isoformat())
-        self.io_client.write(f"{log_dir}/status", self.io_client.read(PATH_STATUS))
+        if self.state is not None:
+            self.state.load()
+            self.state.end_run()
+        else:
+            self.io_client.write(f"{log_dir}/end_time", datetime.now(tz=JST).isoformat())
+            self.io_client.write(f"{log_dir}/status", self.io_client.read(PATH_STATUS))
 
         return success
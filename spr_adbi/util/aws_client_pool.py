@@ -0,0 +1,111 @@
+import os
+from logging import getLogger
+from threading import Lock
+
+from botocore.config import Config
+
+from spr_adbi.util.s3_util import create_boto3_session_of_assume_role_delayed
+
+logger = getLogger(__name__)
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def get_client_pool(region_name=None, profile_name=None):
+    """return process-wide AWSClientPool shared by (region_name, profile_name).
+
+    :rtype: AWSClientPool
+    """
+    region_name = region_name or os.environ.get('AWS_REGION')
+    key = (region_name, profile_name)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = AWSClientPool(region_name=region_name, profile_name=profile_name)
+        return _pools[key]
+
+
+def clear_client_pools():
+    with _pools_lock:
+        _pools.clear()
+
+
+class AWSClientPool:
+    """boto3 session and clients cached per (service, endpoint_url).
+
+    boto3 clients are thread-safe, but sessions and resources are not.
+    So clients and resources are created under the lock and only clients are shared.
+    botocore retries are disabled for S3, because S3 requests are retried by `s3_util.call_with_retry()`,
+    except the client for managed transfers (upload_file, download_file, copy) whose requests are retried by botocore.
+    So a failed part is retried alone, and the whole object is not transferred again.
+    """
+
+    def __init__(self, region_name=None, profile_name=None, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
+        self.region_name = region_name
+        self.profile_name = profile_name
+        self.config = Config(max_pool_connections=max_pool_connections,
+                             retries={'max_attempts': 5, 'mode': 'adaptive'})
+        self.s3_config = Config(max_pool_connections=max_pool_connections,
+                                retries={'total_max_attempts': 1, 'mode': 'standard'})
+        self.s3_transfer_config = Config(max_pool_connections=max_pool_connections,
+                                         retries={'max_attempts': 5, 'mode': 'standard'})
+        self._session = None
+        self._clients = {}
+        self._queue_urls = {}
+        self._lock = Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            return self._get_session()
+
+    def _get_session(self):
+        if self._session is None:
+            logger.info(f"create aws session: region={self.region_name} profile={self.profile_name}")
+            self._session = create_boto3_session_of_assume_role_delayed(profile_name=self.profile_name,
+                                                                        region_name=self.region_name)
+        return self._session
+
+    def client(self, service_name, endpoint_url=None):
+        return self._client((service_name, endpoint_url), service_name, endpoint_url, self._config_of(service_name))
+
+    def _client(self, key, service_name, endpoint_url, config: Config):
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self._get_session().client(service_name, endpoint_url=endpoint_url,
+                                                                region_name=self.region_name, config=config)
+            return self._clients[key]
+
+    def resource(self, service_name, endpoint_url=None):
+        """create new resource. resources are not thread-safe, so they are not cached."""
+        with self._lock:
+            return self._get_session().resource(service_name, endpoint_url=endpoint_url,
+                                                region_name=self.region_name, config=self._config_of(service_name))
+
+    def _config_of(self, service_name) -> Config:
+        return self.s3_config if service_name == 's3' else self.config
+
+    def s3(self):
+        return self.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+
+    def s3_transfer(self):
+        """S3 client for managed transfers, which is retried by botocore"""
+        endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+        return self._client(('s3-transfer', endpoint_url), 's3', endpoint_url, self.s3_transfer_config)
+
+    def sqs(self):
+        return self.client('sqs')
+
+    def ecr(self):
+        return self.client('ecr')
+
+    def get_queue_url(self, queue_name) -> str:
+        with self._lock:
+            url = self._queue_urls.get(queue_name)
+        if url is None:
+            url = self.sqs().get_queue_url(QueueName=queue_name)['QueueUrl']
+            with self._lock:
+                self._queue_urls[queue_name] = url
+        return url
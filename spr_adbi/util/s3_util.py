@@ -1,13 +1,62 @@
 import os
+import random
 import re
-from io import BytesIO
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from itertools import islice
+from io import RawIOBase, BufferedReader, BufferedIOBase, DEFAULT_BUFFER_SIZE, SEEK_SET, SEEK_CUR, SEEK_END
 from logging import getLogger
+from typing import Iterator, Iterable, List
 
 from boto3.session import Session
+from botocore.exceptions import ClientError, HTTPClientError, IncompleteReadError, \
+    ConnectionError as BotocoreConnectionError
 from botocore.session import get_session
 
 logger = getLogger(__name__)
 
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+S3_MAX_DELETE_KEYS = 1000
+UPLOAD_EXTRA_ARGS = {"ACL": "bucket-owner-full-control"}
+DEFAULT_MAX_RETRY = 3
+DEFAULT_RETRY_BASE_WAIT = 0.5
+RETRYABLE_ERROR_CODES = ('RequestTimeout', 'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                         'InternalError', 'ServiceUnavailable', 'PriorRequestNotComplete')
+RETRYABLE_EXCEPTIONS = (BotocoreConnectionError, HTTPClientError, IncompleteReadError)
+
+_MD5_ETAG_PATTERN = re.compile(r'^"[0-9a-f]{32}(-[0-9]+)?"$')
+
+
+def call_with_retry(function, *args, max_retry=DEFAULT_MAX_RETRY, base_wait=DEFAULT_RETRY_BASE_WAIT, **kwargs):
+    """call function with exponential backoff, and raise the last exception when all retries fail.
+
+    This is the only retry layer of S3 requests, botocore retries are disabled for S3 clients (see AWSClientPool).
+    Only connection errors, timeouts, throttling and 5xx are retried, and others (ex. 404, 412) are raised immediately.
+    Do not use it for managed transfers, which are retried by botocore with `get_s3_transfer_client()`.
+    """
+    for retry_idx in range(max_retry + 1):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if retry_idx >= max_retry or not is_retryable_error(e):
+                raise
+            wait = base_wait * (2 ** retry_idx) * (1 + random.random())
+            logger.warning(f"retry after {wait:.2f}s: {e}", exc_info=True)
+            time.sleep(wait)
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """True for connection errors and timeouts of botocore, and S3 errors of throttling and 5xx."""
+    if not isinstance(e, ClientError):
+        return isinstance(e, RETRYABLE_EXCEPTIONS)
+    code = str(e.response.get('Error', {}).get('Code'))
+    status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+    return code in RETRYABLE_ERROR_CODES or status >= 500 or status in (408, 429)
+
 
 def create_boto3_session_of_assume_role_delayed(profile_name=None, region_name=None):
     bc_session = get_session()
@@ -20,22 +69,27 @@ def create_boto3_session_of_assume_role_delayed(profile_name=None, region_name=N
 
 
 def get_s3_client(region_name=None):
-    """
+    """return S3 client shared in the process.
 
     :return:
     """
-    session = create_boto3_session_of_assume_role_delayed(region_name=region_name)
-    endpoint_url = os.environ.get('S3_ENDPOINT_URL')
-    s3 = session.client('s3', endpoint_url=endpoint_url, region_name=region_name)
-    return s3
+    from spr_adbi.util.aws_client_pool import get_client_pool
+    return get_client_pool(region_name=region_name).s3()
 
 
-def download_from_s3(s3, s3_path, local_path):
+def get_s3_transfer_client(region_name=None):
+    """return S3 client for managed transfers (upload_file, download_file, copy) shared in the process.
+    unlike get_s3_client(), each request is retried by botocore."""
+    from spr_adbi.util.aws_client_pool import get_client_pool
+    return get_client_pool(region_name=region_name).s3_transfer()
+
+
+def download_from_s3(s3, s3_path, local_path, transfer_config=None):
     logger.info('downloading %s to %s' % (s3_path, local_path))
     bucket_name, origin_path = split_bucket_and_key(s3_path)
     if bucket_name:
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        s3.download_file(bucket_name, origin_path, local_path)
+        s3.download_file(bucket_name, origin_path, local_path, Config=transfer_config)
         return local_path
     else:
         logger.error("invalid s3 path: %s" % s3_path)
@@ -48,11 +102,121 @@ def download_as_data_from_s3(s3, s3_path):
     if not bucket_name:
         logger.error("invalid s3 path: %s" % s3_path)
         raise RuntimeError("invalid s3 path: %s" % s3_path)
-    buffer = BytesIO()
-    s3.download_fileobj(bucket_name, origin_path, buffer)
-    ret = buffer.getvalue()
-    buffer.close()
-    return ret
+    # read the body directly, BytesIO + getvalue() needs twice the size of memory
+    return s3.get_object(Bucket=bucket_name, Key=origin_path)['Body'].read()
+
+
+def open_s3_object(s3, s3_path, buffer_size=DEFAULT_BUFFER_SIZE) -> BufferedReader:
+    """open S3 object as seekable file-like object which reads the content by ranged GET.
+
+    :raise FileNotFoundError:
+    """
+    logger.info(f'open {s3_path}')
+    return BufferedReader(S3ObjectReader(s3, s3_path), buffer_size=buffer_size)
+
+
+class S3ObjectReader(RawIOBase):
+    """streaming reader of S3 object. GET with `Range: bytes={position}-` is issued at the first read after seek."""
+
+    def __init__(self, s3, s3_path):
+        self.s3 = s3
+        self.bucket_name, self.key = split_bucket_and_key(s3_path)
+        try:
+            self.size = call_with_retry(s3.head_object, Bucket=self.bucket_name, Key=self.key)['ContentLength']
+        except ClientError as e:
+            if is_not_found_error(e):
+                raise FileNotFoundError(s3_path)
+            raise e
+        self._position = 0
+        self._body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=SEEK_SET):
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self._position + offset
+        elif whence == SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"negative seek position: {position}")
+        if position != self._position:
+            self._close_body()
+            self._position = position
+        return self._position
+
+    def readinto(self, b):
+        if self._position >= self.size:
+            return 0
+        if self._body is None:
+            response = call_with_retry(self.s3.get_object, Bucket=self.bucket_name, Key=self.key,
+                                       Range=f"bytes={self._position}-")
+            self._body = response['Body']
+        data = self._body.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self._position += n
+        return n
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+
+def compute_etag(local_path, part_size=None) -> str:
+    """compute S3 ETag of the local file.
+
+    :param part_size: part size of multipart upload. None means the object is uploaded by one PutObject.
+    :return: `"md5"` or `"md5(md5(part1) + md5(part2) + ...)-{number of parts}"`
+    """
+    with open(local_path, "rb") as f:
+        if part_size is None:
+            h = md5()
+            for chunk in iter(lambda: f.read(DEFAULT_PART_SIZE), b""):
+                h.update(chunk)
+            return '"%s"' % h.hexdigest()
+        digests = [md5(chunk).digest() for chunk in iter(lambda: f.read(part_size), b"")]
+    return '"%s-%d"' % (md5(b"".join(digests)).hexdigest(), len(digests))
+
+
+def is_md5_etag(etag: str) -> bool:
+    """True if the ETag is computed from MD5 of the content (`compute_etag()`).
+    ETags of objects encrypted by SSE-KMS or SSE-C are not, so they can not be verified."""
+    return bool(_MD5_ETAG_PATTERN.match(etag or ""))
+
+
+def is_not_found_error(e: ClientError) -> bool:
+    return str(e.response.get('Error', {}).get('Code')) in ('404', 'NoSuchKey', 'NotFound')
+
+
+def download_as_data_from_s3_if_modified(s3, s3_path, etag=None):
+    """download by conditional GET.
+
+    :return: (data, etag)
+    :raise ClientError: Error Code is '304' if not modified
+    """
+    logger.info(f'downloading {s3_path} if modified from {etag}')
+    bucket_name, key = split_bucket_and_key(s3_path)
+    kwargs = dict(Bucket=bucket_name, Key=key)
+    if etag:
+        kwargs['IfNoneMatch'] = etag
+    response = s3.get_object(**kwargs)
+    return response['Body'].read(), response.get('ETag')
 
 
 def split_bucket_and_key(s3_path):
@@ -68,21 +232,151 @@ def split_bucket_and_key(s3_path):
         return None, None
 
 
-def upload_file_to_s3(s3, local_path, s3_path):
+def upload_file_to_s3(s3, local_path, s3_path, transfer_config=None):
     logger.info(f'upload {local_path} to {s3_path}')
     bucket_name, key = split_bucket_and_key(s3_path)
-    s3.upload_file(local_path, bucket_name, key, ExtraArgs={"ACL": "bucket-owner-full-control"})
+    s3.upload_file(local_path, bucket_name, key, ExtraArgs=UPLOAD_EXTRA_ARGS, Config=transfer_config)
 
 
-def upload_fileobj_to_s3(s3, fileobj, s3_path):
+def upload_fileobj_to_s3(s3, fileobj, s3_path, transfer_config=None):
     logger.info(f'upload fileobj to {s3_path}')
     bucket_name, key = split_bucket_and_key(s3_path)
-    s3.upload_fileobj(fileobj, bucket_name, key, ExtraArgs={"ACL": "bucket-owner-full-control"})
+    s3.upload_fileobj(fileobj, bucket_name, key, ExtraArgs=UPLOAD_EXTRA_ARGS, Config=transfer_config)
+
+
+def copy_on_s3(s3, src_s3_path, dst_s3_path, transfer_config=None):
+    """copy on server side. large objects are copied by UploadPartCopy in parallel, small ones by CopyObject."""
+    logger.info(f'copy {src_s3_path} to {dst_s3_path}')
+    src_bucket_name, src_key = split_bucket_and_key(src_s3_path)
+    bucket_name, key = split_bucket_and_key(dst_s3_path)
+    s3.copy(dict(Bucket=src_bucket_name, Key=src_key), bucket_name, key, ExtraArgs=UPLOAD_EXTRA_ARGS,
+            Config=transfer_config)
+
+
+class S3MultipartWriter(BufferedIOBase):
+    """streaming writer to S3 object by multipart upload.
+
+    Data is buffered until `part_size`, and at most `max_concurrency` parts are uploaded at the same time.
+    So the memory usage is about `part_size * (max_concurrency + 1)`.
+    Small data which is less than `part_size` in total is uploaded by one PutObject.
+    Each request is retried by `call_with_retry()`.
+    The upload is completed only by `close()` or the end of `with` block without exception.
+    It is aborted when an exception is raised in `with` block, or the writer is garbage collected without close.
+    """
+
+    def __init__(self, s3, s3_path, part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retry=DEFAULT_MAX_RETRY, retry_base_wait=DEFAULT_RETRY_BASE_WAIT):
+        assert part_size >= S3_MIN_PART_SIZE, f"part_size must be >= {S3_MIN_PART_SIZE}"
+        logger.info(f'open {s3_path} to write')
+        self.s3 = s3
+        self.bucket_name, self.key = split_bucket_and_key(s3_path)
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._part_number = 0
+        self._futures = deque()
+        self._parts = []
+        self._executor = None
+        self.max_retry = max_retry
+        self.retry_base_wait = retry_base_wait
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer.extend(b)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self._call(self.s3.put_object, Bucket=self.bucket_name, Key=self.key, Body=bytes(self._buffer),
+                           **UPLOAD_EXTRA_ARGS)
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                while self._futures:
+                    self._parts.append(self._futures.popleft().result())
+                self._call(self.s3.complete_multipart_upload, Bucket=self.bucket_name, Key=self.key,
+                           UploadId=self._upload_id, MultipartUpload={'Parts': self._parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._shutdown()
+            super().close()
+
+    def abort(self):
+        if self._upload_id is not None:
+            logger.warning(f"abort multipart upload to s3://{self.bucket_name}/{self.key}")
+            self._shutdown()
+            self._call(self.s3.abort_multipart_upload, Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self._discard()
+        else:
+            self.close()
+
+    def __del__(self):
+        # IOBase.__del__ calls close(), which would complete a truncated object
+        if not self.closed:
+            logger.warning(f"s3://{self.bucket_name}/{self.key} is not closed. discard it")
+            self._discard()
+
+    def _discard(self):
+        try:
+            self.abort()
+        finally:
+            self._buffer = bytearray()
+            self._shutdown()
+            super().close()
+
+    def _call(self, function, **kwargs):
+        return call_with_retry(function, max_retry=self.max_retry, base_wait=self.retry_base_wait, **kwargs)
+
+    def _upload_part(self, data: bytes):
+        if self._upload_id is None:
+            response = self._call(self.s3.create_multipart_upload, Bucket=self.bucket_name, Key=self.key,
+                                  **UPLOAD_EXTRA_ARGS)
+            self._upload_id = response['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        while len(self._futures) >= self.max_concurrency:
+            self._parts.append(self._futures.popleft().result())
+        self._part_number += 1
+        self._futures.append(self._executor.submit(self._upload_part_body, self._part_number, data))
+
+    def _upload_part_body(self, part_number, data: bytes) -> dict:
+        response = self._call(self.s3.upload_part, Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                              PartNumber=part_number, Body=data)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
 
 
 def list_paths(s3, s3_path):
+    return list(iter_paths(s3, s3_path))
+
+
+def iter_paths(s3, s3_path) -> Iterator[str]:
+    """yield keys under the prefix page by page.
+
+    :param s3_path: `s3://bucket/prefix`. add "/" at the end not to match `prefix2/...`
+    """
     bucket_name, key = split_bucket_and_key(s3_path)
-    ret = []
     continuation_token = ''
     while True:
         kwargs = {
@@ -91,15 +385,49 @@ def list_paths(s3, s3_path):
         }
         if continuation_token:
             kwargs['ContinuationToken'] = continuation_token
-        response = s3.list_objects_v2(**kwargs)
-        ret += [x["Key"] for x in response.get("Contents") or []]
+        response = call_with_retry(s3.list_objects_v2, **kwargs)
+        for x in response.get("Contents") or []:
+            yield x["Key"]
         if not response['IsTruncated']:
             break
         continuation_token = response['NextContinuationToken']
-    return ret
+
+
+def get_last_modified_on_s3(s3, s3_path):
+    """
+    :return: unix time of LastModified, or None if not found
+    """
+    bucket_name, key = split_bucket_and_key(s3_path)
+    try:
+        response = s3.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if is_not_found_error(e):
+            return None
+        raise e
+    return response['LastModified'].timestamp()
 
 
 def delete_file_on_s3(s3, s3_path):
     logger.info(f"delete {s3_path}")
     bucket_name, key = split_bucket_and_key(s3_path)
-    s3.delete_object(bucket_name, key)
+    s3.delete_object(Bucket=bucket_name, Key=key)
+
+
+def delete_files_on_s3(s3, bucket_name, keys: Iterable[str]) -> List[str]:
+    """delete keys by DeleteObjects, 1000 keys per request.
+
+    :return: keys failed to delete
+    """
+    failed = []
+    keys = iter(keys)
+    while True:
+        chunk = list(islice(keys, S3_MAX_DELETE_KEYS))
+        if not chunk:
+            break
+        logger.info(f"delete {len(chunk)} objects in s3://{bucket_name}")
+        response = call_with_retry(s3.delete_objects, Bucket=bucket_name,
+                                   Delete=dict(Objects=[dict(Key=k) for k in chunk], Quiet=True))
+        for error in response.get('Errors') or []:
+            logger.warning(f"fail to delete s3://{bucket_name}/{error.get('Key')}: {error.get('Message')}")
+            failed.append(error.get('Key'))
+    return failed
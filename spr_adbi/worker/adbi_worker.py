@@ -3,12 +3,19 @@ import os
 import sys
 from logging import getLogger
 import time
+from io import BufferedIOBase, BytesIO
 from traceback import format_exception
-from typing import List, Optional, ByteString
+from typing import List, Optional, ByteString, Dict, Iterator
 
-from spr_adbi.common.adbi_io import ADBIIO, ADBIS3IO, ADBILocalIO
+from spr_adbi.common.adbi_io import ADBIIO, create_io_client, DEFAULT_CHUNK_SIZE
+from spr_adbi.common.blob_store import read_blob, open_blob
+from spr_adbi.common.caching_io import with_cache
+from spr_adbi.common.inline_input import decode_inline_input
+from spr_adbi.common.job_state import JobState, is_state_manifest_enabled
+from spr_adbi.common.notification import NotificationChannel, create_notification_channel
 from spr_adbi.const import STATUS_SUCCESS, STATUS_ERROR, PATH_STDIN, PATH_ARGS, PATH_PROGRESS, PATH_STATUS, \
-    PATH_PROGRESS_LOG
+    PATH_PROGRESS_LOG, ENV_KEY_REPLY_TO, ENV_KEY_STATE_MANIFEST, ENV_KEY_INLINE_INPUT, \
+    ENV_KEY_INPUT_REFS, ENV_KEY_CACHE_DIR, ENV_KEY_CACHE_MAX_BYTES
 
 logger = getLogger(__name__)
 
@@ -28,23 +35,43 @@ def create_worker(args: List[str] = None):
 
 
 class ADBIWorker:
-    def __init__(self, args: List[str]):
+    def __init__(self, args: List[str], env: Dict[str, str] = None, serving=False):
+        """
+
+        :param args: [storage_dir, *args]
+        :param env: environment variables of the job. default is os.environ
+        :param serving: True in serving mode, where stdin of the process is not the input of the job
+        """
         self.finished = False
         self.error_called = False
         self.storage_dir = args[0]
         self.io_client: ADBIIO = None
+        self.notification_channel: Optional[NotificationChannel] = None
+        self.state: Optional[JobState] = None
+        self.inline_input: Dict[str, bytes] = {}
+        self.input_refs: Dict[str, str] = {}
         self._args = args[1:]
         self.progress_log: List[dict] = []
+        self.env = os.environ if env is None else env
+        self.serving = serving
 
         if self.storage_dir.endswith("/"):
             self.storage_dir = self.storage_dir[:-1]
         self._setup()
 
     def _setup(self):
-        if self.storage_dir.startswith("s3://"):
-            self.io_client = ADBIS3IO(self.storage_dir)
-        else:
-            self.io_client = ADBILocalIO(self.storage_dir)
+        self.io_client = with_cache(create_io_client(self.storage_dir), cache_dir=self.env.get(ENV_KEY_CACHE_DIR),
+                                    max_bytes=self.env.get(ENV_KEY_CACHE_MAX_BYTES))
+        self.inline_input = decode_inline_input(self.env.get(ENV_KEY_INLINE_INPUT))
+        self.input_refs = json.loads(self.env.get(ENV_KEY_INPUT_REFS) or "{}")
+
+        reply_to = self.env.get(ENV_KEY_REPLY_TO)
+        if reply_to:
+            self.notification_channel = create_notification_channel(reply_to)
+
+        if is_state_manifest_enabled(self.env.get(ENV_KEY_STATE_MANIFEST)):
+            self.state = JobState(self.io_client)
+            self.state.load()
 
     def __enter__(self):
         return self
@@ -69,7 +96,7 @@ class ADBIWorker:
 
     def stdin(self) -> Optional[ByteString]:
         data = self.read(PATH_STDIN)
-        if not data and not os.isatty(0):  # 0 means STDIN
+        if not data and not self.serving and not os.isatty(0):  # 0 means STDIN
             data = sys.stdin.read()
 
         if isinstance(data, str):
@@ -86,9 +113,37 @@ class ADBIWorker:
         assert relative_path
         if relative_path[0] == "/":
             relative_path = relative_path[1:]
+        if relative_path in self.inline_input:
+            return self.inline_input[relative_path]
+        if relative_path in self.input_refs:
+            logger.info(f"reading from {self.input_refs[relative_path]}")
+            return read_blob(self.input_refs[relative_path])
         logger.info(f"reading from {relative_path}")
         return self.io_client.read(relative_path)
 
+    def open(self, relative_path: str, mode='rb') -> BufferedIOBase:
+        """open as file-like object to read or write large data in constant memory.
+
+        :param relative_path: relative to storage_dir
+        :param mode: 'rb' or 'wb'
+        :raise FileNotFoundError: when mode is 'rb' and relative_path does not exist
+        """
+        assert relative_path
+        if relative_path[0] == "/":
+            relative_path = relative_path[1:]
+        if mode == 'rb':
+            if relative_path in self.inline_input:
+                return BytesIO(self.inline_input[relative_path])
+            if relative_path in self.input_refs:
+                return open_blob(self.input_refs[relative_path])
+        logger.info(f"open {relative_path} ({mode})")
+        return self.io_client.open(relative_path, mode)
+
+    def iter_chunks(self, relative_path: str, chunk_size=DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(relative_path) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
     def write(self, relative_path: str, data):
         """
 
@@ -109,10 +164,28 @@ class ADBIWorker:
         logger.info(f"writing {local_path} file to {relative_path}")
         self.io_client.write_file(relative_path, local_path)
 
-    def set_progress(self, message: str):
+    def set_progress(self, message: str, eta_seconds: float = None):
+        """
+        :param message:
+        :param eta_seconds: expected seconds to finish. clients poll less frequently until then.
+            it reaches clients by state.json or notifications.
+        """
         logger.info(f"progress: {message}")
-        self.io_client.write(PATH_PROGRESS, message)
-        self._append_progress_log(message)
+        eta = time.time() + eta_seconds if eta_seconds is not None else None
+        if self.state is not None:
+            self.progress_log.append(dict(time=time.time(), message=message))
+            self.state.update(progress=message, progress_log=self.progress_log, eta=eta)
+        else:
+            self.io_client.write(PATH_PROGRESS, message)
+            self._append_progress_log(message)
+        if eta is not None:
+            self.notify(progress=message, eta=eta)
+        else:
+            self.notify(progress=message)
+
+    def notify(self, **kwargs):
+        if self.notification_channel is not None:
+            self.notification_channel.notify(self.storage_dir, **kwargs)
 
     def _append_progress_log(self, message: str):
         self.progress_log.append(dict(time=time.time(), message=message))
@@ -131,7 +204,7 @@ class ADBIWorker:
         """
         logger.info(f"success")
         self.output_info(output_info, output_file_info)
-        self.io_client.write(PATH_STATUS, STATUS_SUCCESS)
+        self._set_status(STATUS_SUCCESS)
         self.finished = True
 
     def error(self, message: str, output_info: dict = None, output_file_info: dict = None):
@@ -150,10 +223,17 @@ class ADBIWorker:
         output_info = output_info or {}
         output_info['__error__.txt'] = message
         self.output_info(output_info, output_file_info)
-        self.io_client.write(PATH_STATUS, STATUS_ERROR)
+        self._set_status(STATUS_ERROR)
         self.finished = True
         self.error_called = True
 
+    def _set_status(self, status: str):
+        if self.state is not None:
+            self.state.update(status=status)
+        else:
+            self.io_client.write(PATH_STATUS, status)
+        self.notify(status=status)
+
     def output_info(self, output_info: dict = None, output_file_info: dict = None):
         """
 
@@ -162,7 +242,7 @@ class ADBIWorker:
             value: data(byte or str)
         :param Optional[dict] output_file_info:
             key:  path on {storage_dir}/output/*
-            value: local file path
+            value: local file path, or `s3://...` which is copied on server side
         :return:
         """
         if output_info:
@@ -171,12 +251,13 @@ class ADBIWorker:
                     self.io_client.write(f"output/{key}", value)
         if output_file_info:
             for key, local_path in output_file_info.items():
-                with open(local_path, "rb") as f:
-                    self.io_client.write(f"output/{key}", f.read())
+                self.io_client.write_file(f"output/{key}", local_path)
 
     def get_input_filenames(self) -> List[str]:
         """
 
         :return: return List of path relative to storage_dir
         """
-        return self.io_client.get_input_filenames()
+        filenames = self.io_client.get_input_filenames()
+        extra_filenames = list(self.inline_input) + list(self.input_refs)
+        return filenames + [x for x in extra_filenames if x.startswith("input/") and x not in filenames]
@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+from logging import getLogger
+from typing import Callable, Optional, TextIO
+
+from spr_adbi.const import ENV_KEY_SERVE_MAX_JOBS, ENV_KEY_SERVE_MAX_RSS, SERVE_RESULT_MARKER
+from spr_adbi.worker.adbi_worker import ADBIWorker
+
+logger = getLogger(__name__)
+
+
+def serve_worker(handler: Callable[[ADBIWorker], None], max_jobs: int = None, max_rss_bytes: int = None,
+                 input_stream: TextIO = None, output_stream: TextIO = None) -> int:
+    """run jobs one by one in this process, so that state loaded before (ex. ML models) is reused.
+
+    Usage:
+        model = load_model()
+
+        def handle(worker: ADBIWorker):
+            worker.success({"result": model.predict(worker.args())})
+
+        serve_worker(handle)
+
+    Protocol (used by ServingProcessContainerManager of the dispatcher):
+        - request: a line of `{"args": [storage_dir, ...], "env": {...}}` from stdin
+        - response: `SERVE_RESULT_MARKER {"success": bool, "exit": bool}` line to stdout.
+          stdout before the marker is the stdout of the job
+        - the process exits after `max_jobs` jobs, when RSS exceeds `max_rss_bytes`, or on EOF of stdin
+
+    :param handler: called with ADBIWorker of each job in `with worker:`. exceptions are written as the error
+    :param max_jobs: default is ADBI_SERVE_MAX_JOBS env. 0 or None is unlimited
+    :param max_rss_bytes: default is ADBI_SERVE_MAX_RSS env. 0 or None is unlimited
+    :return: number of handled jobs
+    """
+    if max_jobs is None:
+        max_jobs = int(os.environ.get(ENV_KEY_SERVE_MAX_JOBS) or 0)
+    if max_rss_bytes is None:
+        max_rss_bytes = int(os.environ.get(ENV_KEY_SERVE_MAX_RSS) or 0)
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    n_jobs = 0
+    for line in iter(input_stream.readline, ""):
+        if not line.strip():
+            continue
+        n_jobs += 1
+        success = _run_job(handler, json.loads(line))
+        rss = current_rss()
+        exiting = bool(max_jobs and n_jobs >= max_jobs) or bool(max_rss_bytes and rss > max_rss_bytes)
+        if exiting:
+            logger.info(f"exit after {n_jobs} jobs: rss={rss}")
+        output_stream.write(SERVE_RESULT_MARKER + json.dumps(dict(success=success, exit=exiting)) + "\n")
+        output_stream.flush()
+        if exiting:
+            break
+    return n_jobs
+
+
+def _run_job(handler, request: dict) -> bool:
+    worker: Optional[ADBIWorker] = None
+    try:
+        worker = ADBIWorker(request['args'], env=request.get('env') or {}, serving=True)
+        with worker:
+            handler(worker)
+    except Exception as e:
+        logger.warning(f"error in job {request.get('args')}: {e}", exc_info=True)
+    return worker is not None and worker.finished and not worker.error_called
+
+
+def current_rss() -> int:
+    """resident set size of this process in bytes. 0 if unknown"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # peak RSS. KB on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
@@ -2,7 +2,7 @@ from pytest_mock import MockFixture
 
 from spr_adbi.client.adbi_client import ADBIJob
 from spr_adbi.common_types import ProgressLog
-from spr_adbi.const import PATH_PROGRESS_LOG
+from spr_adbi.const import PATH_PROGRESS_LOG, PATH_STATE, PATH_STATUS
 
 
 def test_adbi_job_get_progress_log(mocker: MockFixture):
@@ -12,3 +12,24 @@ def test_adbi_job_get_progress_log(mocker: MockFixture):
     ret = job.get_progress_log()
     assert ret[0] == ProgressLog(999, "hello")
     io_client.read.assert_called_with(PATH_PROGRESS_LOG)
+
+
+def test_adbi_job_get_status_by_state_manifest(mocker: MockFixture):
+    io_client = mocker.MagicMock()
+    io_client.read_if_modified.return_value = (b'{"status": "RUNNING", "progress": "50%"}', '"etag1"')
+    job = ADBIJob('s3://dummy/io/dir', io_client, state_manifest=True)
+    assert job.get_status() == "RUNNING"
+
+    io_client.read_if_modified.return_value = (None, '"etag1"')
+    assert job.get_progress() == "50%"
+    io_client.read_if_modified.assert_called_with(PATH_STATE, '"etag1"')
+    io_client.read.assert_not_called()
+
+
+def test_adbi_job_get_status_falls_back_to_legacy_layout(mocker: MockFixture):
+    io_client = mocker.MagicMock()
+    io_client.read_if_modified.return_value = (None, None)
+    io_client.read.return_value = b"SUCCESS"
+    job = ADBIJob('s3://dummy/io/dir', io_client, state_manifest=True)
+    assert job.get_status() == "SUCCESS"
+    io_client.read.assert_called_with(PATH_STATUS)
@@ -0,0 +1,40 @@
+import os
+from pathlib import Path
+
+from pytest_mock import MockFixture
+
+from spr_adbi.client.adbi_client import ADBIOutput
+from spr_adbi.common.adbi_io import ADBILocalIO
+
+
+def create_output(tmp_path) -> ADBIOutput:
+    io_client = ADBILocalIO(str(tmp_path / "job"))
+    io_client.write("output/a.csv", b"a")
+    io_client.write("output/sub/b.csv", b"b")
+    io_client.write("output/c.txt", b"c")
+    io_client.write("input/d.csv", b"d")
+    return ADBIOutput(io_client)
+
+
+def test_download_all(tmp_path):
+    output = create_output(tmp_path)
+    local_dir = tmp_path / "local"
+    paths = output.download_all(str(local_dir), concurrency=2, verify=True)
+    assert sorted(paths) == sorted(os.path.join(str(local_dir), x) for x in ["a.csv", "sub/b.csv", "c.txt"])
+    assert Path(local_dir / "sub/b.csv").read_bytes() == b"b"
+
+
+def test_iter_download_with_pattern(tmp_path):
+    output = create_output(tmp_path)
+    ret = list(output.iter_download(str(tmp_path / "local"), pattern="output/*.csv"))
+    assert sorted(x[0] for x in ret) == ["output/a.csv", "output/sub/b.csv"]
+    assert not (tmp_path / "local/c.txt").exists()
+
+
+def test_iter_download_stops_when_loop_is_broken(tmp_path, mocker: MockFixture):
+    output = create_output(tmp_path)
+    download_file = mocker.spy(output.io_client, "download_file")
+    for _ in output.iter_download(str(tmp_path / "local"), concurrency=1):
+        break
+    # the next one may be started before yielding, but the rest are not
+    assert download_file.call_count <= 2
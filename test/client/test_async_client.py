@@ -0,0 +1,64 @@
+import asyncio
+
+from pytest_mock import MockFixture
+
+from spr_adbi.client.adbi_client import ADBIJob, ADBIClient
+from spr_adbi.client.async_client import AsyncADBIClient
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.const import PATH_STATUS, PATH_PROGRESS
+
+
+def create_client(mocker: MockFixture, tmp_path, statuses):
+    io_client = ADBILocalIO(str(tmp_path / "job"))
+    io_client.write("output/result.txt", b"hello" * 10)
+    statuses = list(statuses)
+
+    def read(path):
+        if path == PATH_STATUS:
+            return (statuses.pop(0) if len(statuses) > 1 else statuses[0]).encode()
+        if path == PATH_PROGRESS:
+            return f"left {len(statuses)}".encode()
+        return ADBILocalIO.read(io_client, path)
+
+    mocker.patch.object(io_client, 'read', side_effect=read)
+    client = ADBIClient('s3://dummy/adbi')
+    mocker.patch.object(client, 'request', return_value=ADBIJob(io_client.base_dir, io_client))
+    return AsyncADBIClient(client, max_workers=2)
+
+
+def test_request_and_wait(mocker: MockFixture, tmp_path):
+    async def run():
+        async with create_client(mocker, tmp_path, ["RUNNING", "RUNNING", "SUCCESS"]) as client:
+            job = await client.request('test.echo', args=["hello"])
+            assert await job.wait(timeout=5, polling_interval=0.01) is True
+            output = job.get_output()
+            assert await output.get_filenames() == ["output/result.txt"]
+            chunks = [x async for x in output.iter_chunks("output/result.txt", chunk_size=20)]
+            assert chunks == [b"hello" * 4, b"hello" * 4, b"hello" * 2]
+
+    asyncio.run(run())
+
+
+def test_events(mocker: MockFixture, tmp_path):
+    async def run():
+        async with create_client(mocker, tmp_path, ["RUNNING", "RUNNING", "ERROR"]) as client:
+            job = await client.request('test.echo')
+            events = [x async for x in job.events(timeout=5, polling_interval=0.01)]
+            assert [x.status for x in events if x.event_name == 'change_status'] == ["RUNNING", "ERROR"]
+            assert job.is_error()
+            assert not any(job.job._event_listeners.values())
+
+    asyncio.run(run())
+
+
+def test_events_removes_listeners_when_closed(mocker: MockFixture, tmp_path):
+    async def run():
+        async with create_client(mocker, tmp_path, ["RUNNING", "RUNNING", "SUCCESS"]) as client:
+            job = await client.request('test.echo')
+            events = job.events(timeout=5, polling_interval=0.01)
+            await events.__anext__()
+            assert job.job._event_listeners['change_status']
+            await events.aclose()
+            assert not any(job.job._event_listeners.values())
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+from pytest_mock import MockFixture
+
+from spr_adbi.client.adbi_client import ADBIJob, ADBIClient
+from spr_adbi.const import PATH_STATUS
+
+
+def create_client(mocker: MockFixture, status_of):
+    """status_of(args, n_requested) -> list of statuses returned by each poll"""
+    client = ADBIClient('s3://dummy/adbi')
+    requested = []
+    in_flight = []
+
+    def request(func_id, args=None):
+        requested.append(args)
+        statuses = list(status_of(args, requested.count(args)))
+        io_client = mocker.MagicMock()
+
+        def read(path):
+            if path == PATH_STATUS:
+                status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+                if status in ("SUCCESS", "ERROR") and args in in_flight:
+                    in_flight.remove(args)
+                return status.encode()
+
+        io_client.read.side_effect = read
+        in_flight.append(args)
+        assert len(in_flight) <= 2
+        return ADBIJob(f's3://dummy/adbi/{args[0]}', io_client)
+
+    mocker.patch.object(client, 'request', side_effect=request)
+    return client, requested
+
+
+def test_map_ordered(mocker: MockFixture):
+    client, requested = create_client(mocker, lambda args, n: ["RUNNING"] * (5 - int(args[0])) + ["SUCCESS"])
+    results = list(client.map('test.echo', range(5), max_in_flight=2, min_interval=0.01))
+    assert [x.index for x in results] == [0, 1, 2, 3, 4]
+    assert [x.item for x in results] == [0, 1, 2, 3, 4]
+    assert all(x.status == "SUCCESS" for x in results)
+    assert results[0].output.io_client is results[0].job.io_client
+
+
+def test_map_unordered_with_retry(mocker: MockFixture):
+    client, requested = create_client(mocker, lambda args, n: ["ERROR"] if args == ["1"] and n == 1 else ["SUCCESS"])
+    results = list(client.map('test.echo', [["0"], ["1"], ["2"]], max_in_flight=2, ordered=False, max_retry=1,
+                              min_interval=0.01))
+    assert sorted(x.index for x in results) == [0, 1, 2]
+    assert all(x.status == "SUCCESS" for x in results)
+    assert requested.count(["1"]) == 2
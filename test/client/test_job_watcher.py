@@ -0,0 +1,57 @@
+from concurrent.futures import Future
+
+from pytest_mock import MockFixture
+
+import spr_adbi.client.job_watcher as t
+from spr_adbi.client.adbi_client import ADBIJob
+from spr_adbi.const import PATH_STATUS, PATH_PROGRESS
+
+
+def create_job(mocker: MockFixture, statuses):
+    statuses = list(statuses)
+    io_client = mocker.MagicMock()
+
+    def read(path):
+        if path == PATH_STATUS:
+            return statuses.pop(0).encode() if len(statuses) > 1 else statuses[0].encode()
+        if path == PATH_PROGRESS:
+            return b"working"
+
+    io_client.read.side_effect = read
+    return ADBIJob('s3://dummy/io/dir', io_client)
+
+
+def test_wait_all(mocker: MockFixture):
+    jobs = [create_job(mocker, ["RUNNING", "SUCCESS"]), create_job(mocker, ["RUNNING", "RUNNING", "ERROR"])]
+    assert t.wait_all(jobs, timeout=5, min_interval=0.01) == [True, False]
+
+
+def test_as_completed_emits_events(mocker: MockFixture):
+    jobs = [create_job(mocker, ["RUNNING", "RUNNING", "SUCCESS"]), create_job(mocker, ["SUCCESS"])]
+    statuses = []
+    watcher = t.JobWatcher(jobs, min_interval=0.01)
+    watcher.on('change_status', lambda e: statuses.append((e.job, e.status)))
+    with watcher:
+        finished = list(watcher.as_completed(timeout=5))
+    assert finished == [jobs[1], jobs[0]]
+    assert (jobs[0], "RUNNING") in statuses
+    assert (jobs[0], "SUCCESS") in statuses
+
+
+def test_wait_all_finishes_job_failed_to_submit(mocker: MockFixture):
+    submission = Future()
+    submission.set_exception(IOError("fail to upload"))
+    failed = create_job(mocker, ["RUNNING"])
+    failed.submission = submission
+    jobs = [failed, create_job(mocker, ["SUCCESS"])]
+    assert t.wait_all(jobs, timeout=5, min_interval=0.01) == [False, True]
+    assert isinstance(failed.submission_error(), IOError)
+
+
+def test_listeners_are_removed(mocker: MockFixture):
+    finished, running = create_job(mocker, ["SUCCESS"]), create_job(mocker, ["RUNNING"])
+    with t.JobWatcher([finished, running], min_interval=0.01) as watcher:
+        assert watcher.next_completed(5) is finished
+        assert not any(finished._event_listeners.values())
+        assert running._event_listeners['change_status']
+    assert not any(running._event_listeners.values())
@@ -0,0 +1,44 @@
+import shutil
+from pathlib import Path
+
+from pytest_mock import MockFixture
+
+import spr_adbi.client.memo_cache as t
+from spr_adbi.common.adbi_io import ADBILocalIO
+
+TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
+TP = Path(TMP_DIR)
+
+
+def test_compute_memo_key():
+    TP.mkdir(parents=True, exist_ok=True)
+    try:
+        for name, data in [("a", b"1"), ("b", b"1"), ("c", b"2")]:
+            with open(TP / name, "wb") as f:
+                f.write(data)
+        key = t.compute_memo_key("f", ["x"], "in", {"k": "v"}, {"f": str(TP / "a")})
+        assert key == t.compute_memo_key("f", ("x",), b"in", {"k": b"v"}, {"f": str(TP / "b")})
+        assert key != t.compute_memo_key("f", ["x"], "in", {"k": "v"}, {"f": str(TP / "c")})
+        assert key != t.compute_memo_key("g", ["x"], "in", {"k": "v"}, {"f": str(TP / "a")})
+        assert t.compute_memo_key("f", stdin=None) == t.compute_memo_key("f", stdin="") == \
+            t.compute_memo_key("f", stdin=b"")
+    finally:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+class TestMemoCache:
+    def setup_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+        self.obj = t.MemoCache(ADBILocalIO(f"{TMP_DIR}/memo"), ttl=100)
+
+    def teardown_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def test_lookup(self, mocker: MockFixture):
+        assert self.obj.lookup("f", "key1") is None
+        self.obj.put("f", "key1", "s3://bucket/adbi/pid")
+        assert self.obj.lookup("f", "key1") == "s3://bucket/adbi/pid"
+
+        mocker.patch('spr_adbi.client.memo_cache.time', return_value=10 ** 10)
+        assert self.obj.lookup("f", "key1") is None
+        assert self.obj.evict() == 1
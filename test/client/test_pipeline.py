@@ -0,0 +1,79 @@
+import json
+
+from pytest_mock import MockFixture
+
+import spr_adbi.client.adbi_client as t
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.const import ENV_KEY_ADBI_BASE_DIR, ENV_KEY_SQS_NAME, PATH_STATUS, STATUS_SUCCESS, STATUS_ERROR, \
+    STATUS_WAITING_UPSTREAM, PATH_PIPELINE
+from spr_adbi.dispatcher.pipeline_coordinator import PipelineCoordinator
+
+
+def create_client(mocker: MockFixture, tmp_path):
+    client = t.create_client({ENV_KEY_ADBI_BASE_DIR: 's3://my_bucket/adbi', ENV_KEY_SQS_NAME: 'test-adbi.fifo'})
+    client.env_base_dir = str(tmp_path)
+    mocker.patch.object(client, '_create_writer', side_effect=lambda pid: ADBILocalIO(f"{tmp_path}/{pid}"))
+    send = mocker.patch.object(client, '_send_message', return_value=dict(MessageId='m0'))
+    return client, send
+
+
+def submit(mocker: MockFixture, tmp_path):
+    client, send = create_client(mocker, tmp_path)
+    pipeline = client.pipeline()
+    prep = pipeline.step('test.prep', args=["x"])
+    train = pipeline.step('test.train', input_from={'in.csv': prep.output('out.csv')}, name='train')
+    jobs = pipeline.submit()
+    return jobs[prep.name], jobs['train'], send
+
+
+def test_submit_enqueues_only_root_steps(mocker: MockFixture, tmp_path):
+    prep_job, train_job, send = submit(mocker, tmp_path)
+    assert send.call_count == 1
+    func_id, base_dir, options = json.loads(send.call_args[1]['MessageBody'])
+    assert (func_id, base_dir) == ('test.prep', prep_job.base_dir)
+    assert options['downstream'] == [train_job.base_dir]
+
+    assert train_job.get_status() == STATUS_WAITING_UPSTREAM
+    pipeline = json.loads(train_job.io_client.read(PATH_PIPELINE))
+    assert pipeline['upstream'] == [prep_job.base_dir]
+    assert pipeline['wiring'] == {'input/files/in.csv': f"{prep_job.base_dir}/output/out.csv"}
+
+
+def test_coordinator_enqueues_downstream(mocker: MockFixture, tmp_path):
+    prep_job, train_job, _ = submit(mocker, tmp_path)
+    coordinator = PipelineCoordinator('test-adbi.fifo')
+    send = mocker.patch.object(coordinator, 'send_message')
+
+    prep_job.io_client.write("output/out.csv", b"a,b")
+    prep_job.io_client.write(PATH_STATUS, STATUS_SUCCESS)
+    coordinator.on_finished(prep_job.base_dir, True, [train_job.base_dir])
+
+    assert train_job.io_client.read("input/files/in.csv") == b"a,b"
+    assert json.loads(send.call_args[0][0])[:2] == ['test.train', train_job.base_dir]
+    assert train_job.get_status() is None
+
+    coordinator.on_finished(prep_job.base_dir, True, [train_job.base_dir])
+    assert send.call_count == 1
+
+
+def test_coordinator_propagates_failure(mocker: MockFixture, tmp_path):
+    prep_job, train_job, _ = submit(mocker, tmp_path)
+    coordinator = PipelineCoordinator('test-adbi.fifo')
+    send = mocker.patch.object(coordinator, 'send_message')
+
+    coordinator.on_finished(prep_job.base_dir, False, [train_job.base_dir])
+    assert train_job.get_status() == STATUS_ERROR
+    assert b"upstream job failed" in train_job.io_client.read("output/__error__.txt")
+    send.assert_not_called()
+
+
+def test_coordinator_fails_downstream_when_wired_output_is_missing(mocker: MockFixture, tmp_path):
+    prep_job, train_job, _ = submit(mocker, tmp_path)
+    coordinator = PipelineCoordinator('test-adbi.fifo')
+    send = mocker.patch.object(coordinator, 'send_message')
+
+    prep_job.io_client.write(PATH_STATUS, STATUS_SUCCESS)
+    coordinator.on_finished(prep_job.base_dir, True, [train_job.base_dir])
+    assert train_job.get_status() == STATUS_ERROR
+    assert b"fail to enqueue" in train_job.io_client.read("output/__error__.txt")
+    send.assert_not_called()
@@ -0,0 +1,50 @@
+from pytest_mock import MockFixture
+
+from spr_adbi.client.adbi_client import ADBIJob
+from spr_adbi.client.polling import BackoffPolling, FixedPolling
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.const import PATH_STATE
+
+
+def test_backoff_polling():
+    strategy = BackoffPolling(initial_interval=1, max_interval=10, factor=2, jitter=0)
+    assert [strategy.next_interval(n) for n in range(6)] == [1, 2, 4, 8, 10, 10]
+    assert strategy.next_interval(0, remaining=100) == 50
+    assert strategy.next_interval(3, remaining=4) == 8
+
+    strategy = BackoffPolling(initial_interval=1, jitter=0.2)
+    assert all(0.8 <= strategy.next_interval(0) <= 1.2 for _ in range(100))
+
+
+def test_wait_backs_off_and_counts_polls(mocker: MockFixture):
+    io_client = mocker.MagicMock()
+    statuses = [b"RUNNING"] * 5 + [b"SUCCESS"]
+    io_client.read.side_effect = lambda path: statuses.pop(0) if path == "status" else None
+    sleep = mocker.patch('spr_adbi.client.adbi_client.sleep')
+    job = ADBIJob('s3://dummy/io/dir', io_client)
+
+    assert job.wait(polling_strategy=BackoffPolling(initial_interval=1, factor=2, jitter=0)) is True
+    assert [c[0][0] for c in sleep.call_args_list] == [1, 2, 4, 8, 16]
+    assert job.poll_metrics['polls'] == 6
+
+    sleep.reset_mock()
+    statuses[:] = [b"RUNNING", b"SUCCESS"]
+    job = ADBIJob('s3://dummy/io/dir', io_client)
+    job.wait(polling_interval=3)
+    assert [c[0][0] for c in sleep.call_args_list] == [3]
+
+
+def test_wait_uses_eta_from_state(mocker: MockFixture, tmp_path):
+    io_client = ADBILocalIO(str(tmp_path))
+    mocker.patch('spr_adbi.client.adbi_client.time', return_value=1000.0)
+    sleep = mocker.patch('spr_adbi.client.adbi_client.sleep',
+                         side_effect=lambda x: io_client.write(PATH_STATE, '{"status": "SUCCESS"}'))
+    io_client.write(PATH_STATE, '{"status": "RUNNING", "progress": "10%", "eta": 1200.0}')
+    job = ADBIJob(str(tmp_path), io_client, state_manifest=True)
+
+    assert job.wait(polling_strategy=BackoffPolling(initial_interval=1, jitter=0)) is True
+    sleep.assert_called_once_with(100.0)
+
+
+def test_fixed_polling():
+    assert FixedPolling(5).next_interval(10, remaining=1000) == 5
@@ -1,6 +1,15 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Event
+
+import pytest
+from pytest_mock import MockFixture
+
 import spr_adbi.client.adbi_client as t
 import spr_adbi.common.adbi_io
-from spr_adbi.const import ENV_KEY_ADBI_BASE_DIR, ENV_KEY_SQS_NAME
+from spr_adbi.common.inline_input import decode_inline_input
+from spr_adbi.const import ENV_KEY_ADBI_BASE_DIR, ENV_KEY_SQS_NAME, PATH_ARGS, PATH_STDIN, ENV_KEY_INLINE_MAX_BYTES, \
+    ENV_KEY_MEMO_EXCLUDE_FUNC_IDS
 
 WORKING_DIR = 's3://my_bucket/adbi'
 SQS_NAME = 'test-adbi.fifo'
@@ -29,3 +38,123 @@ class TestADBIClientS3:
 
     def teardown_method(self, method):
         pass
+
+    def test_request_many(self, mocker: MockFixture):
+        mocker.patch.object(self.obj, '_create_writer', side_effect=lambda pid: mocker.MagicMock(base_dir=pid))
+        send = mocker.patch.object(self.obj, '_send_message_batch', side_effect=lambda entries: dict(
+            Successful=[dict(Id=x['Id'], MessageId=f"m{x['Id']}") for x in entries]))
+
+        jobs = self.obj.request_many([dict(func_id='test.echo', args=[str(i)]) for i in range(23)])
+        assert len(jobs) == 23
+        assert [len(c[0][0]) for c in send.call_args_list] == [10, 10, 3]
+        assert jobs[22].queue_message_id == 'm22'
+        jobs[0].io_client.write.assert_called_with(PATH_ARGS, b'["0"]')
+
+    def test_request_many_partial_failure(self, mocker: MockFixture):
+        mocker.patch.object(self.obj, '_create_writer', side_effect=lambda pid: mocker.MagicMock(base_dir=pid))
+        mocker.patch.object(self.obj, '_send_message_batch', return_value=dict(
+            Successful=[dict(Id='0', MessageId='m0')], Failed=[dict(Id='1', Code='InternalError', Message='oops')]))
+
+        with pytest.raises(t.ADBIRequestError) as e:
+            self.obj.request_many([dict(func_id='test.echo'), dict(func_id='test.echo')])
+        assert e.value.jobs[0].queue_message_id == 'm0'
+        assert e.value.jobs[1] is None
+        assert 'InternalError' in e.value.errors[1]
+
+    def test_request_with_inline_input(self, mocker: MockFixture):
+        obj = t.create_client({ENV_KEY_ADBI_BASE_DIR: WORKING_DIR, ENV_KEY_SQS_NAME: SQS_NAME,
+                               ENV_KEY_INLINE_MAX_BYTES: '100'})
+        mocker.patch.object(obj, '_create_writer', side_effect=lambda pid: mocker.MagicMock(base_dir=pid))
+        send = mocker.patch.object(obj, '_send_message', return_value=dict(MessageId='m0'))
+
+        obj.request('test.echo', args=["a"], stdin="hello", input_info={"big": b"x" * 100})
+        func_id, base_dir, options = json.loads(send.call_args[1]['MessageBody'])
+        assert decode_inline_input(json.dumps(options['inline'])) == {PATH_ARGS: b'["a"]', PATH_STDIN: b"hello"}
+        obj.io_client.write.assert_called_once_with("input/files/big", b"x" * 100)
+
+    def test_request_memoize(self, mocker: MockFixture):
+        mocker.patch.object(self.obj, '_create_writer', side_effect=lambda pid: mocker.MagicMock(base_dir=pid))
+        send = mocker.patch.object(self.obj, '_send_message', return_value=dict(MessageId='m0'))
+        memo = {}
+        self.obj._memo_cache = mocker.MagicMock()
+        self.obj._memo_cache.lookup.side_effect = lambda func_id, key: memo.get((func_id, key))
+        self.obj._memo_cache.put.side_effect = lambda func_id, key, base_dir: memo.update({(func_id, key): base_dir})
+        get_status = mocker.patch.object(t.ADBIJob, 'get_status', return_value="SUCCESS")
+
+        job1 = self.obj.request('test.echo', args=["a"], memoize=True)
+        job2 = self.obj.request('test.echo', args=["a"], memoize=True)
+        assert send.call_count == 1
+        assert job2.base_dir == job1.base_dir
+        assert job2.state is None  # same layout as the client
+
+        get_status.return_value = "ERROR"
+        self.obj.request('test.echo', args=["a"], memoize=True)
+        assert send.call_count == 2
+
+        self.obj.options[ENV_KEY_MEMO_EXCLUDE_FUNC_IDS] = "test.random, test.echo"
+        get_status.return_value = "SUCCESS"
+        self.obj.request('test.echo', args=["a"], memoize=True)
+        assert send.call_count == 3
+
+    def test_request_uploads_input_files_concurrently(self, mocker: MockFixture, tmp_path):
+        barrier = Barrier(3, timeout=5)
+        writer = mocker.MagicMock(base_dir="pid")
+        writer.write_file.side_effect = lambda remote_path, path: barrier.wait()
+        mocker.patch.object(self.obj, '_create_writer', return_value=writer)
+        mocker.patch.object(self.obj, '_send_message', return_value=dict(MessageId='m0'))
+        files = {}
+        for i in range(3):
+            files[f"f{i}"] = str(tmp_path / f"f{i}")
+            (tmp_path / f"f{i}").write_bytes(b"x")
+
+        self.obj.request('test.echo', input_file_info=files)
+        assert writer.write_file.call_count == 3
+
+    def test_request_concurrently(self, mocker: MockFixture):
+        barrier = Barrier(8, timeout=5)
+
+        def send_message(MessageBody, **kwargs):
+            barrier.wait()  # all requests have created their writers
+            return dict(MessageId=json.loads(MessageBody)[1])
+
+        mocker.patch.object(self.obj, '_create_writer', side_effect=lambda pid: mocker.MagicMock(base_dir=pid))
+        mocker.patch.object(self.obj, '_send_message', side_effect=send_message)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            jobs = list(executor.map(lambda i: self.obj.request('test.echo', args=[str(i)]), range(8)))
+        assert len({job.base_dir for job in jobs}) == 8
+        assert all(job.base_dir == job.queue_message_id for job in jobs)
+
+    def test_request_async(self, mocker: MockFixture):
+        uploaded = Event()
+        writer = mocker.MagicMock(base_dir="pid")
+        writer.write.side_effect = lambda path, data: uploaded.wait(5)
+        mocker.patch.object(self.obj, '_create_writer', return_value=writer)
+        send = mocker.patch.object(self.obj, '_send_message', return_value=dict(MessageId='m0'))
+
+        job = self.obj.request_async('test.echo', args=["a"])
+        assert job.base_dir == "pid"
+        assert not job.poll()
+        send.assert_not_called()
+
+        uploaded.set()
+        job.wait_submitted(5)
+        assert send.call_count == 1
+        assert job.queue_message_id == 'm0'
+        self.obj.close()
+
+    def test_request_async_error(self, mocker: MockFixture):
+        writer = mocker.MagicMock(base_dir="pid")
+        writer.write.side_effect = IOError("fail")
+        mocker.patch.object(self.obj, '_create_writer', return_value=writer)
+        send = mocker.patch.object(self.obj, '_send_message')
+
+        job = self.obj.request_async('test.echo', args=["a"])
+        with pytest.raises(IOError):
+            job.wait(timeout=5)
+        send.assert_not_called()
+
+    def test_request_with_s3_input_file(self, mocker: MockFixture):
+        mocker.patch.object(self.obj, '_create_writer', side_effect=lambda pid: mocker.MagicMock(base_dir=pid))
+        mocker.patch.object(self.obj, '_send_message', return_value=dict(MessageId='m0'))
+        self.obj.request('test.echo', input_file_info={"data.csv": "s3://other/data.csv"})
+        self.obj.io_client.write_file.assert_called_once_with("input/files/data.csv", "s3://other/data.csv")
@@ -0,0 +1,62 @@
+import shutil
+from pathlib import Path
+
+from pytest_mock import MockFixture
+
+import spr_adbi.common.blob_store as t
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.const import PATH_INPUT_REFS
+
+TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
+BASE_DIR = TMP_DIR + "/adbi"
+TP = Path(TMP_DIR)
+
+
+class TestBlobStore:
+    def setup_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+        self.obj = t.BlobStore(ADBILocalIO(f"{BASE_DIR}/blobs"), job_base_dir=BASE_DIR)
+        self.local_path = str(TP / "model.bin")
+        with open(self.local_path, "wb") as f:
+            f.write(b"model data")
+
+    def teardown_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def test_put_file_uploads_once(self, mocker: MockFixture):
+        write_file = mocker.spy(self.obj.io_client, 'write_file')
+        uri1 = self.obj.put_file(self.local_path, "job1")
+        uri2 = self.obj.put_file(self.local_path, "job2")
+        assert uri1 == uri2
+        assert write_file.call_count == 1
+        assert t.read_blob(uri1) == b"model data"
+
+    def test_gc(self):
+        uri = self.obj.put_file(self.local_path, "job1")
+        ADBILocalIO(f"{BASE_DIR}/job1").write(PATH_INPUT_REFS, "{}")
+        assert self.obj.gc(min_age_seconds=0, ref_grace_seconds=0) == 0
+        assert t.read_blob(uri) == b"model data"
+
+        shutil.rmtree(f"{BASE_DIR}/job1")
+        assert self.obj.gc(min_age_seconds=0, ref_grace_seconds=0) == 1
+        assert t.read_blob(uri) is None
+
+    def test_gc_keeps_blob_of_job_being_submitted(self):
+        uri = self.obj.put_file(self.local_path, "job1")
+        # input_refs.json of job1 is not written yet
+        assert self.obj.gc(min_age_seconds=0) == 0
+        assert t.read_blob(uri) == b"model data"
+
+    def test_gc_keeps_blob_referenced_after_listing(self, mocker: MockFixture):
+        uri = self.obj.put_file(self.local_path, "job1")
+        self.obj.release("job1", uri.rsplit("/", 1)[1])
+        get_filenames = self.obj.io_client.get_filenames
+
+        def list_then_reference():
+            filenames = get_filenames()
+            self.obj.put_file(self.local_path, "job2")
+            return filenames
+
+        mocker.patch.object(self.obj.io_client, 'get_filenames', side_effect=list_then_reference)
+        assert self.obj.gc(min_age_seconds=0) == 0
+        assert t.read_blob(uri) == b"model data"
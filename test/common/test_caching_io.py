@@ -0,0 +1,98 @@
+import os
+import time
+
+import pytest
+from pytest_mock import MockFixture
+
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.common.caching_io import CachingADBIIO, with_cache
+from spr_adbi.const import ENV_KEY_CACHE_DIR
+
+
+def create_io(tmp_path, max_bytes=1000):
+    backend = ADBILocalIO(str(tmp_path / "job"))
+    return backend, CachingADBIIO(backend, str(tmp_path / "cache"), max_bytes=max_bytes)
+
+
+def test_read_from_cache(tmp_path, mocker: MockFixture):
+    backend, io_client = create_io(tmp_path)
+    backend.write("output/a", b"hello")
+    assert io_client.read("output/a") == b"hello"
+
+    spy = mocker.spy(backend, "_read")
+    assert io_client.read("output/a") == b"hello"
+    spy.assert_not_called()
+
+
+def test_read_validates_etag(tmp_path):
+    backend, io_client = create_io(tmp_path)
+    backend.write("output/a", b"hello")
+    assert io_client.read("output/a") == b"hello"
+
+    backend.write("output/a", b"changed")
+    os.utime(f"{backend.base_dir}/output/a", (time.time() + 10, time.time() + 10))
+    assert io_client.read("output/a") == b"changed"
+
+    backend.delete("output/a")
+    assert io_client.read("output/a") is None
+
+
+def test_open_and_download(tmp_path, mocker: MockFixture):
+    backend, io_client = create_io(tmp_path)
+    backend.write("output/a", b"hello")
+    with io_client.open("output/a") as f:
+        assert f.read() == b"hello"
+
+    spy = mocker.spy(backend, "_download_file")
+    io_client.download_file("output/a", str(tmp_path / "local/a"))
+    assert (tmp_path / "local/a").read_bytes() == b"hello"
+    spy.assert_not_called()
+
+    with pytest.raises(FileNotFoundError):
+        io_client.open("output/missing")
+
+
+def test_status_is_not_cached(tmp_path, mocker: MockFixture):
+    backend, io_client = create_io(tmp_path)
+    io_client.write("status", "RUNNING")
+    spy = mocker.spy(backend, "_read")
+    assert io_client.read("status") == b"RUNNING"
+    assert io_client.read("status") == b"RUNNING"
+    assert spy.call_count == 2
+
+
+def test_evict_least_recently_used(tmp_path):
+    backend, io_client = create_io(tmp_path, max_bytes=250)
+    for name in ["a", "b", "c"]:
+        backend.write(f"output/{name}", name.encode() * 100)
+    io_client.read("output/a")
+    io_client.read("output/b")
+    entry_a = os.listdir(io_client._entry_dir("output/a"))[0]
+    os.utime(f"{io_client._entry_dir('output/a')}/{entry_a}", (time.time() - 100, time.time() - 100))
+    io_client.read("output/c")
+
+    assert not os.path.exists(io_client._entry_dir("output/a"))
+    assert os.path.exists(io_client._entry_dir("output/b"))
+    assert os.path.exists(io_client._entry_dir("output/c"))
+
+
+
+def test_evict_is_throttled(tmp_path, mocker: MockFixture):
+    backend, io_client = create_io(tmp_path, max_bytes=10000)
+    evict = mocker.spy(io_client, 'evict')
+    for name in ["a", "b", "c"]:
+        backend.write(f"output/{name}", name.encode() * 100)
+        io_client.read(f"output/{name}")
+    assert evict.call_count == 1
+
+    # more than EVICT_PENDING_RATIO of max_bytes is stored
+    backend.write("output/d", b"d" * 1000)
+    io_client.read("output/d")
+    assert evict.call_count == 2
+
+def test_with_cache(tmp_path, monkeypatch):
+    backend = ADBILocalIO(str(tmp_path / "job"))
+    monkeypatch.delenv(ENV_KEY_CACHE_DIR, raising=False)
+    assert with_cache(backend) is backend
+    monkeypatch.setenv(ENV_KEY_CACHE_DIR, str(tmp_path / "cache"))
+    assert isinstance(with_cache(backend), CachingADBIIO)
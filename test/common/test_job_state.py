@@ -0,0 +1,50 @@
+from pytest_mock import MockFixture
+
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.common.job_state import JobState
+
+
+def test_update_keeps_changes_of_other_writer(tmp_path):
+    manager_state = JobState(ADBILocalIO(str(tmp_path)))
+    manager_state.start_run(1, "RUNNING")
+
+    worker_state = JobState(ADBILocalIO(str(tmp_path)))
+    worker_state.load()
+    worker_state.update(progress="50%", eta=100.0)
+
+    # manager's in-memory copy is stale here
+    manager_state.update(status="ERROR")
+    manager_state.end_run()
+
+    state = JobState(ADBILocalIO(str(tmp_path)))
+    state.load()
+    assert state.status == "ERROR"
+    assert state.progress == "50%"
+    assert state.data['eta'] == 100.0
+    assert state.runs[0]['status'] == "ERROR"
+
+
+def test_update_retries_on_conflict(tmp_path, mocker: MockFixture):
+    io_client = ADBILocalIO(str(tmp_path))
+    state = JobState(io_client)
+    state.update(status="RUNNING")
+    write_if_match = io_client.write_if_match
+
+    def conflict_once(path, data, etag):
+        mocker.patch.object(io_client, 'write_if_match', side_effect=write_if_match)
+        JobState(ADBILocalIO(str(tmp_path))).update(progress="other")
+        return write_if_match(path, data, etag)
+
+    mocker.patch.object(io_client, 'write_if_match', side_effect=conflict_once)
+    state.update(status="SUCCESS")
+    assert state.data == dict(state.data, status="SUCCESS", progress="other")
+
+
+def test_write_if_match(tmp_path):
+    io_client = ADBILocalIO(str(tmp_path))
+    etag = io_client.write_if_match("a.json", "1", None)
+    assert etag is not None
+    assert io_client.write_if_match("a.json", "2", None) is None
+    assert io_client.write_if_match("a.json", "22", etag) is not None
+    assert io_client.write_if_match("a.json", "3", etag) is None
+    assert io_client.read("a.json") == b"22"
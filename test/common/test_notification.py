@@ -0,0 +1,97 @@
+import shutil
+from pathlib import Path
+from threading import Thread
+from time import time
+
+from pytest_mock import MockFixture
+
+import spr_adbi.common.notification as t
+from spr_adbi.client.adbi_client import ADBIJob
+from spr_adbi.const import ENV_KEY_REPLY_TO
+from spr_adbi.worker.adbi_worker import create_worker
+
+TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
+WORKING_DIR = TMP_DIR + "/working"
+
+
+def setup_function(function):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+def teardown_function(function):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+def test_file_notification_channel():
+    channel = t.create_notification_channel(f"file://{TMP_DIR}/notification")
+    assert isinstance(channel, t.FileNotificationChannel)
+    channel.notify("s3://dummy/job1", status="RUNNING")
+    channel.notify("s3://dummy/job1", progress="50%")
+    messages = channel.receive(0)
+    assert [x.get('status') for x in messages] == ["RUNNING", None]
+    assert [x.get('progress') for x in messages] == [None, "50%"]
+    assert channel.receive(0.05) == []
+
+
+def test_receiver_routes_by_base_dir():
+    channel = t.MemoryNotificationChannel("test_receiver_routes_by_base_dir")
+    receiver = t.NotificationReceiver(channel, wait_time_seconds=0.1)
+    receiver.register("job1")
+    receiver.register("job2")
+    channel.notify("job1", status="RUNNING")
+    channel.notify("job2", status="SUCCESS")
+    assert [x['status'] for x in receiver.wait("job2", 1)] == ["SUCCESS"]
+    assert [x['status'] for x in receiver.wait("job1", 1)] == ["RUNNING"]
+    assert receiver.wait("job1", 0.05) == []
+
+
+def test_receiver_drops_messages_of_unregistered_jobs():
+    channel = t.MemoryNotificationChannel("test_receiver_drops_messages_of_unregistered_jobs")
+    receiver = t.NotificationReceiver(channel, wait_time_seconds=0.1)
+    receiver.register("job1")
+    for i in range(t.MAX_BUFFERED_MESSAGES + 10):
+        channel.notify("job1", progress=str(i))
+    channel.notify("job2", status="SUCCESS")
+    channel.notify("job1", status="SUCCESS")
+    assert receiver.wait("job1", 1)[-1]['status'] == "SUCCESS"
+    receiver.wait("job1", 0.2)
+    assert "job2" not in receiver._buffers
+    assert all(len(x) <= t.MAX_BUFFERED_MESSAGES for x in receiver._buffers.values())
+
+    receiver.unregister("job1")
+    channel.notify("job1", progress="late")
+    receiver.wait("job3", 0.2)
+    assert receiver._buffers == {}
+
+
+def test_job_wait_by_notification(mocker: MockFixture):
+    reply_to = "memory://test_job_wait_by_notification"
+    mocker.patch.dict('os.environ', {ENV_KEY_REPLY_TO: reply_to})
+    worker = create_worker([WORKING_DIR])
+    job = ADBIJob(WORKING_DIR, worker.io_client, notification_receiver=t.get_notification_receiver(reply_to))
+
+    def run_worker():
+        worker.set_progress("half")
+        worker.success(dict(result="ok"))
+
+    start_time = time()
+    Thread(target=run_worker).start()
+    assert job.wait(timeout=10, polling_interval=5) is True
+    assert time() - start_time < 3
+
+
+def test_job_unregisters_when_finished(mocker: MockFixture):
+    reply_to = "memory://test_job_unregisters_when_finished"
+    mocker.patch.dict('os.environ', {ENV_KEY_REPLY_TO: reply_to})
+    receiver = t.get_notification_receiver(reply_to)
+    worker = create_worker([WORKING_DIR])
+    job = ADBIJob(WORKING_DIR, worker.io_client, notification_receiver=receiver)
+    assert WORKING_DIR in receiver._registered
+    worker.success()
+    assert job.wait(timeout=10, polling_interval=0.1) is True
+    assert WORKING_DIR not in receiver._registered
+
+    job = ADBIJob(WORKING_DIR, worker.io_client, notification_receiver=receiver)
+    assert WORKING_DIR in receiver._registered
+    del job
+    assert WORKING_DIR not in receiver._registered
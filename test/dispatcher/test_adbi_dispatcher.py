@@ -0,0 +1,75 @@
+import json
+
+from pytest_mock import MockFixture
+
+from spr_adbi.const import ENV_KEY_SQS_NAME, ENV_KEY_MAX_WORKER, MESSAGE_OPTION_DOWNSTREAM
+from spr_adbi.dispatcher.adbi_dispatcher import ADBIDispatcher, QueueMessage, SQS_WAIT_TIME_SECONDS
+
+
+def create_dispatcher(mocker: MockFixture, max_worker=4):
+    dispatcher = ADBIDispatcher(mocker.MagicMock(), mocker.MagicMock(),
+                                {ENV_KEY_SQS_NAME: "test.fifo", ENV_KEY_MAX_WORKER: str(max_worker),
+                                 'AWS_REGION': 'ap-northeast-1'})
+    dispatcher._queue = mocker.MagicMock()
+    return dispatcher
+
+
+def create_message(mocker: MockFixture, body, receipt_handle="r"):
+    return mocker.MagicMock(body=json.dumps(body), receipt_handle=receipt_handle)
+
+
+def test_fetch_message_prefetches_by_long_polling(mocker: MockFixture):
+    dispatcher = create_dispatcher(mocker, max_worker=3)
+    dispatcher.scheduler._n_running = 1
+    messages = [create_message(mocker, ["f", f"s3://b/{i}"]) for i in range(2)]
+    illegal = create_message(mocker, {"illegal": True})
+    dispatcher.queue.receive_messages.side_effect = [[], [illegal] + messages]
+    mocker.patch.object(dispatcher, '_start_visibility_thread')
+
+    assert dispatcher.fetch_message().s3_uri == "s3://b/0"
+    assert dispatcher.fetch_message().s3_uri == "s3://b/1"
+    assert dispatcher.queue.receive_messages.call_count == 2
+    kwargs = dispatcher.queue.receive_messages.call_args[1]
+    assert kwargs['MaxNumberOfMessages'] == 2
+    assert kwargs['WaitTimeSeconds'] == SQS_WAIT_TIME_SECONDS
+    illegal.delete.assert_called_once()
+
+
+def test_fetch_message_deletes_message_not_json(mocker: MockFixture):
+    dispatcher = create_dispatcher(mocker)
+    broken = mocker.MagicMock(body="not json", receipt_handle="r")
+    dispatcher.queue.receive_messages.return_value = [broken, create_message(mocker, ["f", "s3://b/0"])]
+    start_visibility_thread = mocker.patch.object(dispatcher, '_start_visibility_thread')
+
+    assert dispatcher.fetch_message().s3_uri == "s3://b/0"
+    broken.delete.assert_called_once()
+    start_visibility_thread.assert_called_once()
+
+
+def test_extend_visibility(mocker: MockFixture):
+    dispatcher = create_dispatcher(mocker)
+    dispatcher.queue.receive_messages.return_value = [
+        create_message(mocker, ["f", f"s3://b/{i}"], receipt_handle=f"r{i}") for i in range(12)]
+    mocker.patch.object(dispatcher, '_start_visibility_thread')
+    pool = mocker.patch.object(ADBIDispatcher, 'client_pool')
+    dispatcher.fetch_message()
+
+    dispatcher.extend_visibility()
+    calls = pool.sqs.return_value.change_message_visibility_batch.call_args_list
+    assert [len(c[1]['Entries']) for c in calls] == [10, 1]
+    assert calls[1][1]['Entries'][0]['ReceiptHandle'] == "r11"
+
+
+def test_handle_message_runs_on_scheduler(mocker: MockFixture):
+    dispatcher = create_dispatcher(mocker, max_worker=1)
+    manager = dispatcher.manager_factory.return_value
+    manager.run.return_value = True
+    coordinator = mocker.patch.object(ADBIDispatcher, 'pipeline_coordinator')
+    message = QueueMessage(mocker.MagicMock(), "f", "s3://b/0", {MESSAGE_OPTION_DOWNSTREAM: ["s3://b/1"]}, 0.0)
+
+    assert dispatcher.handle_message(message, mocker.MagicMock()).result() is True
+    message.message.delete.assert_called_once()
+    dispatcher.control_pool.shutdown(wait=True)
+    coordinator.on_finished.assert_called_once_with("s3://b/0", True, ["s3://b/1"])
+    assert dispatcher.free_slots == 1
+    assert dispatcher.metrics()['finished'] == 1
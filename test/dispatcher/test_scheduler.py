@@ -0,0 +1,34 @@
+from threading import Event
+from time import time
+
+import pytest
+
+from spr_adbi.dispatcher.scheduler import JobScheduler
+
+
+def test_scheduler_limits_running_jobs():
+    scheduler = JobScheduler(2)
+    release = Event()
+    futures = [scheduler.submit(release.wait) for _ in range(2)]
+    assert scheduler.free_slots == 0
+    assert not scheduler.wait_for_slot(timeout=0.01)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(release.wait)
+
+    release.set()
+    [f.result() for f in futures]
+    assert scheduler.wait_for_slot(timeout=1)
+    assert scheduler.free_slots == 2
+    scheduler.shutdown()
+
+
+def test_scheduler_metrics():
+    scheduler = JobScheduler(1)
+    assert scheduler.submit(lambda x: x * 2, 3, received_time=time() - 10).result() == 6
+    scheduler.shutdown()
+
+    metrics = scheduler.metrics()
+    assert metrics['started'] == metrics['finished'] == 1
+    assert metrics['running'] == 0
+    assert metrics['avg_queue_wait'] >= 10
+    assert metrics['max_queue_wait'] >= 10
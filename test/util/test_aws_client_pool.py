@@ -0,0 +1,31 @@
+from pytest_mock import MockFixture
+
+import spr_adbi.util.aws_client_pool as t
+
+
+def test_get_client_pool_is_shared():
+    t.clear_client_pools()
+    pool = t.get_client_pool(region_name='ap-northeast-1')
+    assert pool is t.get_client_pool(region_name='ap-northeast-1')
+    assert pool is not t.get_client_pool(region_name='us-east-1')
+    assert pool.s3() is pool.s3()
+    assert pool.s3() is not pool.sqs()
+
+
+def test_get_queue_url_is_cached(mocker: MockFixture):
+    pool = t.AWSClientPool(region_name='ap-northeast-1')
+    sqs = mocker.MagicMock()
+    sqs.get_queue_url.return_value = dict(QueueUrl='https://sqs/test')
+    mocker.patch.object(pool, 'sqs', return_value=sqs)
+    assert pool.get_queue_url('test') == 'https://sqs/test'
+    assert pool.get_queue_url('test') == 'https://sqs/test'
+    assert sqs.get_queue_url.call_count == 1
+
+
+def test_s3_is_not_retried_by_botocore():
+    pool = t.AWSClientPool(region_name='ap-northeast-1')
+    assert pool.s3().meta.config.retries['total_max_attempts'] == 1
+    assert pool.sqs().meta.config.retries['mode'] == 'adaptive'
+    assert pool.s3_transfer().meta.config.retries['mode'] == 'standard'
+    assert pool.s3_transfer() is pool.s3_transfer()
+    assert pool.s3_transfer() is not pool.s3()
@@ -0,0 +1,169 @@
+from hashlib import md5
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from pytest_mock import MockFixture
+
+import spr_adbi.util.s3_util as t
+
+DATA = bytes(range(256)) * 100
+
+
+def create_s3(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.head_object.return_value = dict(ContentLength=len(DATA))
+
+    def get_object(Bucket, Key, Range):
+        start = int(Range[len("bytes="):-1])
+        return dict(Body=BytesIO(DATA[start:]))
+
+    s3.get_object.side_effect = get_object
+    return s3
+
+
+def test_open_s3_object(mocker: MockFixture):
+    s3 = create_s3(mocker)
+    with t.open_s3_object(s3, "s3://bucket/key", buffer_size=1000) as f:
+        assert f.read(10) == DATA[:10]
+        f.seek(20000)
+        assert f.read(100) == DATA[20000:20100]
+        f.seek(-5, 2)
+        assert f.read() == DATA[-5:]
+    assert [c[1]['Range'] for c in s3.get_object.call_args_list] == ["bytes=0-", "bytes=20000-", "bytes=25595-"]
+
+
+def test_open_s3_object_not_found(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.head_object.side_effect = ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+    with pytest.raises(FileNotFoundError):
+        t.open_s3_object(s3, "s3://bucket/key")
+
+
+def test_s3_multipart_writer_small(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    with t.S3MultipartWriter(s3, "s3://bucket/key", part_size=t.S3_MIN_PART_SIZE) as f:
+        f.write(b"abc")
+        f.write(b"def")
+    s3.put_object.assert_called_once()
+    assert s3.put_object.call_args[1]['Body'] == b"abcdef"
+    s3.create_multipart_upload.assert_not_called()
+
+
+def test_s3_multipart_writer_large(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.create_multipart_upload.return_value = dict(UploadId="u1")
+    s3.upload_part.side_effect = lambda **kwargs: dict(ETag=f"e{kwargs['PartNumber']}")
+    part_size = t.S3_MIN_PART_SIZE
+    with t.S3MultipartWriter(s3, "s3://bucket/key", part_size=part_size, max_concurrency=2) as f:
+        for _ in range(5):
+            f.write(b"x" * (part_size // 2 + 1))
+
+    assert s3.upload_part.call_count == 3
+    parts = s3.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts']
+    assert parts == [dict(PartNumber=i, ETag=f"e{i}") for i in (1, 2, 3)]
+    s3.put_object.assert_not_called()
+
+
+def test_s3_multipart_writer_abort(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.create_multipart_upload.return_value = dict(UploadId="u1")
+    s3.upload_part.return_value = dict(ETag="e")
+    with pytest.raises(RuntimeError):
+        with t.S3MultipartWriter(s3, "s3://bucket/key", part_size=t.S3_MIN_PART_SIZE) as f:
+            f.write(b"x" * t.S3_MIN_PART_SIZE)
+            raise RuntimeError("oops")
+    s3.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", UploadId="u1")
+    s3.complete_multipart_upload.assert_not_called()
+
+
+
+def test_s3_multipart_writer_retries_part(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.create_multipart_upload.return_value = dict(UploadId="u1")
+    throttled = ClientError({'Error': {'Code': 'SlowDown'}}, 'UploadPart')
+    s3.upload_part.side_effect = [throttled, dict(ETag="e1")]
+    with t.S3MultipartWriter(s3, "s3://bucket/key", part_size=t.S3_MIN_PART_SIZE, retry_base_wait=0) as f:
+        f.write(b"x" * t.S3_MIN_PART_SIZE)
+    assert s3.upload_part.call_count == 2
+    assert s3.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts'] == [dict(PartNumber=1, ETag="e1")]
+
+
+def test_call_with_retry_raises_client_error_immediately(mocker: MockFixture):
+    function = mocker.MagicMock(side_effect=ClientError({'Error': {'Code': 'PreconditionFailed'},
+                                                         'ResponseMetadata': {'HTTPStatusCode': 412}}, 'PutObject'))
+    with pytest.raises(ClientError):
+        t.call_with_retry(function, base_wait=0)
+    assert function.call_count == 1
+
+    function = mocker.MagicMock(side_effect=[ClientError({'Error': {'Code': 'InternalError'},
+                                                          'ResponseMetadata': {'HTTPStatusCode': 500}}, 'GetObject'),
+                                             "ok"])
+    assert t.call_with_retry(function, base_wait=0) == "ok"
+
+
+def test_call_with_retry_retries_only_connection_errors(mocker: MockFixture):
+    function = mocker.MagicMock(side_effect=FileNotFoundError("local"))
+    with pytest.raises(FileNotFoundError):
+        t.call_with_retry(function, base_wait=0)
+    assert function.call_count == 1
+
+    function = mocker.MagicMock(side_effect=[EndpointConnectionError(endpoint_url="https://s3"), "ok"])
+    assert t.call_with_retry(function, base_wait=0) == "ok"
+
+
+def test_s3_multipart_writer_not_closed_is_aborted(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.create_multipart_upload.return_value = dict(UploadId="u1")
+    s3.upload_part.return_value = dict(ETag="e")
+    f = t.S3MultipartWriter(s3, "s3://bucket/key", part_size=t.S3_MIN_PART_SIZE)
+    f.write(b"x" * (t.S3_MIN_PART_SIZE + 1))
+    del f
+    s3.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", UploadId="u1")
+    s3.complete_multipart_upload.assert_not_called()
+    s3.put_object.assert_not_called()
+
+def test_compute_etag(tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(DATA)
+    assert t.compute_etag(str(path)) == '"%s"' % md5(DATA).hexdigest()
+    digests = md5(DATA[:10000]).digest() + md5(DATA[10000:20000]).digest() + md5(DATA[20000:]).digest()
+    assert t.compute_etag(str(path), 10000) == '"%s-3"' % md5(digests).hexdigest()
+
+
+def test_is_md5_etag():
+    assert t.is_md5_etag('"%s"' % md5(DATA).hexdigest())
+    assert t.is_md5_etag('"%s-3"' % md5(DATA).hexdigest())
+    assert not t.is_md5_etag('"%s"' % ("x" * 32))  # SSE-C
+    assert not t.is_md5_etag(None)
+
+
+def test_delete_files_on_s3(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.delete_objects.return_value = dict(Errors=[dict(Key="k5", Message="AccessDenied")])
+    failed = t.delete_files_on_s3(s3, "bucket", (f"k{i}" for i in range(2500)))
+    assert [len(c[1]['Delete']['Objects']) for c in s3.delete_objects.call_args_list] == [1000, 1000, 500]
+    assert failed == ["k5"] * 3
+
+
+def test_delete_file_on_s3(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    t.delete_file_on_s3(s3, "s3://bucket/a/b")
+    s3.delete_object.assert_called_once_with(Bucket="bucket", Key="a/b")
+
+
+def test_iter_paths(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    s3.list_objects_v2.side_effect = [
+        dict(Contents=[dict(Key="p/a")], IsTruncated=True, NextContinuationToken="token"),
+        dict(Contents=[dict(Key="p/b")], IsTruncated=False),
+    ]
+    assert list(t.iter_paths(s3, "s3://bucket/p/")) == ["p/a", "p/b"]
+    assert s3.list_objects_v2.call_args_list[1][1] == dict(Bucket="bucket", Prefix="p/", ContinuationToken="token")
+
+
+def test_copy_on_s3(mocker: MockFixture):
+    s3 = mocker.MagicMock()
+    t.copy_on_s3(s3, "s3://src/a/b", "s3://dst/c")
+    s3.copy.assert_called_once_with(dict(Bucket="src", Key="a/b"), "dst", "c", ExtraArgs=t.UPLOAD_EXTRA_ARGS,
+                                    Config=None)
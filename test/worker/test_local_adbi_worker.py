@@ -1,10 +1,12 @@
 import json
 import shutil
+from base64 import b64encode
 from pathlib import Path
 from pytest_mock import MockFixture
 
 import spr_adbi.worker.adbi_worker as t
 from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.const import ENV_KEY_STATE_MANIFEST, PATH_STATE, ENV_KEY_INLINE_INPUT, ENV_KEY_INPUT_REFS
 
 TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
 WORKING_DIR = TMP_DIR + "/working"
@@ -53,6 +55,16 @@ class TestLocalADBIWorker:
             f.write(data)
         assert self.obj.read("input/hogehoge") == data
 
+    def test_open(self):
+        self.in_dir.mkdir(parents=True)
+        data = b"0123456789" * 1000
+        with open(self.in_dir / "large", "wb") as f:
+            f.write(data)
+        with self.obj.open("input/large") as f:
+            f.seek(5000)
+            assert f.read(10) == data[5000:5010]
+        assert b"".join(self.obj.iter_chunks("input/large", chunk_size=3000)) == data
+
     def test_write(self):
         data = b"adbi_worker1"
         self.obj.write("output/my_name", data)
@@ -94,6 +106,36 @@ class TestLocalADBIWorker:
         assert read_wp("status", "rt") == "ERROR"
         assert read_wp("output/__error__.txt", "rt") == "Oh!"
 
+    def test_state_manifest(self, mocker: MockFixture):
+        mocker.patch.dict('os.environ', {ENV_KEY_STATE_MANIFEST: '1'})
+        obj = t.create_worker([WORKING_DIR])
+        obj.set_progress("half")
+        obj.success()
+        state = json.loads(read_wp(PATH_STATE, "rt"))
+        assert state['status'] == "SUCCESS"
+        assert state['progress'] == "half"
+        assert state['progress_log'][0]['message'] == "half"
+        assert not (WP / "status").exists()
+        assert not (WP / "progress").exists()
+
+    def test_inline_input(self, mocker: MockFixture):
+        inline = {"input/args": b64encode(b'["x"]').decode(), "input/files/a": b64encode(b"aaa").decode()}
+        mocker.patch.dict('os.environ', {ENV_KEY_INLINE_INPUT: json.dumps(inline)})
+        obj = t.create_worker([WORKING_DIR])
+        assert obj.args() == ["x"]
+        assert obj.read("input/files/a") == b"aaa"
+        assert obj.get_input_filenames() == ["input/args", "input/files/a"]
+
+    def test_input_refs(self, mocker: MockFixture):
+        blob_dir = TP / "blobs/sha256"
+        blob_dir.mkdir(parents=True)
+        with open(blob_dir / "abc", "wb") as f:
+            f.write(b"shared")
+        mocker.patch.dict('os.environ', {ENV_KEY_INPUT_REFS: json.dumps({"input/files/m": str(blob_dir / "abc")})})
+        obj = t.create_worker([WORKING_DIR])
+        assert obj.read("input/files/m") == b"shared"
+        assert obj.get_input_filenames() == ["input/files/m"]
+
     def test_get_input_filenames(self):
         self.in_dir.mkdir(parents=True)
         for name in ["file1", "xyz"]:
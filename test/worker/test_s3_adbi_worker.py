@@ -3,6 +3,7 @@ import shutil
 from pathlib import Path
 from time import time
 
+import pytest
 from pytest_mock import MockFixture
 
 import spr_adbi.worker.adbi_worker as t
@@ -38,7 +39,7 @@ class TestS3ADBIWorker:
 
     def test_get_input_filenames(self, mocker: MockFixture):
         files = ["/my/path/input/file1", "/my/path/input/xyz"]
-        mocker.patch('spr_adbi.util.s3_util.list_paths', return_value=files)
+        mocker.patch('spr_adbi.util.s3_util.iter_paths', return_value=iter(files))
         filenames = list(sorted(self.obj.get_input_filenames()))
         assert "input/file1" == filenames[0]
         assert "input/xyz" == filenames[1]
@@ -52,3 +53,23 @@ class TestS3ADBIWorker:
         self.obj.io_client.write.assert_any_call(PATH_PROGRESS, msg)
         self.obj.io_client.write.assert_any_call(PATH_PROGRESS_LOG, json.dumps([dict(time=888, message=msg)]))
         assert self.obj.progress_log == [dict(time=888, message=msg)]
+
+
+def test_s3_io_write_raises_when_upload_fails(mocker: MockFixture):
+    obj = ADBIS3IO(WORKING_DIR)
+    obj.retry_base_wait = 0
+    upload = mocker.patch('spr_adbi.common.adbi_io.upload_fileobj_to_s3', side_effect=RuntimeError("network"))
+    with pytest.raises(RuntimeError):
+        obj.write("output/x", b"data")
+    # each request of the managed transfer is retried by botocore, not by ADBIS3IO
+    assert upload.call_count == 1
+    assert upload.call_args[0][0] is obj.transfer_client
+
+
+def test_s3_io_write_file_copies_s3_source(mocker: MockFixture):
+    obj = ADBIS3IO(WORKING_DIR)
+    copy = mocker.patch('spr_adbi.common.adbi_io.copy_on_s3')
+    upload = mocker.patch('spr_adbi.common.adbi_io.upload_file_to_s3')
+    obj.write_file("output/x", "s3://other/data.csv")
+    copy.assert_called_once_with(obj.transfer_client, "s3://other/data.csv", f"{WORKING_DIR}/output/x", obj.transfer_config)
+    upload.assert_not_called()
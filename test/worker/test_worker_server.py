@@ -0,0 +1,77 @@
+import json
+import shutil
+from io import StringIO
+from pathlib import Path
+
+from spr_adbi.common.caching_io import CachingADBIIO
+from spr_adbi.const import SERVE_RESULT_MARKER, ENV_KEY_STATE_MANIFEST, PATH_STATE, STATUS_ERROR, ENV_KEY_CACHE_DIR
+from spr_adbi.worker.adbi_worker import ADBIWorker
+from spr_adbi.worker.worker_server import serve_worker, current_rss
+
+TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
+
+
+def request(storage_dir, *args, env=None):
+    return json.dumps(dict(args=[storage_dir, *args], env=env or {})) + "\n"
+
+
+def results(output: StringIO):
+    return [json.loads(line[len(SERVE_RESULT_MARKER):]) for line in output.getvalue().splitlines()
+            if line.startswith(SERVE_RESULT_MARKER)]
+
+
+class TestWorkerServer:
+    def setup_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def teardown_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def test_serve_jobs(self):
+        calls = []
+
+        def handler(worker: ADBIWorker):
+            calls.append(worker)
+            if worker.args() == ["fail"]:
+                raise ValueError("failed")
+            worker.success({"out.txt": worker.args()[0]})
+
+        stream = StringIO(request(f"{TMP_DIR}/a", "x", env={ENV_KEY_STATE_MANIFEST: '1'}) + "\n" +
+                          request(f"{TMP_DIR}/b", "fail") + request(f"{TMP_DIR}/c", "y"))
+        output = StringIO()
+        assert serve_worker(handler, max_jobs=0, input_stream=stream, output_stream=output) == 3
+        assert results(output) == [dict(success=True, exit=False), dict(success=False, exit=False),
+                                   dict(success=True, exit=False)]
+        assert (Path(TMP_DIR) / "a/output/out.txt").read_text() == "x"
+        assert (Path(TMP_DIR) / "a" / PATH_STATE).exists()
+        assert (Path(TMP_DIR) / "b/status").read_text() == STATUS_ERROR
+        assert "failed" in (Path(TMP_DIR) / "b/output/__error__.txt").read_text()
+        assert calls[1].state is None
+        assert calls[0].serving
+
+    def test_exit_by_limits(self):
+        stream = StringIO(request(f"{TMP_DIR}/a") * 3)
+        output = StringIO()
+        assert serve_worker(lambda w: None, max_jobs=2, input_stream=stream, output_stream=output) == 2
+        assert results(output)[-1] == dict(success=True, exit=True)
+
+        stream = StringIO(request(f"{TMP_DIR}/a") * 3)
+        assert serve_worker(lambda w: None, max_jobs=0, max_rss_bytes=1, input_stream=stream,
+                            output_stream=StringIO()) == 1
+        assert current_rss() > 0
+
+    def test_cache_dir_from_job_env(self):
+        cache_dir = f"{TMP_DIR}/cache"
+        calls = []
+
+        def handler(worker: ADBIWorker):
+            calls.append(worker)
+            worker.read("input/data")
+
+        Path(TMP_DIR, "a/input").mkdir(parents=True)
+        Path(TMP_DIR, "a/input/data").write_bytes(b"data")
+        stream = StringIO(request(f"{TMP_DIR}/a", env={ENV_KEY_CACHE_DIR: cache_dir}))
+        serve_worker(handler, max_jobs=0, input_stream=stream, output_stream=StringIO())
+        assert isinstance(calls[0].io_client, CachingADBIIO)
+        assert calls[0].io_client.cache_dir == cache_dir
+        assert list(Path(cache_dir, "entries").rglob("*"))
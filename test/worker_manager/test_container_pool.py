@@ -0,0 +1,72 @@
+from time import sleep
+
+from pytest_mock import MockFixture
+
+from spr_adbi.dispatcher.container_pool import ContainerPool, split_environment, IDLE_ENTRYPOINT, POOL_LABEL
+from spr_adbi.dispatcher.resolver import WorkerInfo
+
+
+def create_pool(mocker: MockFixture, pool_size=1, max_jobs_per_container=2, exit_code=0):
+    docker_client = mocker.MagicMock()
+    docker_client.containers.run.side_effect = lambda *args, **kwargs: mocker.MagicMock(
+        **{'exec_run.return_value': (exit_code, (b"out", b"err" if exit_code else None))})
+    worker_info = WorkerInfo("image", ["run"], pool_size=pool_size, max_jobs_per_container=max_jobs_per_container)
+    return ContainerPool(worker_info, docker_client, dict(mem_limit="1g", working_dir="/app"))
+
+
+def wait_idle(pool: ContainerPool, n):
+    for _ in range(100):
+        if pool.n_idle() == n and pool._n_starting == 0:
+            return
+        sleep(0.01)
+    assert pool.n_idle() == n
+
+
+def test_pool_reuses_container(mocker: MockFixture):
+    pool = create_pool(mocker)
+    assert pool.run(["run", "s3://b/0"], environment={"A": "a"}) == (True, b"out", None)
+    wait_idle(pool, 1)
+    args, kwargs = pool.docker_client.containers.run.call_args_list[0]
+    assert kwargs['entrypoint'] == IDLE_ENTRYPOINT and kwargs['detach'] and kwargs['mem_limit'] == "1g"
+    assert kwargs['labels'] == {POOL_LABEL: "1"}
+    n_started = pool.docker_client.containers.run.call_count
+
+    container = pool._idle[0]
+    pool.run(["run", "s3://b/1"])
+    assert container.container.exec_run.call_args[0][0] == ["run", "s3://b/1"]
+    assert container.container.exec_run.call_args[1]['workdir'] == "/app"
+    wait_idle(pool, 1)
+    # recycled after max_jobs_per_container
+    container.container.remove.assert_called_once()
+    assert pool._idle[0] is not container
+    assert pool.docker_client.containers.run.call_count == n_started + 1
+    pool.close()
+    assert pool.n_idle() == 0
+
+
+def test_pool_starts_only_pool_size_containers(mocker: MockFixture):
+    pool = create_pool(mocker, pool_size=2, max_jobs_per_container=100)
+    for i in range(5):
+        assert pool.run(["run", f"s3://b/{i}"])[0]
+    wait_idle(pool, 2)
+    assert pool.docker_client.containers.run.call_count == 2
+    assert sum(c.n_jobs for c in pool._idle) == 5
+    pool.close()
+
+
+def test_pool_recycles_failed_container(mocker: MockFixture):
+    pool = create_pool(mocker, pool_size=1, exit_code=2)
+    wait_idle(pool, 0)
+    pool.fill()
+    wait_idle(pool, 1)
+    container = pool._idle[0]
+    success, stdout, stderr = pool.run(["run", "s3://b/0"])
+    assert not success and stderr == "err"
+    container.container.remove.assert_called_once_with(force=True)
+    wait_idle(pool, 1)
+    assert pool._idle[0] is not container
+
+
+def test_split_environment():
+    assert split_environment(dict(environment=["A=a=b"], mem_limit="1g")) == (dict(mem_limit="1g"), {"A": "a=b"})
+    assert split_environment(None) == ({}, {})
@@ -0,0 +1,49 @@
+import sys
+
+from spr_adbi.dispatcher.container import LocalProcessContainerManager, AWSContainerManager, parse_bytes
+from spr_adbi.dispatcher.resolver import WorkerInfo, EXECUTOR_LOCAL
+from spr_adbi.dispatcher.worker_manager import WorkerManager
+
+
+def create_manager(code):
+    worker_info = WorkerInfo(None, [sys.executable, "-c", code], executor=EXECUTOR_LOCAL)
+    return LocalProcessContainerManager(worker_info, "/tmp/job")
+
+
+def test_run_process():
+    manager = create_manager("import os, sys; print(sys.argv[1], os.environ['A']); print('warn', file=sys.stderr)")
+    success, stdout, stderr = manager.run_container(dict(environment=["A=a"]))
+    assert success
+    assert stdout == b"/tmp/job a\n"
+    assert stderr == "warn\n"
+
+
+def test_run_process_failure():
+    success, stdout, stderr = create_manager("import sys; sys.exit(3)").run_container()
+    assert not success
+    assert stderr == "exit code 3"
+
+    success, _, stderr = create_manager("import time; time.sleep(5)").run_container(dict(timeout=0.2))
+    assert not success
+    assert "timeout" in stderr
+
+
+def test_run_process_memory_limit():
+    manager = create_manager("x = bytearray(512 * 1024 * 1024)")
+    success, _, stderr = manager.run_container(dict(mem_limit="256m"))
+    assert not success
+    assert "MemoryError" in stderr
+
+
+def test_parse_bytes():
+    assert parse_bytes("512m") == 512 * 1024 * 1024
+    assert parse_bytes(100) == 100
+
+
+def test_worker_manager_chooses_executor(mocker):
+    mocker.patch.object(AWSContainerManager, 'setup')
+    info = WorkerInfo(None, ["run"], executor=EXECUTOR_LOCAL)
+    assert isinstance(WorkerManager.create_container_manager(None, info, "s3://b/k", None),
+                      LocalProcessContainerManager)
+    info = WorkerInfo("image", ["run"])
+    assert isinstance(WorkerManager.create_container_manager(None, info, "s3://b/k", None), AWSContainerManager)
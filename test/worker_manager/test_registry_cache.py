@@ -0,0 +1,77 @@
+import base64
+from datetime import datetime, timedelta, timezone
+from threading import Event, Thread
+
+from docker.errors import ImageNotFound
+from pytest_mock import MockFixture
+
+from spr_adbi.dispatcher.registry_cache import RegistryCache
+
+
+def create_cache(mocker: MockFixture):
+    cache = RegistryCache()
+    cache._docker_client = mocker.MagicMock()
+    return cache
+
+
+def create_ecr_client(mocker: MockFixture, expires_at):
+    ecr_client = mocker.MagicMock()
+    ecr_client.get_authorization_token.return_value = {'authorizationData': [dict(
+        authorizationToken=base64.b64encode(b"AWS:pass").decode(), expiresAt=expires_at)]}
+    return ecr_client
+
+
+def test_login_is_cached_until_expiry(mocker: MockFixture):
+    cache = create_cache(mocker)
+    ecr_client = create_ecr_client(mocker, datetime.now(tz=timezone.utc) + timedelta(hours=12))
+    cache.login_ecr(ecr_client, "123", "ap-northeast-1")
+    cache.login_ecr(ecr_client, "123", "ap-northeast-1")
+    assert ecr_client.get_authorization_token.call_count == 1
+    cache._docker_client.login.assert_called_once_with(
+        username="AWS", password="pass", registry="https://123.dkr.ecr.ap-northeast-1.amazonaws.com/", reauth=True)
+
+    ecr_client = create_ecr_client(mocker, datetime.now(tz=timezone.utc) + timedelta(minutes=1))
+    cache.login_ecr(ecr_client, "456", "ap-northeast-1")
+    cache.login_ecr(ecr_client, "456", "ap-northeast-1")
+    assert ecr_client.get_authorization_token.call_count == 2
+
+
+def test_ensure_image_skips_pull_if_digest_matches(mocker: MockFixture):
+    cache = create_cache(mocker)
+    images = cache._docker_client.images
+    images.get.return_value.attrs = {'RepoDigests': ["repo/image@sha256:aaa"]}
+    images.get_registry_data.return_value.id = "sha256:aaa"
+    cache.ensure_image("repo/image:latest")
+    cache.ensure_image("repo/image:latest")
+    images.pull.assert_not_called()
+    assert images.get_registry_data.call_count == 1
+
+    images.get_registry_data.return_value.id = "sha256:bbb"
+    cache.ensure_image("repo/image:v2")
+    images.pull.assert_called_once_with("repo/image:v2")
+
+    images.get.side_effect = ImageNotFound("not found")
+    cache.ensure_image("repo/other:latest")
+    images.pull.assert_called_with("repo/other:latest")
+
+
+def test_concurrent_pulls_are_collapsed(mocker: MockFixture):
+    cache = create_cache(mocker)
+    images = cache._docker_client.images
+    images.get.side_effect = ImageNotFound("not found")
+    started, release = Event(), Event()
+
+    def pull(image_id):
+        started.set()
+        release.wait(5)
+
+    images.pull.side_effect = pull
+    threads = [Thread(target=cache.ensure_image, args=("repo/image:latest",)) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert images.pull.call_count == 1
@@ -0,0 +1,66 @@
+import shutil
+import sys
+from pathlib import Path
+
+from spr_adbi.dispatcher.resolver import WorkerInfo, EXECUTOR_SERVING
+from spr_adbi.dispatcher.serving_process import ServingProcessContainerManager, ServingProcessPool
+from spr_adbi.dispatcher.worker_manager import WorkerManager
+
+TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
+
+SERVER_CODE = """
+import os
+from spr_adbi.worker.worker_server import serve_worker
+pid = os.getpid()
+
+def handle(worker):
+    print("job", worker.args(), end="")
+    if worker.args() == ["crash"]:
+        os._exit(3)
+    worker.success({"pid": str(pid)})
+
+serve_worker(handle)
+"""
+
+
+def create_pool(max_jobs_per_container=0):
+    worker_info = WorkerInfo(None, [sys.executable, "-c", SERVER_CODE], executor=EXECUTOR_SERVING,
+                             max_jobs_per_container=max_jobs_per_container)
+    return ServingProcessPool(worker_info, {})
+
+
+class TestServingProcess:
+    def setup_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def teardown_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def read_pid(self, name):
+        return (Path(TMP_DIR) / name / "output/pid").read_text()
+
+    def test_process_is_reused(self):
+        pool = create_pool()
+        success, stdout, _ = pool.run([f"{TMP_DIR}/a", "x"], {})
+        assert success and stdout == b"job ['x']"
+        assert pool.run([f"{TMP_DIR}/b"], {})[0]
+        assert self.read_pid("a") == self.read_pid("b")
+
+        success, stdout, stderr = pool.run([f"{TMP_DIR}/c", "crash"], {})
+        assert not success and stdout == b"job ['crash']" and stderr == "exit code 3"
+        assert pool.run([f"{TMP_DIR}/d"], {})[0]
+        assert self.read_pid("d") != self.read_pid("a")
+        pool.close()
+
+    def test_process_is_recycled_after_max_jobs(self):
+        pool = create_pool(max_jobs_per_container=1)
+        assert pool.run([f"{TMP_DIR}/a"], {})[0]
+        assert pool.run([f"{TMP_DIR}/b"], {})[0]
+        assert self.read_pid("a") != self.read_pid("b")
+        pool.close()
+
+
+def test_worker_manager_chooses_serving():
+    info = WorkerInfo(None, ["serve"], executor=EXECUTOR_SERVING)
+    assert isinstance(WorkerManager.create_container_manager(None, info, "s3://b/k", None),
+                      ServingProcessContainerManager)
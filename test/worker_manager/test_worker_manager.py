@@ -0,0 +1,94 @@
+import json
+import shutil
+from pathlib import Path
+
+from pytest_mock import MockFixture
+
+from spr_adbi.client.adbi_client import ADBIJob
+from spr_adbi.common.adbi_io import ADBILocalIO
+from spr_adbi.const import MESSAGE_OPTION_STATE_MANIFEST, STATUS_SUCCESS, PATH_STATE, ENV_KEY_STATE_MANIFEST, \
+    ENV_KEY_CACHE_DIR
+from spr_adbi.dispatcher.resolver import WorkerInfo
+from spr_adbi.dispatcher.worker_manager import WorkerManager
+
+TMP_DIR = str((Path(__file__).parent.parent.parent / "tmp/test").absolute())
+WORKING_DIR = TMP_DIR + "/working"
+WP = Path(WORKING_DIR)
+
+
+class LocalWorkerManager(WorkerManager):
+    def create_io_client(self, base_uri, region_name):
+        return ADBILocalIO(base_uri)
+
+    def create_container_manager(self, worker_info, base_uri, region_name):
+        return None
+
+
+class TestWorkerManager:
+    def setup_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def teardown_method(self, method):
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+    def create_manager(self, mocker: MockFixture, options=None, runtime_config=None):
+        manager = LocalWorkerManager(WorkerInfo("image", ["run"], runtime_config), WORKING_DIR)
+        manager.set_job_options(options)
+        manager.container_manager = mocker.MagicMock()
+        return manager
+
+    def test_start_worker_legacy(self, mocker: MockFixture):
+        manager = self.create_manager(mocker)
+        manager.container_manager.run_container.side_effect = \
+            lambda config: (manager.io_client.write("status", STATUS_SUCCESS), (True, b"out", None))[1]
+
+        assert manager.start_worker(1)
+        assert read_wp("run-1/stdout") == b"out"
+        assert read_wp("run-1/status") == b"SUCCESS"
+        assert (WP / "run-1/start_time").exists()
+        assert not (WP / PATH_STATE).exists()
+
+    def test_start_worker_state_manifest(self, mocker: MockFixture):
+        manager = self.create_manager(mocker, {MESSAGE_OPTION_STATE_MANIFEST: True}, dict(environment={"A": "a"}))
+        job = ADBIJob(WORKING_DIR, ADBILocalIO(WORKING_DIR), state_manifest=True)
+
+        def run_container(config):
+            assert config['environment'] == {"A": "a", ENV_KEY_STATE_MANIFEST: '1'}
+            assert job.get_status() == "RUNNING"
+            worker_state = json.loads(read_wp(PATH_STATE))
+            worker_state.update(status=STATUS_SUCCESS)
+            manager.io_client.write(PATH_STATE, json.dumps(worker_state))
+            return True, b"out", None
+
+        manager.container_manager.run_container.side_effect = run_container
+
+        assert manager.start_worker(1)
+        assert not (WP / "run-1/start_time").exists()
+        state = json.loads(read_wp(PATH_STATE))
+        assert state['status'] == STATUS_SUCCESS
+        assert state['runs'][0]['retry'] == 1
+        assert state['runs'][0]['status'] == STATUS_SUCCESS
+        assert job.poll() is True
+        assert job.is_success()
+
+    def test_runtime_config_mounts_cache_dir(self, mocker: MockFixture, monkeypatch):
+        monkeypatch.setenv(ENV_KEY_CACHE_DIR, "/var/cache/adbi")
+        manager = self.create_manager(mocker, runtime_config=dict(volumes={"/data": dict(bind="/data", mode="ro")}))
+        config = manager.runtime_config()
+        assert config['environment'] == {ENV_KEY_CACHE_DIR: "/var/cache/adbi"}
+        assert config['volumes']["/var/cache/adbi"] == dict(bind="/var/cache/adbi", mode="rw")
+        assert "/data" in config['volumes']
+
+    def test_cleanup_workspace(self, mocker: MockFixture):
+        manager = self.create_manager(mocker)
+        for path in ["progress", "output/a", "output/sub/b", "input/args", "outputs"]:
+            manager.io_client.write(path, b"x")
+        spy = mocker.spy(manager.io_client, "_delete_many")
+        manager.cleanup_workspace()
+        assert sorted(manager.io_client.get_filenames()) == ["input/args", "outputs"]
+        assert spy.call_count == 1
+
+
+def read_wp(path):
+    with open(WP / path, "rb") as f:
+        return f.read()